@@ -1,26 +1,238 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, ValidationError
 from dotenv import load_dotenv
 load_dotenv()
+import asyncio
 import numpy as np
-import cv2
 import base64
+import binascii
 from typing import Optional
 import io
-from PIL import Image
+import json
 import os
+import secrets
+import time
 import anthropic
-from src.prompts import get_navigation_prompt, get_ultrasound_diagnostic_prompt
+from src.prompts import get_identification_prompt, get_multi_identification_prompt, get_navigation_prompt, get_ultrasound_diagnostic_prompt
+from src.singleflight import SingleFlight, content_key
+from src.admission import AdmissionController, TokenBucket
+from src import imaging, inference, jobs, keyframes, metrics, quality, roi, tracing
+from src.frame_gate import FRAME_GATE, FrameChangeGate, FrameSignature
+from src.guidance import GuideSessions, ProbeGuide
+from src.organ_profiles import ORGAN_PROFILES, canonical_name
+from src.presence import PresenceCache
+from contextlib import contextmanager
 
 
 
 
+# The API's service name on its trace spans. Tracing is configured when the
+# API starts serving, not on import, so a client running the endpoint logic
+# in its own process (src/backends.py) keeps its own name and exporters
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "space-triage-api")
+
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 anthropic_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
 
+# Per-endpoint model tier and generation budget. /identify sits on the
+# interactive path and only needs a tool call back, so it gets the small,
+# fast tier; the transcript endpoints get enough room for their prompts'
+# sections without paying for a blanket 4096-token ceiling.
+MODEL_CONFIG = {
+    "identify": {
+        "model": os.getenv("IDENTIFY_MODEL", "claude-3-haiku-20240307"),
+        "max_tokens": int(os.getenv("IDENTIFY_MAX_TOKENS", "256")),
+    },
+    # Every profiled organ in one call: the same tier, room for an answer per organ
+    "identify_all": {
+        "model": os.getenv("IDENTIFY_MODEL", "claude-3-haiku-20240307"),
+        "max_tokens": int(os.getenv("IDENTIFY_ALL_MAX_TOKENS", "1024")),
+    },
+    "navigate": {
+        "model": os.getenv("NAVIGATE_MODEL", "claude-3-sonnet-20240229"),
+        "max_tokens": int(os.getenv("NAVIGATE_MAX_TOKENS", "1200")),
+    },
+    "describe": {
+        "model": os.getenv("DESCRIBE_MODEL", "claude-3-sonnet-20240229"),
+        "max_tokens": int(os.getenv("DESCRIBE_MAX_TOKENS", "1000")),
+    },
+}
+
+# Structured response for /identify. Forcing this tool means the model can
+# only answer with a schema-valid object instead of free text we'd have to
+# substring-match.
+IDENTIFY_TOOL = {
+    "name": "report_identification",
+    "description": "Report whether the requested organ is visible in the ultrasound image.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "found": {
+                "type": "boolean",
+                "description": "True if the organ is clearly visible in the image."
+            },
+            "confidence": {
+                "type": "number",
+                "minimum": 0,
+                "maximum": 1,
+                "description": "Confidence in the answer, from 0 to 1."
+            },
+            "bounding_hint": {
+                "type": "array",
+                "items": {"type": "number", "minimum": 0, "maximum": 1},
+                "minItems": 4,
+                "maxItems": 4,
+                "description": "Approximate organ location as normalized [x_min, y_min, x_max, y_max]. Omit if not found."
+            }
+        },
+        "required": ["found", "confidence"]
+    }
+}
+
+# The same answer for every profiled organ at once, so the result for a frame
+# can be cached and any organ asked about next answered from it
+IDENTIFY_ALL_TOOL = {
+    "name": "report_identifications",
+    "description": "Report, for each listed organ, whether it is visible in the ultrasound image.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            organ: {**IDENTIFY_TOOL["input_schema"], "description": f"Identification of the {organ}."}
+            for organ in ORGAN_PROFILES
+        },
+        "required": list(ORGAN_PROFILES)
+    }
+}
+
+# Identify profiled organs with one call covering all of them, cached per
+# frame; other entities still get a call of their own
+IDENTIFY_ALL_ORGANS = os.getenv("IDENTIFY_ALL_ORGANS", "1") == "1"
+
+# Uploads already in a format the model accepts are forwarded as-is,
+# skipping decode + re-encode, unless they're larger than this
+FORWARD_MAX_BYTES = int(os.getenv("FORWARD_MAX_BYTES", str(1024 * 1024)))
+
+# Re-rank keyframe candidates by SAM2 mask coverage (loads the segmentation model)
+KEYFRAME_MASK_SCORING = os.getenv("KEYFRAME_MASK_SCORING", "0") == "1"
+
+# Track the organ's mask from frame to frame of a scan session for /guide and
+# the WebSocket session, instead of segmenting every frame from scratch. Keeps
+# the mask on one structure across frames, but costs more per frame than
+# prompted segmentation (memory attention on top of the image encoder)
+GUIDE_TRACKING = os.getenv("GUIDE_TRACKING", "0") == "1"
+
 app = FastAPI(title="Image and Text Processing API")
 
+# Coalesces concurrent identical requests (same endpoint, organ and image bytes)
+inflight = SingleFlight()
+
+# Bounded, prioritised admission in front of the model calls, paced to the
+# provider's requests-per-minute limit (0 turns pacing off). Requests beyond
+# the queue get a 429.
+ANTHROPIC_REQUESTS_PER_MINUTE = int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "50"))
+admission = AdmissionController(
+    max_concurrency=int(os.getenv("MAX_CONCURRENT_MODEL_CALLS", "4")),
+    max_queue=int(os.getenv("MAX_QUEUED_REQUESTS", "16")),
+    reserved_interactive=int(os.getenv("INTERACTIVE_RESERVED_SLOTS", "1")),
+    rate_limiter=TokenBucket(ANTHROPIC_REQUESTS_PER_MINUTE) if ANTHROPIC_REQUESTS_PER_MINUTE > 0 else None
+)
+
+# Reuses the last result for a scan session while the probe is held still,
+# so near-identical consecutive frames don't each cost a model call
+frame_gate = FrameChangeGate() if FRAME_GATE else None
+
+# Clients identify a continuous scan with this header. Requests without it
+# belong to no session: nothing is reused or smoothed across them, since
+# the client address alone can't tell apart users behind one proxy or NAT
+SCAN_SESSION_HEADER = "x-scan-session"
+
+# Smoothed probe-guidance state per scan session and organ, for /guide (a
+# new target organ starts unsmoothed rather than blending in the last one's)
+guides = GuideSessions()
+
+# Per-frame identification of every profiled organ, so switching the target
+# organ on a frame already analysed is a lookup
+presence_maps = PresenceCache()
+
+# Clients name the ultrasound machine/preset with this header; within a scan
+# session that names one, the fan's crop geometry is detected once and reused
+PRESET_HEADER = "x-ultrasound-preset"
+fan_regions = roi.FanRegions() if roi.ROI_CROP else None
+
+# Diagnoses submitted as background jobs; results are kept in JOBS_DB for
+# every worker to serve, keyed by content so resubmitting is free
+job_runner = jobs.JobRunner(jobs.JobStore())
+
+# Longest a GET /jobs/{id} holds the connection waiting for the job to finish
+JOB_WAIT_MAX = 30.0
+
+# Without serve.py, a single API process starts its own inference pool if configured
+inference_pool = None
+
+@app.on_event("startup")
+def configure_tracing():
+    tracing.configure(service_name=TRACE_SERVICE_NAME)
+
+@app.on_event("startup")
+def start_inference_pool():
+    global inference_pool
+    if inference.INFERENCE_PROCESSES > 0 and not os.getenv("INFERENCE_POOL_EXTERNAL"):
+        inference_pool = inference.InferencePool().start()
+
+@app.on_event("shutdown")
+def stop_inference_pool():
+    if inference_pool is not None:
+        inference_pool.stop()
+    # Unlinks this worker's shared frame buffers
+    inference.close()
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await job_runner.stop()
+
+# Endpoints whose requests, latencies and pipeline stages are exported on /metrics
+INSTRUMENTED_ENDPOINTS = {"/identify", "/identify_base64", "/identify_clip", "/navigate", "/describe", "/guide", "/jobs/describe"}
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    if request.url.path not in INSTRUMENTED_ENDPOINTS:
+        return await call_next(request)
+
+    endpoint = request.url.path.lstrip("/")
+    metrics.current_endpoint.set(endpoint)
+    roi.current_preset.set(request.headers.get(PRESET_HEADER, ""))
+    roi.current_session.set(request.headers.get(SCAN_SESSION_HEADER, ""))
+    metrics.IN_FLIGHT.inc(endpoint=endpoint)
+    if request.headers.get("content-length"):
+        metrics.observe_image_bytes("upload", int(request.headers["content-length"]))
+    started = time.perf_counter()
+    status = 500
+    # Continue the caller's trace if it sent a traceparent header
+    parent = tracing.parse_traceparent(request.headers.get(tracing.TRACEPARENT_HEADER))
+    try:
+        with tracing.start_span(f"{request.method} {request.url.path}", parent=parent) as span:
+            response = await call_next(request)
+            status = response.status_code
+            span.set_attribute("http.status_code", status)
+            return response
+    finally:
+        metrics.IN_FLIGHT.dec(endpoint=endpoint)
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+        metrics.REQUESTS.inc(endpoint=endpoint, status=str(status))
+        if status >= 500:
+            metrics.ERRORS.inc(endpoint=endpoint)
+
+# Times a pipeline stage on /metrics and records it as a trace span
+@contextmanager
+def pipeline_stage(name, **attributes):
+    with metrics.stage(name), tracing.start_span(name, **attributes) as span:
+        yield span
+
 # Pydantic models for request validation
 class NavigateRequest(BaseModel):
     text: str
@@ -29,321 +241,987 @@ class IdentifyImageRequest(BaseModel):
     entity_name: str
     image: Optional[str] = None  # Base64 encoded image
 
-# Helper function to decode base64 images
-def decode_image(base64_string):
+# Helper function to locate the base64 data in a data URL or bare base64 body
+def base64_payload(data):
+    """
+    Returns the base64 part of `data` (str or bytes), skipping any data URL
+    prefix. Bytes are sliced through a memoryview so the payload isn't copied.
+    """
+    marker = "base64," if isinstance(data, str) else b"base64,"
+    # The prefix is short, so only look for it at the start of the payload
+    index = data.find(marker, 0, 256)
+    start = index + len(marker) if index >= 0 else 0
+    if isinstance(data, str):
+        return data[start:] if start else data
+    return memoryview(data)[start:]
+
+# Helper function to turn a base64 upload (or data URL) back into its encoded image bytes
+def base64_content(base64_data):
     try:
-        # Remove potential data URL prefix
-        if 'base64,' in base64_string:
-            base64_string = base64_string.split('base64,')[1]
-            
-        # Decode base64 string to bytes
-        img_data = base64.b64decode(base64_string)
-        
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(img_data, np.uint8)
-        
-        # Decode image
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        return img
-    except Exception as e:
+        with pipeline_stage("decode"):
+            # a2b_base64 reads the payload's memoryview in place
+            return binascii.a2b_base64(base64_payload(base64_data))
+    except (binascii.Error, ValueError) as e:
         raise HTTPException(status_code=400, detail=f"Invalid image format: {str(e)}")
 
+# Helper function to send an upload to the model in its original encoding
+def forwardable_image(data):
+    """
+    Returns (media_type, base64) for encoded image bytes the model can take
+    as-is, or None if the upload has to be decoded and re-encoded.
+    """
+    if len(data) > FORWARD_MAX_BYTES:
+        return None
+    media_type = imaging.sniff_media_type(data)
+    if media_type is None:
+        return None
+
+    with pipeline_stage("encode", forwarded=True):
+        metrics.observe_image_bytes("model", len(data))
+        return media_type, base64.b64encode(data).decode("ascii")
+
+# Helper function to encode an image for the model
+def encode_image_base64(image):
+    """
+    Encode an OpenCV (grayscale or BGR) or PIL image as a base64 JPEG string.
+    Grayscale arrays are sent as single-channel JPEGs.
+    """
+    with pipeline_stage("encode") as span:
+        if isinstance(image, np.ndarray):
+            jpeg = imaging.encode_jpeg(image)
+        else:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG")
+            jpeg = buffer.getvalue()
+
+        metrics.observe_image_bytes("model", len(jpeg))
+        span.set_attribute("image.bytes", len(jpeg))
+        span.set_attribute("image.channels", 1 if isinstance(image, np.ndarray) and image.ndim == 2 else 3)
+        return base64.b64encode(jpeg).decode("utf-8")
+
+# Helper function to get (media_type, base64 data) for the model
+def model_image(image):
+    """
+    Accepts an OpenCV/PIL image, which is encoded as JPEG, or an already
+    encoded (media_type, base64) pair, which is passed through unchanged.
+    """
+    if isinstance(image, tuple):
+        return image
+    return "image/jpeg", encode_image_base64(image)
+
+# Helper function to build the single-turn image + prompt message list
+def vision_messages(prompt, media_type, base64_image):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": media_type,
+                        "data": base64_image
+                    }
+                },
+                {
+                    "type": "text",
+                    "text": prompt
+                }
+            ]
+        }
+    ]
+
+# Helper function to call the vision model for a given endpoint
+def call_vision_model(endpoint, prompt, image, **extra):
+    """
+    Send a single prompt + image to Claude using the endpoint's model tier.
+    """
+    media_type, base64_image = model_image(image)
+    config = MODEL_CONFIG[endpoint]
+    with pipeline_stage("model_call"), tracing.start_span("anthropic.messages.create", model=config["model"], max_tokens=config["max_tokens"]) as span:
+        response = anthropic_client.messages.create(
+            model=config["model"],
+            max_tokens=config["max_tokens"],
+            messages=vision_messages(prompt, media_type, base64_image),
+            **extra
+        )
+        if getattr(response, "usage", None) is not None:
+            span.set_attribute("usage.input_tokens", response.usage.input_tokens)
+            span.set_attribute("usage.output_tokens", response.usage.output_tokens)
+    metrics.observe_usage(config["model"], getattr(response, "usage", None))
+    return response
+
+# Helper function to stream a vision model answer as text deltas
+def stream_vision_model(endpoint, prompt, image):
+    """
+    Same as call_vision_model, but yields the text as it's generated.
+    """
+    media_type, base64_image = model_image(image)
+    config = MODEL_CONFIG[endpoint]
+    usage = None
+    with pipeline_stage("model_call"), tracing.start_span("anthropic.messages.stream", model=config["model"], max_tokens=config["max_tokens"]) as span:
+        with anthropic_client.messages.stream(
+            model=config["model"],
+            max_tokens=config["max_tokens"],
+            messages=vision_messages(prompt, media_type, base64_image)
+        ) as stream:
+            yield from stream.text_stream
+            usage = stream.get_final_message().usage
+        span.set_attribute("usage.input_tokens", usage.input_tokens)
+        span.set_attribute("usage.output_tokens", usage.output_tokens)
+    metrics.observe_usage(config["model"], usage)
+
+# Helper function to pull the text out of a model response
+def response_text(response):
+    return "".join(block.text for block in response.content if block.type == "text")
+
 # Helper function for image identification logic
 def identify_entity_in_image(image, entity_name):
     """
     Identify if the specified entity is present in the image using Claude's API.
-    """
-    # Convert OpenCV image to base64 for API request
-    if isinstance(image, np.ndarray):
-        # Convert from BGR to RGB (OpenCV uses BGR by default)
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image_pil = Image.fromarray(image_rgb)
-    else:
-        image_pil = image
-    
-    # Convert image to base64
-    buffer = io.BytesIO()
-    image_pil.save(buffer, format="JPEG")
-    base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-    
-    # Using GPT-4 Vision API for identification
-    payload = {
-        "model": "claude-3-sonnet-20240229",  # or the latest vision model
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"Is there a {entity_name} in this image? Please respond with only 'true' or 'false'."
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    }
-                ]
-            }
-        ],
-        "max_tokens": 10  # Keep response concise
-    }
 
+    Returns a dict with found, confidence and bounding_hint. If the call fails
+    the result carries an "error" key so callers can tell a failure from a
+    confident negative.
+    """
     try:
-        response = anthropic_client.messages.create(**payload)
-        response_text = response.choices[0].message.content
-        
-        # Determine if the entity was found based on the response
-        if "true" in response_text.lower():
-            return True
-        elif "false" in response_text.lower():
-            return False
-        else:
-            # If response is unclear, default to False
-            return False
-            
+        response = call_vision_model(
+            "identify",
+            get_identification_prompt(entity_name),
+            image,
+            tools=[IDENTIFY_TOOL],
+            tool_choice={"type": "tool", "name": IDENTIFY_TOOL["name"]}
+        )
+        for block in response.content:
+            if block.type == "tool_use" and block.name == IDENTIFY_TOOL["name"]:
+                return {
+                    "found": bool(block.input.get("found", False)),
+                    "confidence": float(block.input.get("confidence", 0.0)),
+                    "bounding_hint": block.input.get("bounding_hint"),
+                }
+        raise ValueError("Model response did not contain an identification result")
+
     except Exception as e:
         # Log the error (in a production environment)
         print(f"Error in Claude API call: {str(e)}")
-        # Default to False on error
-        return False
+        return {"found": False, "confidence": 0.0, "bounding_hint": None, "error": str(e)}
 
-# Helper function for image description
-def generate_description(image):
+# Helper function identifying every profiled organ in one call
+def identify_organs_in_image(image):
     """
-    Generate a detailed description of the image content using Claude's API.
+    Returns {organ: {found, confidence, bounding_hint}} for every profiled
+    organ, or {"error": ...} if the call fails.
     """
-    # Convert OpenCV image to base64 for API request
-    if isinstance(image, np.ndarray):
-        # Convert from BGR to RGB (OpenCV uses BGR by default)
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image_pil = Image.fromarray(image_rgb)
-    else:
-        image_pil = image
-    
-    # Convert image to base64
-    buffer = io.BytesIO()
-    image_pil.save(buffer, format="JPEG")
-    base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-    
-    # Using GPT-4 Vision API for image description
-    payload = {
-        "model": "claude-3-sonnet-20240229",  # or the latest vision model
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": get_ultrasound_diagnostic_prompt()
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        }
-                    }
-                ]
-            }
-        ],
-        "max_tokens": 4096  # Adjust based on desired description length
-    }
-    
     try:
-        response = anthropic_client.completions.create(**payload)
-        description = response.choices[0].message.content
-        return description
-            
+        response = call_vision_model(
+            "identify_all",
+            get_multi_identification_prompt(list(ORGAN_PROFILES)),
+            image,
+            tools=[IDENTIFY_ALL_TOOL],
+            tool_choice={"type": "tool", "name": IDENTIFY_ALL_TOOL["name"]}
+        )
+        for block in response.content:
+            if block.type == "tool_use" and block.name == IDENTIFY_ALL_TOOL["name"]:
+                organs = {}
+                for organ in ORGAN_PROFILES:
+                    answer = block.input.get(organ) or {}
+                    organs[organ] = {
+                        "found": bool(answer.get("found", False)),
+                        "confidence": float(answer.get("confidence", 0.0)),
+                        "bounding_hint": answer.get("bounding_hint"),
+                    }
+                return organs
+        raise ValueError("Model response did not contain an identification result")
+
     except Exception as e:
-        # Log the error (in a production environment)
         print(f"Error in Claude API call: {str(e)}")
-        
-        # Fallback to basic description on error
-        width, height = image_pil.size
-        return f"Error generating AI description. Basic info: {width}x{height} image."
+        return {"error": str(e)}
+
+# Helper function for image description
+def generate_description(image, target_organ):
+    """
+    Generate a diagnostic description of the image content using Claude's API.
+    """
+    response = call_vision_model("describe", get_ultrasound_diagnostic_prompt(target_organ), image)
+    return response_text(response)
+
+# Helper function for navigation guidance
+def generate_navigation(image, entity_name):
+    """
+    Generate a voice transcript guiding the probe towards the entity using Claude's API.
+    """
+    response = call_vision_model("navigate", get_navigation_prompt(entity_name), image)
+    return response_text(response)
+
+# Helper function to run a SAM2 operation, in the inference processes if configured
+def segment_frame(op, image, *args):
+    try:
+        with pipeline_stage("segment"):
+            return inference.call(op, image, *args)
+    except inference.InferenceBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Segmentation is at capacity, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+# Helper function returning every profiled organ's identification for a frame, calling the model at most once
+async def frame_presence(content):
+    key = content_key("presence", content)
+    presence = presence_maps.get(key)
+    if presence is None:
+        presence = await inflight.do(key, admission.run, "identify", run_identify_all, content)
+        # Failures aren't remembered, so the next request retries
+        if "error" not in presence:
+            presence_maps.store(key, presence)
+    return presence
+
+# Helper function to identify an organ in an upload with the vision model
+async def identify_upload(content, entity_name):
+    organ = canonical_name(entity_name)
+    if IDENTIFY_ALL_ORGANS and organ is not None:
+        presence = await frame_presence(content)
+        if "error" in presence:
+            return {"found": False, "confidence": 0.0, "bounding_hint": None, "error": presence["error"]}
+        return dict(presence[organ])
+    key = content_key("identify", entity_name, content)
+    return await inflight.do(key, admission.run, "identify", run_identify, content, entity_name)
+
+# Helper function to decode uploaded image bytes
+def decode_upload(content):
+    with pipeline_stage("decode"):
+        img = imaging.decode_frame(content)
+
+    if img is None:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+
+    return img
+
+# Helper function to decode an upload and crop it to the imaging fan
+def cropped_upload(content):
+    """
+    Returns (image, crop): the decoded frame, cropped to the fan of its
+    preset if that's worth it, and (box, full frame shape) of the crop, or
+    None if the frame is whole.
+    """
+    return crop_frame(decode_upload(content))
+
+# Helper function to crop a decoded frame to the imaging fan
+def crop_frame(image):
+    """(image, crop) for a decoded frame, as returned by cropped_upload."""
+    if fan_regions is None:
+        return image, None
+    with pipeline_stage("roi"):
+        box = fan_regions.box_for(roi.region_key(), image)
+    if box is None:
+        return image, None
+    return roi.crop(image, box), (box, image.shape)
+
+# Helper function to get an upload ready for the vision model
+def model_frame(content):
+    """
+    Returns (image, crop) like cropped_upload, except that frames that stay
+    whole are forwarded as-is when the model accepts their format.
+    """
+    if fan_regions is None or not fan_regions.wants_pixels(roi.region_key()):
+        return forwardable_image(content) or decode_upload(content), None
+    image, crop = cropped_upload(content)
+    if crop is None:
+        return forwardable_image(content) or image, None
+    return image, crop
+
+# Helper function to build a JSON response, timing the serialization stage
+def json_response(payload):
+    with pipeline_stage("serialize"):
+        return JSONResponse(content=payload)
+
+# Helper function to name the scan session a request belongs to
+def scan_session(request):
+    return request.headers.get(SCAN_SESSION_HEADER, "")
+
+# Helper function to compute the change-detection signature of an upload
+def frame_signature(content):
+    with pipeline_stage("frame_gate"):
+        thumbnail = imaging.decode_thumbnail(content)
+    return FrameSignature(thumbnail) if thumbnail is not None else None
+
+# Helper function to score an upload's image quality
+def frame_quality(content, organ):
+    with pipeline_stage("quality"):
+        return quality.assess_encoded(content, organ)
+
+# Helper function returning the quality report of an unusable upload, or None to go ahead
+async def quality_gate(endpoint, content, organ):
+    """
+    Blurred, saturated, too dark or contact-lost frames are answered with
+    the adjustments to make instead of being analysed (see src/quality.py).
+    """
+    if not quality.QUALITY_CHECK:
+        return None
+    report = await asyncio.to_thread(frame_quality, content, organ)
+    return rejected(endpoint, report)
+
+# Helper function doing the same for an already decoded frame (a clip's keyframe)
+async def keyframe_quality_gate(endpoint, frame, organ):
+    if not quality.QUALITY_CHECK:
+        return None
+    with pipeline_stage("quality"):
+        report = await asyncio.to_thread(quality.assess_frame, frame, organ)
+    return rejected(endpoint, report)
+
+def rejected(endpoint, report):
+    if report is None or report["usable"]:
+        return None
+    metrics.QUALITY_REJECTED.inc(endpoint=endpoint, adjustment=report["adjustments"][0]["adjustment"])
+    return report
+
+# Helper function to skip re-analysis of a frame that hasn't materially changed
+async def gated_analysis(session, endpoint, target, content, analyse):
+    """
+    Awaits analyse() unless the last frame analysed for this scan session,
+    endpoint and target looks the same as `content`, in which case that
+    frame's result is returned instead. Returns (result, reused). Frames
+    outside a scan session are always analysed.
+    """
+    if frame_gate is None or not session:
+        return await analyse(), False
+
+    signature = await asyncio.to_thread(frame_signature, content)
+    if signature is None:
+        return await analyse(), False
+
+    key = (session, endpoint, target)
+    previous = frame_gate.lookup(key, signature)
+    if previous is not None:
+        metrics.FRAME_GATE.inc(endpoint=endpoint, outcome="reused")
+        return previous, True
+
+    result = await analyse()
+    # Failed identifications aren't remembered, so the next frame retries
+    if not (isinstance(result, dict) and "error" in result):
+        frame_gate.store(key, signature, result)
+    metrics.FRAME_GATE.inc(endpoint=endpoint, outcome="analysed")
+    return result, False
+
+# Per-endpoint pipelines. These run in a worker thread once admitted, behind
+# the single-flight layer, so concurrent identical uploads share one decode +
+# model call and the blocking work stays off the event loop.
+def run_identify(content, entity_name):
+    image, crop = model_frame(content)
+    result = identify_entity_in_image(image, entity_name)
+    if crop is not None:
+        result["bounding_hint"] = roi.to_frame_hint(result.get("bounding_hint"), *crop)
+    return result
+
+def run_identify_all(content):
+    image, crop = model_frame(content)
+    organs = identify_organs_in_image(image)
+    if crop is not None and "error" not in organs:
+        for result in organs.values():
+            result["bounding_hint"] = roi.to_frame_hint(result.get("bounding_hint"), *crop)
+    return organs
+
+def run_identify_frame(frame, entity_name):
+    image, crop = crop_frame(frame)
+    result = identify_entity_in_image(image, entity_name)
+    if crop is not None:
+        result["bounding_hint"] = roi.to_frame_hint(result.get("bounding_hint"), *crop)
+    return result
+
+def run_navigate(content, entity_name):
+    image, _ = model_frame(content)
+    return generate_navigation(image, entity_name)
+
+def run_describe(content, target_organ):
+    image, _ = model_frame(content)
+    return generate_description(image, target_organ)
+
+def stream_navigate(content, entity_name):
+    image, _ = model_frame(content)
+    yield from stream_vision_model("navigate", get_navigation_prompt(entity_name), image)
+
+def stream_describe(content, target_organ):
+    image, _ = model_frame(content)
+    yield from stream_vision_model("describe", get_ultrasound_diagnostic_prompt(target_organ), image)
+
+def run_guide(content, guide, organ, session):
+    # Cues are relative to the fan's centre, which is what the probe moves
+    image, _ = cropped_upload(content)
+    if GUIDE_TRACKING and session:
+        mask = segment_frame("track_mask", image, session, organ)
+    else:
+        mask = segment_frame("target_mask", image, organ)
+    geometry, cues = guide.update(mask)
+    return image, geometry, cues
+
+# Endpoint logic, shared by the HTTP endpoints below and by clients that run
+# the API in their own process (see src/backends.py). Each takes the upload's
+# bytes and the scan session it belongs to and returns the JSON payload.
+async def analyse_identify(content, entity_name, session, presence=False, endpoint="identify"):
+    report = await quality_gate(endpoint, content, entity_name)
+    if report is not None:
+        return {"found": False, "confidence": 0.0, "bounding_hint": None, "entity": entity_name, "reused": False, "usable": False, "quality": report}
+
+    # Perform entity identification, sharing the call with identical in-flight requests
+    result, reused = await gated_analysis(
+        session, endpoint, entity_name, content,
+        lambda: identify_upload(content, entity_name)
+    )
+    payload = {**result, "entity": entity_name, "reused": reused}
+
+    if presence:
+        organs = await frame_presence(content)
+        if "error" not in organs:
+            payload["presence"] = organs
+    return payload
+
+async def analyse_navigate(content, entity_name, session):
+    report = await quality_gate("navigate", content, entity_name)
+    if report is not None:
+        return {"response": quality.summary(report), "reused": False, "usable": False, "quality": report}
+
+    key = content_key("navigate", entity_name, content)
+    navigation, reused = await gated_analysis(
+        session, "navigate", entity_name, content,
+        lambda: inflight.do(key, admission.run, "navigate", run_navigate, content, entity_name)
+    )
+    return {"response": navigation, "reused": reused}
+
+async def analyse_describe(content, target_organ, session):
+    report = await quality_gate("describe", content, target_organ)
+    if report is not None:
+        return {"description": quality.summary(report), "reused": False, "usable": False, "quality": report}
+
+    key = content_key("describe", target_organ, content)
+    description, reused = await gated_analysis(
+        session, "describe", target_organ, content,
+        lambda: inflight.do(key, admission.run, "describe", run_describe, content, target_organ)
+    )
+    return {"description": description, "reused": reused}
+
+async def analyse_guide(content, entity_name, session):
+    report = await quality_gate("guide", content, entity_name)
+    if report is not None:
+        return {"entity": entity_name, "found": False, "cues": [], "usable": False, "quality": report, "source": "quality"}
+
+    # Without a session there's no previous frame to smooth against
+    guide = guides.get((session, entity_name)) if session else ProbeGuide()
+    frame, geometry, cues = await asyncio.to_thread(run_guide, content, guide, entity_name, session)
+    if geometry is not None:
+        return {"entity": entity_name, "found": True, "cues": cues, "geometry": geometry, "source": "segmentation"}
+
+    # Nothing to steer by: fall back to the full navigation transcript
+    transcript = await admission.run("navigate", generate_navigation, frame, entity_name)
+    return {"entity": entity_name, "found": False, "cues": [], "transcript": transcript, "source": "model"}
+
+async def analyse_clip(selector, entity_name, top_k=1):
+    """
+    Identifies the entity in the best keyframes of a clip already fed to the
+    selector. Keyframes go through the same quality check and fan crop as
+    single frames; unusable ones are skipped, and if none is usable the
+    first one's quality report is returned instead of a model answer.
+    """
+    if not entity_name:
+        raise HTTPException(status_code=400, detail="entity_name is required")
+
+    if selector.count == 0:
+        raise HTTPException(status_code=400, detail="No decodable frames in clip")
+
+    best = await asyncio.to_thread(selector.best, max(top_k, 1), keyframe_mask_scorer())
+
+    result, report, chosen = None, None, best[0]
+    for keyframe in best:
+        keyframe_report = await keyframe_quality_gate("identify_clip", keyframe["frame"], entity_name)
+        if keyframe_report is not None:
+            report = report or keyframe_report
+            continue
+        chosen = keyframe
+        result = await admission.run("identify", run_identify_frame, keyframe["frame"], entity_name)
+        if result["found"]:
+            break
+
+    keyframe = chosen
+    if result is None:
+        result = {"found": False, "confidence": 0.0, "bounding_hint": None, "usable": False, "quality": report}
+
+    return {
+        **result,
+        "entity": entity_name,
+        "keyframe": {"index": keyframe["index"], "scores": keyframe["scores"]},
+        "frames_scored": selector.count,
+        "keyframe_image": base64.b64encode(imaging.encode_jpeg(keyframe["frame"])).decode("utf-8"),
+    }
+
+async def submit_describe(content, target_organ, session, callback_url=None):
+    """Queues analyse_describe as a background job keyed by organ and image; returns the job."""
+    if callback_url and not await asyncio.to_thread(jobs.callback_allowed, callback_url):
+        raise HTTPException(status_code=400, detail="callback_url must be an http(s) URL on an allowed host")
+    # No session for the analysis itself: the result is stored under this
+    # image's key, so it mustn't be one the frame gate reused from another frame
+    return await job_runner.submit(
+        content_key("describe", target_organ, content), "describe", target_organ,
+        lambda: analyse_describe(content, target_organ, ""),
+        callback_url, session
+    )
+
+async def job_status(job_id, wait=0.0):
+    job = await job_runner.wait(job_id, min(max(wait, 0.0), JOB_WAIT_MAX))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
 
 # Endpoint 1: Identify image
 @app.post("/identify", response_class=JSONResponse)
-async def identify_image(entity_name: str = Form(...), image: UploadFile = File(...)):
+async def identify_image(request: Request, entity_name: str = Form(...), image: UploadFile = File(...), presence: bool = Form(False)):
     """
     Identify if a specific entity exists in an image.
-    
+
     Parameters:
     - entity_name (str): The name of the entity to search for
     - image (File): The uploaded image file
-    
+    - presence (bool, optional): also return the identification of every
+      profiled organ in the frame
+    - X-Scan-Session header (optional): groups frames of one continuous scan;
+      without it no earlier frame's result is reused
+
     Returns:
-    - JSON with identification result (True/False)
+    - JSON with identification result (found, confidence, bounding_hint),
+      whether it was reused from an unchanged previous frame, and, if
+      requested, {organ: {found, confidence, bounding_hint}} for every
+      profiled organ. Profiled organs are identified together in one model
+      call cached by frame, so asking about another organ on the same frame
+      doesn't call the model again
+    - For an unusable frame: found false, usable false and the quality
+      report with the adjustments to make
     """
     try:
         # Read image file
         content = await image.read()
-        nparr = np.frombuffer(content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-        
-        # Perform entity identification
-        result = identify_entity_in_image(img, entity_name)
-        
-        return {"found": result, "entity": entity_name}
-    
+
+        return json_response(await analyse_identify(content, entity_name, scan_session(request), presence))
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Endpoint 1 Alternative: Identify image with base64
 @app.post("/identify_base64")
-async def identify_image_base64(request: IdentifyImageRequest):
+async def identify_image_base64(request: Request, entity_name: Optional[str] = None):
     """
-    Identify if a specific entity exists in a base64-encoded image.
-    
-    Parameters:
-    - request (IdentifyImageRequest): Contains entity_name and base64-encoded image
-    
+    Identify if a specific entity exists in a base64-encoded or raw image.
+
+    Parameters (by Content-Type):
+    - application/json: IdentifyImageRequest with entity_name and base64-encoded image
+    - text/plain: the base64 string or data URL as the body, entity_name as a query parameter
+    - image/* or application/octet-stream: the raw image bytes, entity_name as a query parameter
+
+    The text and raw forms are read straight from the request body with no
+    JSON parsing; the raw form skips base64 altogether. Once decoded to its
+    image bytes the frame is handled as by /identify: quality check, fan
+    crop (bounding_hint mapped back to the whole frame) and the per-frame
+    identification cache.
+    - X-Scan-Session header (optional): as for /identify
+
     Returns:
-    - JSON with identification result (True/False)
+    - JSON with identification result (found, confidence, bounding_hint)
+      and whether it was reused from an unchanged previous frame
+    - For an unusable frame: found false, usable false and the quality
+      report with the adjustments to make
     """
     try:
-        if not request.image:
+        body = await request.body()
+        content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+
+        if content_type == "application/json":
+            payload = IdentifyImageRequest.model_validate_json(body)
+            entity_name, image, encoded = payload.entity_name, payload.image, True
+        elif content_type.startswith("image/") or content_type == "application/octet-stream":
+            image, encoded = body, False
+        else:
+            image, encoded = body, True
+
+        if not entity_name:
+            raise HTTPException(status_code=400, detail="entity_name is required")
+
+        if not image:
             raise HTTPException(status_code=400, detail="Image data is required")
-        
-        # Decode base64 image
-        img = decode_image(request.image)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-        
-        # Perform entity identification
-        result = identify_entity_in_image(img, request.entity_name)
-        
-        return {"found": result, "entity": request.entity_name}
-    
+
+        # From here on the frame is its image bytes, so it's checked, cropped
+        # to the fan and identified exactly as a multipart /identify upload
+        content = await asyncio.to_thread(base64_content, image) if encoded else image
+
+        return json_response(await analyse_identify(content, entity_name, scan_session(request), endpoint="identify_base64"))
+
+    except HTTPException:
+        raise
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Endpoint 2: Navigate - FIXED to correctly handle image UploadFile
 @app.post("/navigate", response_class=JSONResponse)
-async def navigate(entity_name: str = Form(...), image: UploadFile = File(...)):
+async def navigate(request: Request, entity_name: str = Form(...), image: UploadFile = File(...)):
     """
     Process image and provide navigation instructions to locate a specific entity.
-    
+
     Parameters:
     - entity_name (str): The name of the entity to navigate to
     - image (File): The uploaded image file
-    
+    - X-Scan-Session header (optional): groups frames of one continuous scan;
+      without it no earlier frame's result is reused
+
     Returns:
-    - JSON with navigation response
+    - JSON with navigation response (the adjustments to make, with usable
+      false and the quality report, for an unusable frame)
     """
     try:
         # Read image file
         content = await image.read()
-        nparr = np.frombuffer(content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-        
-        # Convert OpenCV image to base64 for API request
-        image_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        image_pil = Image.fromarray(image_rgb)
-        
-        buffer = io.BytesIO()
-        image_pil.save(buffer, format="JPEG")
-        base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        
-        # This would typically connect to a navigation service or NLP model
-        payload = {
-            "model": "claude-3-sonnet-20240229",  # or the latest vision model
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": get_navigation_prompt(entity_name)
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 4096  # Adjust based on desired description length
-        }
-        response = anthropic_client.completions.create(**payload)
-        
-        return {"response": response.choices[0].message.content}
-    
+
+        return json_response(await analyse_navigate(content, entity_name, scan_session(request)))
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in navigate endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Endpoint 3: Describe
 @app.post("/describe", response_class=JSONResponse)
-async def describe_image(target_organ: str = Form(...), image: UploadFile = File(...)):
+async def describe_image(request: Request, target_organ: str = Form(...), image: UploadFile = File(...)):
     """
     Generate a description of an uploaded image.
-    
+
     Parameters:
     - image (File): The uploaded image file
-    
+    - X-Scan-Session header (optional): groups frames of one continuous scan;
+      without it no earlier frame's result is reused
+
     Returns:
-    - JSON with image description
+    - JSON with image description (the adjustments to make, with usable
+      false and the quality report, for an unusable frame)
     """
     try:
         # Read image file
         content = await image.read()
-        nparr = np.frombuffer(content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-        
-        # Convert OpenCV image to base64 for API request
-        image_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        image_pil = Image.fromarray(image_rgb)
-        
-        buffer = io.BytesIO()
-        image_pil.save(buffer, format="JPEG")
-        base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        
-        # This would typically connect to a navigation service or NLP model
-        payload = {
-            "model": "claude-3-sonnet-20240229",  # or the latest vision model
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": get_ultrasound_diagnostic_prompt(target_organ)
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 4096  # Adjust based on desired description length
-        }
-        
-        response = anthropic.chat.completions.create(**payload)
-        print(response.choices[0].message.content)
-        
-        return {"description": response.choices[0].message.content}
-    
+
+        return json_response(await analyse_describe(content, target_organ, scan_session(request)))
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in describe endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Endpoint 3 Alternative: Describe as a background job
+@app.post("/jobs/describe", response_class=JSONResponse, status_code=202)
+async def submit_describe_job(request: Request, target_organ: str = Form(...), image: UploadFile = File(...), callback_url: Optional[str] = Form(None)):
+    """
+    Submit a diagnosis to run in the background; answers at once.
+
+    Parameters:
+    - target_organ (str), image (File): as for /describe
+    - callback_url (str, optional): the finished job is POSTed here as JSON;
+      the host must be in JOB_CALLBACK_HOSTS or, with none set, public.
+      Resubmitting a job that's already running attaches the callback only
+      from the scan session that created it
+    - X-Scan-Session header (optional): the scan session the job belongs to.
+      Jobs always analyse their own frame; no earlier frame's result is reused
+
+    Returns:
+    - JSON job {id, kind, target, status, result, error, created, updated}.
+      The id is derived from the organ and image bytes, so submitting the
+      same frame again (a retry, or a client reattaching after a restart)
+      returns the existing job and its result instead of running it again.
+      Poll GET /jobs/{id} for the /describe payload in "result".
+    """
+    try:
+        content = await image.read()
+
+        return JSONResponse(content=await submit_describe(content, target_organ, scan_session(request), callback_url), status_code=202)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in describe job endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}", response_class=JSONResponse)
+async def get_job(job_id: str, wait: float = 0.0):
+    """
+    Status and, once done, result of a background job.
+
+    Parameters:
+    - wait (float, optional): seconds (up to 30) to hold the request open
+      for the job to finish, instead of polling
+
+    Returns:
+    - JSON job; status is queued, running, done (result holds the payload)
+      or failed (error says why; resubmitting runs it again)
+    """
+    return await job_status(job_id, wait)
+
+# Endpoint 3 Alternative: Per-frame probe guidance
+@app.post("/guide", response_class=JSONResponse)
+async def guide(request: Request, entity_name: str = Form(...), image: UploadFile = File(...)):
+    """
+    Short directional cues for the probe, computed from where the organ's
+    segmentation mask (prompted with its priors from src/organ_profiles.py)
+    sits in the frame relative to its centre.
+
+    Cues come from a rules engine (see src/guidance.py), smoothed across the
+    frames of a scan session, so no language model is involved unless
+    nothing is segmented at all; then the navigation transcript is returned
+    instead.
+
+    With GUIDE_TRACKING on, the mask is tracked from the session's previous
+    frames (see src/tracking.py) rather than segmented afresh each time.
+
+    Parameters:
+    - entity_name (str): The name of the entity to guide towards
+    - image (File): The uploaded image file
+    - X-Scan-Session header (optional): groups frames of one continuous scan;
+      without it no earlier frame's result is reused
+
+    Returns:
+    - JSON with found, cues (most urgent first, each with cue and magnitude),
+      the smoothed mask geometry, and a navigation transcript when not found
+    - For an unusable frame: usable false and the quality report
+    """
+    try:
+        content = await image.read()
+
+        return json_response(await analyse_guide(content, entity_name, scan_session(request)))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in guide endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Helper function returning the expensive keyframe scorer, if enabled
+def keyframe_mask_scorer():
+    if not KEYFRAME_MASK_SCORING:
+        return None
+    return lambda frame: segment_frame("mask_coverage", frame)
+
+# Endpoint 4: Identify from a cine clip or MJPEG stream
+@app.post("/identify_clip", response_class=JSONResponse)
+async def identify_clip(request: Request, entity_name: Optional[str] = None, top_k: int = 1):
+    """
+    Pick the best keyframe(s) from a clip and identify the entity in them.
+
+    Frames are scored cheaply (sharpness, probe motion, and optionally SAM2
+    mask coverage for the last few candidates) and only the top_k keyframes
+    are sent to the model, stopping at the first one where it's found.
+
+    Parameters (by Content-Type):
+    - multipart/form-data: entity_name and a clip file (MJPEG, or any video OpenCV can read)
+    - anything else: an MJPEG stream as the request body, entity_name as a query parameter.
+      Frames are scored as they arrive, so the stream is never held in memory.
+
+    Returns:
+    - JSON with the identification result for the chosen keyframe, its index
+      and scores, the number of frames scored and the keyframe as a base64 JPEG
+    - If no keyframe passes the quality check: found false, usable false and
+      the best keyframe's quality report
+    """
+    try:
+        selector = keyframes.KeyframeSelector(candidates=max(keyframes.KEYFRAME_CANDIDATES, top_k))
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+        if content_type == "multipart/form-data":
+            form = await request.form()
+            entity_name = form.get("entity_name", entity_name)
+            clip = form.get("clip")
+            if clip is None:
+                raise HTTPException(status_code=400, detail="Clip file is required")
+            data = await clip.read()
+            with pipeline_stage("decode"):
+                await asyncio.to_thread(keyframes.add_clip, selector, data)
+        else:
+            splitter = keyframes.MJPEGSplitter()
+            with pipeline_stage("decode"):
+                async for chunk in request.stream():
+                    for jpeg in splitter.feed(chunk):
+                        if selector.count >= keyframes.MAX_CLIP_FRAMES:
+                            break
+                        await asyncio.to_thread(selector.add_encoded, jpeg)
+
+        return json_response(await analyse_clip(selector, entity_name, top_k))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in identify_clip endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Helper class holding the state of one WebSocket scan session
+class ScanSession:
+    """
+    Target organ and options, set by the client's "start" message and
+    changeable mid-session. Only the newest frame waits to be analysed:
+    frames that arrive while one is being processed replace each other.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.id = secrets.token_hex(8)
+        self.organ = None
+        self.preset = ""
+        self.guidance = False
+        self.confidence_threshold = 0.6
+        self.frames = asyncio.Queue(maxsize=1)
+        self.frame_count = 0
+        self.guide = ProbeGuide()
+
+    def configure(self, message):
+        organ = message.get("organ", self.organ)
+        if organ != self.organ:
+            # Smoothing state belongs to the organ it was tracking
+            self.guide = ProbeGuide()
+        self.organ = organ
+        self.preset = message.get("preset", self.preset)
+        self.guidance = bool(message.get("guidance", self.guidance))
+        self.confidence_threshold = float(message.get("confidence_threshold", self.confidence_threshold))
+
+    def offer(self, content):
+        if self.frames.full():
+            self.frames.get_nowait()
+        self.frame_count += 1
+        self.frames.put_nowait((self.frame_count, content))
+
+    async def send(self, event_type, **payload):
+        await self.websocket.send_text(json.dumps({"type": event_type, **payload}))
+
+    async def stream_transcript(self, kind, pipeline, content, organ, frame):
+        async for delta in admission.stream(kind, pipeline, content, organ):
+            await self.send("transcript", kind=kind, delta=delta, frame=frame)
+        await self.send("transcript_end", kind=kind, frame=frame)
+
+    async def analyse(self, frame, content):
+        """Identify, then stream the diagnosis if found, or guide the probe if not."""
+        organ = self.organ
+        roi.current_preset.set(self.preset)
+        roi.current_session.set(self.id)
+        report = await quality_gate("ws_session", content, organ)
+        if report is not None:
+            await self.send("quality", **report, frame=frame)
+            return
+
+        signature = await asyncio.to_thread(frame_signature, content) if frame_gate is not None else None
+        gate_key = (self.id, "ws", organ)
+        if signature is not None:
+            previous = frame_gate.lookup(gate_key, signature)
+            if previous is not None:
+                metrics.FRAME_GATE.inc(endpoint="ws_session", outcome="reused")
+                await self.send("identify", **previous, entity=organ, reused=True, frame=frame)
+                return
+
+        result = await identify_upload(content, organ)
+        await self.send("identify", **result, entity=organ, reused=False, frame=frame)
+        if "error" in result:
+            return
+        if signature is not None:
+            frame_gate.store(gate_key, signature, result)
+            metrics.FRAME_GATE.inc(endpoint="ws_session", outcome="analysed")
+
+        if result["found"] and result["confidence"] >= self.confidence_threshold:
+            await self.stream_transcript("describe", stream_describe, content, organ, frame)
+            return
+
+        if self.guidance:
+            _, geometry, cues = await asyncio.to_thread(run_guide, content, self.guide, organ, self.id)
+            if geometry is not None:
+                await self.send("guidance", cues=cues, geometry=geometry, frame=frame)
+                return
+        await self.stream_transcript("navigate", stream_navigate, content, organ, frame)
+
+    async def process_frames(self):
+        while True:
+            frame, content = await self.frames.get()
+            with tracing.start_span("ws.frame", session=self.id, frame=frame, organ=self.organ):
+                try:
+                    await self.analyse(frame, content)
+                except HTTPException as e:
+                    await self.send("error", status=e.status_code, detail=e.detail, frame=frame)
+                except WebSocketDisconnect:
+                    raise
+                except Exception as e:
+                    print(f"Error in scan session {self.id}: {str(e)}")
+                    await self.send("error", status=500, detail=str(e), frame=frame)
+            await self.send("done", frame=frame)
+
+# Endpoint 5: Continuous scan session over a WebSocket
+@app.websocket("/ws/session")
+async def scan_session_websocket(websocket: WebSocket):
+    """
+    A persistent scan session: the target organ is sent once, then frames
+    are pushed as binary messages and results are pushed back as they're
+    ready, with transcripts streamed token by token.
+
+    Client -> server:
+    - text {"type": "start", "organ": str, "guidance": bool, "confidence_threshold": float, "preset": str}
+      (the same message with "type": "configure" changes them mid-session)
+    - binary: one encoded frame (JPEG/PNG) per message
+
+    Server -> client (text JSON, all frame events carry the frame number):
+    - {"type": "ready", "session": id}
+    - {"type": "quality", usable, scores, adjustments} for a frame too poor to analyse
+    - {"type": "identify", found, confidence, bounding_hint, entity, reused}
+    - {"type": "guidance", cues, geometry} when guidance is on and the organ isn't found
+    - {"type": "transcript", "kind": "describe" | "navigate", "delta": str}, then {"type": "transcript_end", "kind"}
+    - {"type": "error", "status", "detail"}
+    - {"type": "done"} once a frame is fully handled
+    """
+    await websocket.accept()
+    session = ScanSession(websocket)
+    metrics.current_endpoint.set("ws_session")
+    metrics.IN_FLIGHT.inc(endpoint="ws_session")
+    processor = None
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            if message.get("bytes") is not None:
+                if session.organ is None:
+                    await session.send("error", status=400, detail="Send a start message with the organ first")
+                    continue
+                session.offer(message["bytes"])
+                continue
+
+            try:
+                control = json.loads(message.get("text") or "{}")
+            except ValueError:
+                await session.send("error", status=400, detail="Control messages must be JSON")
+                continue
+            if control.get("type") in ("start", "configure"):
+                session.configure(control)
+                if processor is None:
+                    processor = asyncio.create_task(session.process_frames())
+                    await session.send("ready", session=session.id)
+            elif control.get("type") == "stop":
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if processor is not None:
+            processor.cancel()
+        metrics.IN_FLIGHT.dec(endpoint="ws_session")
+
+# Metrics endpoint for Prometheus scraping
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Expose request, stage latency, payload size and token usage metrics.
+    """
+    metrics.ADMISSION_RUNNING.set(admission.running)
+    metrics.ADMISSION_QUEUED.set(admission.queued)
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 # Root endpoint for API information
 @app.get("/", response_class=JSONResponse)
@@ -357,10 +1235,17 @@ async def root():
         "endpoints": [
             {"path": "/identify", "method": "POST", "description": "Identify entities in images"},
             {"path": "/identify_base64", "method": "POST", "description": "Identify entities in base64-encoded images"},
+            {"path": "/identify_clip", "method": "POST", "description": "Identify entities in the best keyframe of a cine clip or MJPEG stream"},
             {"path": "/navigate", "method": "POST", "description": "Process navigation for entities in images"},
-            {"path": "/describe", "method": "POST", "description": "Generate descriptions for images"}
+            {"path": "/describe", "method": "POST", "description": "Generate descriptions for images"},
+            {"path": "/guide", "method": "POST", "description": "Per-frame probe guidance cues from the organ's mask position"},
+            {"path": "/jobs/describe", "method": "POST", "description": "Submit a diagnosis as a background job; returns its id at once"},
+            {"path": "/jobs/{job_id}", "method": "GET", "description": "Status and result of a background job"},
+            {"path": "/ws/session", "method": "WEBSOCKET", "description": "Continuous scan session: push frames, receive identify results, guidance and streamed transcripts"},
+            {"path": "/metrics", "method": "GET", "description": "Prometheus metrics"}
         ]
     }
 
+# Single worker for development; use serve.py for multiple workers
 # if __name__ == "__main__":
 #     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
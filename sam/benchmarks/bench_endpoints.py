@@ -0,0 +1,266 @@
+"""
+Load-test and latency benchmark for the API endpoints.
+
+Replays a corpus of ultrasound frames against /identify, /identify_base64,
+/navigate and /describe in-process (httpx ASGI transport, no network) with a
+stub standing in for the Anthropic client, at several concurrency levels.
+Reports throughput, latency percentiles and how long the event loop was
+blocked, as JSON that can be compared between runs.
+
+Run from sam/:
+    python benchmarks/bench_endpoints.py --concurrency 1,8,32 --output benchmarks/results/endpoints.json
+    python benchmarks/bench_endpoints.py --compare benchmarks/results/endpoints.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The stub stands in for the provider, so don't let the real rate limit pace the run
+os.environ.setdefault("CLAUDE_API_KEY", "benchmark")
+os.environ.setdefault("ANTHROPIC_REQUESTS_PER_MINUTE", "1000000")
+# The corpus repeats frames, which the frame-change gate would answer without a model call
+os.environ.setdefault("FRAME_GATE", "0")
+# Per-frame work that would otherwise change between revisions of the series:
+# the quality check can answer frames without a model call and the fan crop
+# re-encodes them, so both are off unless asked for (and recorded in meta)
+os.environ.setdefault("QUALITY_CHECK", "0")
+os.environ.setdefault("ROI_CROP", "0")
+
+# Settings that change what an endpoint does per frame
+FRAME_SETTINGS = ["FRAME_GATE", "QUALITY_CHECK", "ROI_CROP"]
+
+import httpx
+import numpy as np
+
+import app as api
+from benchmarks.corpus import load_corpus
+
+
+ENDPOINTS = ["identify", "identify_base64", "navigate", "describe"]
+ORGANS = ["liver", "kidneys", "pancreas", "bladder", "thyroid", "heart", "lungs"]
+
+# Median model latency (seconds) per endpoint tier; spread is lognormal
+DEFAULT_LATENCY = {"identify": 0.4, "identify_all": 0.8, "navigate": 3.0, "describe": 2.5}
+
+
+class StubAnthropic:
+    """
+    Stands in for anthropic.Anthropic. messages.create blocks for a latency
+    drawn from a lognormal distribution (like the real synchronous client)
+    and returns a response shaped like the Messages API.
+    """
+
+    def __init__(self, median_latency, sigma=0.35, scale=1.0, seed=0):
+        self.median_latency = median_latency
+        self.sigma = sigma
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.messages = SimpleNamespace(create=self.create)
+
+    def create(self, model, max_tokens, messages, tools=None, **kwargs):
+        tier = next(
+            (endpoint for endpoint, config in api.MODEL_CONFIG.items()
+             if config["model"] == model and config["max_tokens"] == max_tokens),
+            "describe"
+        )
+        median = self.median_latency[tier] * self.scale
+        time.sleep(median * self.rng.lognormvariate(0, self.sigma))
+
+        if tools:
+            if tools[0]["name"] == api.IDENTIFY_ALL_TOOL["name"]:
+                answer = {organ: self.identification() for organ in api.ORGAN_PROFILES}
+            else:
+                answer = self.identification()
+            content = [SimpleNamespace(type="tool_use", name=tools[0]["name"], input=answer)]
+            output_tokens = 40 * len(answer) if tools[0]["name"] == api.IDENTIFY_ALL_TOOL["name"] else 40
+        else:
+            content = [SimpleNamespace(type="text", text="Stub transcript. " * 50)]
+            output_tokens = min(max_tokens, 600)
+        return SimpleNamespace(content=content, usage=SimpleNamespace(input_tokens=1600, output_tokens=output_tokens))
+
+    def identification(self):
+        return {
+            "found": self.rng.random() < 0.5,
+            "confidence": round(self.rng.uniform(0.5, 1.0), 2),
+            "bounding_hint": [0.3, 0.3, 0.7, 0.7],
+        }
+
+
+def unique_payload(data):
+    # Trailing bytes after the image end marker are ignored by decoders but
+    # make each upload distinct, so single-flight doesn't coalesce the run
+    return data + os.urandom(8)
+
+
+def build_request(endpoint, frame, organ, unique):
+    name, data, media_type = frame
+    if unique:
+        data = unique_payload(data)
+    if endpoint == "identify_base64":
+        payload = {"entity_name": organ, "image": f"data:{media_type};base64," + base64.b64encode(data).decode("ascii")}
+        return {"json": payload}
+    field = "target_organ" if endpoint == "describe" else "entity_name"
+    return {"files": {"image": (name, data, media_type)}, "data": {field: organ}}
+
+
+async def monitor_event_loop(samples, stop, interval=0.005):
+    """Records how late each short sleep wakes up; lateness is time the loop was blocked."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - started - interval))
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    arr = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "p99": round(float(np.percentile(arr, 99)), 2),
+        "mean": round(float(arr.mean()), 2),
+        "max": round(float(arr.max()), 2),
+    }
+
+
+async def run_level(client, endpoint, concurrency, total, corpus, unique, seed):
+    rng = random.Random(seed)
+    requests = [build_request(endpoint, rng.choice(corpus), rng.choice(ORGANS), unique) for _ in range(total)]
+    latencies, statuses = [], {}
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    async def worker():
+        while not queue.empty():
+            request = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post(f"/{endpoint}", **request)
+            elapsed = time.perf_counter() - started
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append(elapsed)
+
+    lag_samples, stop = [], asyncio.Event()
+    monitor = asyncio.create_task(monitor_event_loop(lag_samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    blocked = [lag for lag in lag_samples if lag > 0.001]
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": statuses.get(200, 0),
+        "rejected": statuses.get(429, 0),
+        "errors": sum(count for status, count in statuses.items() if status not in (200, 429)),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(statuses.get(200, 0) / wall, 2),
+        "latency_ms": percentiles(latencies),
+        "event_loop": {
+            "max_lag_ms": round(max(lag_samples, default=0.0) * 1000, 2),
+            "p99_lag_ms": percentiles(lag_samples).get("p99", 0.0),
+            "blocked_ms": round(sum(blocked) * 1000, 2),
+        },
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+async def run(args):
+    corpus = load_corpus(args.frames, count=args.synthetic_frames)
+    api.anthropic_client = StubAnthropic(DEFAULT_LATENCY, sigma=args.latency_sigma, scale=args.latency_scale, seed=args.seed)
+
+    transport = httpx.ASGITransport(app=api.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                total = max(args.requests, concurrency)
+                result = await run_level(client, endpoint, concurrency, total, corpus, not args.allow_duplicates, args.seed)
+                results.append(result)
+                print(
+                    f"{endpoint:>16} c={concurrency:<3} {result['throughput_rps']:>7.2f} req/s  "
+                    f"p50={result['latency_ms'].get('p50', '-')}ms p99={result['latency_ms'].get('p99', '-')}ms  "
+                    f"loop blocked={result['event_loop']['blocked_ms']}ms  429s={result['rejected']}",
+                    file=sys.stderr
+                )
+
+    return {
+        "meta": {
+            "benchmark": "endpoints",
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": [name for name, _, _ in corpus],
+            "stub_latency_s": {k: v * args.latency_scale for k, v in DEFAULT_LATENCY.items()},
+            "stub_latency_sigma": args.latency_sigma,
+            "unique_payloads": not args.allow_duplicates,
+            "settings": {name: os.environ.get(name) for name in FRAME_SETTINGS},
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """Prints throughput and p95 deltas for every (endpoint, concurrency) in both runs."""
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    for result in current["results"]:
+        before = previous.get((result["endpoint"], result["concurrency"]))
+        if before is None:
+            continue
+        rps_delta = result["throughput_rps"] - before["throughput_rps"]
+        p95_delta = result["latency_ms"].get("p95", 0) - before["latency_ms"].get("p95", 0)
+        print(f"{result['endpoint']:>16} c={result['concurrency']:<3} throughput {rps_delta:+.2f} req/s  p95 {p95_delta:+.2f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", type=lambda s: s.split(","), default=ENDPOINTS)
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--frames", help="Directory of PNG/JPEG frames (default: synthetic frames)")
+    parser.add_argument("--synthetic-frames", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier on the stub's median latencies")
+    parser.add_argument("--latency-sigma", type=float, default=0.35, help="Lognormal spread of the stub latency")
+    parser.add_argument("--allow-duplicates", action="store_true", help="Send byte-identical uploads (exercises single-flight)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,181 @@
+"""
+Microbenchmarks for the per-frame image path.
+
+Times each step of the decode -> colour convert -> PIL -> JPEG -> base64
+chain the endpoints run, plus the client's image_to_bytes (the current
+grey-aware encode next to the old one), across typical
+ultrasound resolutions, grayscale and RGB sources, PNG and JPEG uploads.
+Peak allocation per step is tracked with tracemalloc, which sees numpy and
+OpenCV output arrays and Python bytes objects (PIL's internal buffers are
+not traced). Optional faster encoders (PyTurboJPEG) are included when
+installed, so their gain can be measured on the same frames.
+
+Run from sam/:
+    python benchmarks/bench_image_path.py --output benchmarks/results/image_path.json
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.corpus import RESOLUTIONS, encode, synthetic_frame
+from src import client_frames, imaging
+
+try:
+    from turbojpeg import TJPF_GRAY, TJSAMP_GRAY, TurboJPEG
+    turbo = TurboJPEG()
+except Exception:
+    turbo = None
+
+
+def measure(fn, repeat, number=1):
+    """Returns (median ms, min ms, peak allocated KiB) for fn()."""
+    fn()  # warm up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - started) / number * 1000)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(statistics.median(timings), 3), round(min(timings), 3), round(peak / 1024, 1)
+
+
+def pil_jpeg(image_pil):
+    buffer = io.BytesIO()
+    image_pil.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def steps_for(upload):
+    """
+    Returns (name, fn) for each step, with each step fed the previous
+    step's real output so the inputs match what the endpoint sees.
+    """
+    nparr = np.frombuffer(upload, np.uint8)
+    bgr = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    image_pil = Image.fromarray(rgb)
+    jpeg = pil_jpeg(image_pil)
+
+    steps = [
+        ("decode_color", lambda: cv2.imdecode(nparr, cv2.IMREAD_COLOR)),
+        ("decode_gray", lambda: cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)),
+        ("bgr_to_rgb", lambda: cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)),
+        ("pil_fromarray", lambda: Image.fromarray(rgb)),
+        ("pil_jpeg_rgb", lambda: pil_jpeg(image_pil)),
+        ("cv2_jpeg_rgb", lambda: cv2.imencode(".jpg", bgr)),
+        ("cv2_jpeg_gray", lambda: cv2.imencode(".jpg", gray)),
+        ("base64_encode", lambda: base64.b64encode(jpeg).decode("utf-8")),
+        ("base64_decode", lambda: base64.b64decode(base64.b64encode(jpeg))),
+        ("endpoint_chain", lambda: base64.b64encode(pil_jpeg(Image.fromarray(
+            cv2.cvtColor(cv2.imdecode(nparr, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)))).decode("utf-8")),
+        # The client's encode before grey frames were detected (whatever mode
+        # the upload decodes to), and the one streamlit_app.image_to_bytes runs now
+        ("client_image_to_bytes_old", lambda: pil_jpeg(Image.open(io.BytesIO(upload)))),
+        ("client_image_to_bytes", lambda: client_frames.upload_to_jpeg(io.BytesIO(upload))),
+        # Grayscale-native path: decode straight to 1 channel, single-component JPEG
+        ("decode_frame", lambda: imaging.decode_frame(upload)),
+        ("grayscale_chain", lambda: base64.b64encode(imaging.encode_jpeg(imaging.decode_frame(upload))).decode("utf-8")),
+    ]
+    if turbo is not None:
+        steps += [
+            ("turbojpeg_encode_rgb", lambda: turbo.encode(bgr)),
+            ("turbojpeg_encode_gray", lambda: turbo.encode(gray[..., None], pixel_format=TJPF_GRAY, jpeg_subsample=TJSAMP_GRAY)),
+        ]
+    return steps, {"jpeg_bytes_rgb": len(jpeg), "jpeg_bytes_gray": len(cv2.imencode(".jpg", gray)[1])}
+
+
+def run(args):
+    results = []
+    for width, height in args.resolutions:
+        for colour in ("gray", "rgb"):
+            frame = synthetic_frame(width, height, seed=width, rgb=colour == "rgb")
+            for fmt in ("png", "jpg"):
+                upload = encode(frame, fmt)
+                steps, sizes = steps_for(upload)
+                for name, fn in steps:
+                    median_ms, min_ms, peak_kib = measure(fn, args.repeat)
+                    results.append({
+                        "resolution": f"{width}x{height}",
+                        "source": colour,
+                        "upload_format": fmt,
+                        "upload_bytes": len(upload),
+                        "step": name,
+                        "median_ms": median_ms,
+                        "min_ms": min_ms,
+                        "peak_alloc_kib": peak_kib,
+                        **sizes,
+                    })
+                    print(f"{width}x{height} {colour:>4} {fmt} {name:>24} {median_ms:>8.3f} ms  {peak_kib:>9.1f} KiB", file=sys.stderr)
+
+    return {
+        "meta": {
+            "benchmark": "image_path",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "opencv": cv2.__version__,
+            "pillow": Image.__version__,
+            "numpy": np.__version__,
+            "turbojpeg": turbo is not None,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """Prints median time deltas for every step present in both runs."""
+    key = lambda r: (r["resolution"], r["source"], r["upload_format"], r["step"])
+    previous = {key(r): r for r in baseline["results"]}
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        delta = result["median_ms"] - before["median_ms"]
+        pct = 100 * delta / before["median_ms"] if before["median_ms"] else 0.0
+        print(f"{' '.join(key(result)):>48} {delta:+8.3f} ms ({pct:+.1f}%)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--resolutions", type=lambda s: [tuple(int(v) for v in r.split("x")) for r in s.split(",")],
+                        default=RESOLUTIONS, help="Comma-separated WxH list")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
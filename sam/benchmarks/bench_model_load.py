@@ -0,0 +1,156 @@
+"""
+Startup-time and memory benchmark for the SAM2 weight loaders.
+
+Each loader runs in a fresh Python process, as a new worker would:
+- torch_load: unpickle the .pt checkpoint, copy into the built model
+- torch_load_mmap: torch.load(mmap=True) on the same checkpoint
+- safetensors_mmap: src/weights.py, parameters pointing into a mapped file
+
+Reports time to get the weights and to a ready model, and the process's
+private (RssAnon) vs file-backed, shareable (RssFile) resident memory.
+The page cache isn't dropped between runs, so the times are warm-start.
+
+Convert the checkpoint first (python -m src.weights <checkpoint>). Run from sam/:
+    python benchmarks/bench_model_load.py --output benchmarks/results/model_load.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+LOADERS = ["torch_load", "torch_load_mmap", "safetensors_mmap"]
+
+
+def memory_kib():
+    """RssAnon and RssFile of this process, from /proc (Linux only)."""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                values[key] = int(value.split()[0])
+    return values
+
+
+def child(loader, touch):
+    """Runs one loader in this process and prints its measurements as JSON."""
+    started = time.perf_counter()
+    import torch
+    from sam2.build_sam import build_sam2
+    from src import model, weights
+    imported = time.perf_counter()
+
+    if loader == "safetensors_mmap":
+        state_dict = weights.load_state_dict_mmap(model.weights)
+    else:
+        state = torch.load(model.checkpoint, map_location="cpu", weights_only=True, mmap=loader == "torch_load_mmap")
+        state_dict = state.get("model", state)
+    loaded = time.perf_counter()
+
+    sam = build_sam2(model.model_cfg, None, device="cpu")
+    sam.load_state_dict(state_dict, assign=loader != "torch_load")
+    sam.eval()
+    ready = time.perf_counter()
+
+    if touch:
+        # Read every parameter once, as the first inference would
+        with torch.inference_mode():
+            for parameter in sam.parameters():
+                parameter.sum()
+    touched = time.perf_counter()
+
+    print(json.dumps({
+        "import_s": imported - started,
+        "weights_s": loaded - imported,
+        "model_ready_s": ready - imported,
+        "touch_s": touched - ready,
+        **memory_kib(),
+    }))
+
+
+def run(args):
+    results = []
+    for loader in args.loaders:
+        runs = []
+        for _ in range(args.repeat):
+            command = [sys.executable, os.path.abspath(__file__), "--child", loader] + (["--touch"] if args.touch else [])
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+        median = lambda key: round(statistics.median(r[key] for r in runs), 4)
+        result = {
+            "loader": loader,
+            "runs": len(runs),
+            "weights_s": median("weights_s"),
+            "model_ready_s": median("model_ready_s"),
+            "touch_s": median("touch_s"),
+            "rss_anon_kib": median("RssAnon"),
+            "rss_file_kib": median("RssFile"),
+        }
+        results.append(result)
+        print(
+            f"{loader:>18} weights={result['weights_s']}s ready={result['model_ready_s']}s "
+            f"private={result['rss_anon_kib'] / 1024:.0f}MiB shared={result['rss_file_kib'] / 1024:.0f}MiB",
+            file=sys.stderr
+        )
+
+    return {
+        "meta": {
+            "benchmark": "model_load",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "touch": args.touch,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """Prints ready-time and private-memory deltas for every loader in both runs."""
+    previous = {r["loader"]: r for r in baseline["results"]}
+    for result in current["results"]:
+        before = previous.get(result["loader"])
+        if before is None:
+            continue
+        ready_delta = result["model_ready_s"] - before["model_ready_s"]
+        anon_delta = (result["rss_anon_kib"] - before["rss_anon_kib"]) / 1024
+        print(f"{result['loader']:>18} ready {ready_delta:+.3f}s  private {anon_delta:+.0f} MiB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--loaders", type=lambda s: s.split(","), default=LOADERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--touch", action="store_true", help="Also read every parameter once after loading")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child(args.child, args.touch)
+        sys.exit(0)
+
+    report = run(args)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,164 @@
+"""
+Accuracy-vs-latency comparison of the segmentation runtimes.
+
+Runs automatic mask generation over a validation set of frames with the
+PyTorch checkpoint (the reference) and with the exported ONNX graphs at
+fp32 and int8, and reports per runtime: load time, latency percentiles,
+masks per frame and the memory they hold, and, against the PyTorch output, the IoU of the
+highest-confidence mask (the one /guide steers by).
+
+Export the graphs first (python -m src.onnx_export). Run from sam/:
+    python benchmarks/bench_segmentation.py --frames validation_frames/ --output benchmarks/results/segmentation.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.corpus import load_corpus
+from src import imaging, model
+from src.onnx_engine import OnnxSegmenter, model_paths
+
+
+RUNTIMES = ["torch", "onnx-fp32", "onnx-int8"]
+
+
+def load_runtime(name, onnx_dir):
+    """Returns a segment(frame) -> masks function for a runtime, or None if its files are missing."""
+    if name == "torch":
+        model.runtime = "torch"
+        model.load_mask_generator()
+        return model.segment
+    precision = name.split("-", 1)[1]
+    if not all(os.path.exists(path) for path in model_paths(onnx_dir, precision)):
+        return None
+    return OnnxSegmenter(onnx_dir, precision).generate
+
+
+def best_mask(masks):
+    if not masks:
+        return None
+    return max(masks, key=lambda m: m["predicted_iou"])["segmentation"]
+
+
+def mask_iou(a, b):
+    if a is None or b is None:
+        return float(a is None and b is None)
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def percentiles(values):
+    arr = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "mean": round(float(arr.mean()), 2),
+    }
+
+
+def run(args):
+    frames = [(name, imaging.decode_frame(data)) for name, data, _ in load_corpus(args.frames, count=args.synthetic_frames)]
+    reference = {}
+    results = []
+
+    for name in args.runtimes:
+        started = time.perf_counter()
+        segment = load_runtime(name, args.onnx_dir)
+        load_s = time.perf_counter() - started
+        if segment is None:
+            print(f"{name:>10} skipped (no exported graphs in {args.onnx_dir})", file=sys.stderr)
+            continue
+
+        segment(frames[0][1])  # warm up
+        latencies, ious, counts, mask_bytes = [], [], [], []
+        for frame_name, frame in frames:
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                masks = segment(frame)
+                latencies.append(time.perf_counter() - started)
+            counts.append(len(masks))
+            mask_bytes.append(sum(m.nbytes for m in masks))
+            mask = best_mask(masks)
+            if name == "torch":
+                reference[frame_name] = mask
+            elif frame_name in reference:
+                ious.append(mask_iou(mask, reference[frame_name]))
+
+        result = {
+            "runtime": name,
+            "frames": len(frames),
+            "load_s": round(load_s, 3),
+            "latency_ms": percentiles(latencies),
+            "masks_per_frame": round(float(np.mean(counts)), 2),
+            "mask_kib_per_frame": round(float(np.mean(mask_bytes)) / 1024, 2),
+        }
+        if ious:
+            result["best_mask_iou_vs_torch"] = {
+                "mean": round(float(np.mean(ious)), 4),
+                "min": round(float(np.min(ious)), 4),
+            }
+        results.append(result)
+        print(
+            f"{name:>10} p50={result['latency_ms']['p50']}ms p95={result['latency_ms']['p95']}ms "
+            f"masks={result['masks_per_frame']} ({result['mask_kib_per_frame']}KiB) iou={result.get('best_mask_iou_vs_torch', {}).get('mean', '-')}",
+            file=sys.stderr
+        )
+
+    return {
+        "meta": {
+            "benchmark": "segmentation",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "frames": [name for name, _ in frames],
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """Prints p50 latency and IoU deltas for every runtime in both runs."""
+    previous = {r["runtime"]: r for r in baseline["results"]}
+    for result in current["results"]:
+        before = previous.get(result["runtime"])
+        if before is None:
+            continue
+        p50_delta = result["latency_ms"]["p50"] - before["latency_ms"]["p50"]
+        iou_delta = result.get("best_mask_iou_vs_torch", {}).get("mean", 0) - before.get("best_mask_iou_vs_torch", {}).get("mean", 0)
+        print(f"{result['runtime']:>10} p50 {p50_delta:+.2f} ms  iou {iou_delta:+.4f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runtimes", type=lambda s: s.split(","), default=RUNTIMES)
+    parser.add_argument("--onnx-dir", default=model.onnx_dir)
+    parser.add_argument("--frames", help="Directory of PNG/JPEG validation frames (default: synthetic frames)")
+    parser.add_argument("--synthetic-frames", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,82 @@
+import os
+
+import cv2
+import numpy as np
+
+
+# Typical ultrasound screenshot / frame-grab sizes
+RESOLUTIONS = [(640, 480), (800, 600), (1024, 768), (1280, 960)]
+
+
+def synthetic_frame(width, height, seed=0, rgb=False):
+    """
+    Returns an ultrasound-like frame: a speckled imaging fan with a couple
+    of darker structures on a black background, plus machine UI text, so
+    the benchmarks exercise realistic compression ratios offline.
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    # Sector from an apex just above the top edge
+    apex_x, apex_y = width / 2, -0.05 * height
+    radius = np.hypot(xx - apex_x, yy - apex_y)
+    angle = np.degrees(np.arctan2(xx - apex_x, yy - apex_y))
+    fan = (np.abs(angle) < 35) & (radius > 0.12 * height) & (radius < 0.95 * height)
+
+    # Rayleigh speckle over a smooth tissue pattern with anechoic blobs
+    tissue = 0.55 + 0.25 * np.sin(xx / 37.0 + seed) * np.cos(yy / 53.0)
+    for _ in range(3):
+        cx, cy = rng.uniform(0.3, 0.7) * width, rng.uniform(0.3, 0.8) * height
+        r = rng.uniform(0.05, 0.12) * height
+        tissue *= 1 - 0.8 * np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * r * r))
+    speckle = rng.rayleigh(0.5, size=(height, width))
+    frame = np.clip(tissue * speckle * 180, 0, 255).astype(np.uint8)
+    frame[~fan] = 0
+
+    # Machine UI text and a depth scale outside the fan
+    cv2.putText(frame, "US-2  ABD  5.2MHz", (10, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.6, 255, 1)
+    cv2.putText(frame, f"G 52  D 16cm  #{seed}", (10, height - 12), cv2.FONT_HERSHEY_SIMPLEX, 0.5, 200, 1)
+    for tick in range(10):
+        y = int(0.1 * height + tick * 0.08 * height)
+        cv2.line(frame, (width - 20, y), (width - 10, y), 255, 1)
+
+    if rgb:
+        # Colour frame grab of a grey image, with a faint colour tint like a capture card
+        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        frame[..., 0] = cv2.add(frame[..., 0], 3)
+    return frame
+
+
+def encode(frame, fmt):
+    ok, buf = cv2.imencode("." + fmt, frame)
+    if not ok:
+        raise ValueError(f"Could not encode frame as {fmt}")
+    return buf.tobytes()
+
+
+def load_corpus(frames_dir=None, count=8):
+    """
+    Returns a list of (name, encoded_bytes, media_type) frames.
+
+    Frames come from `frames_dir` (any PNG/JPEG files) when given, otherwise
+    `count` synthetic frames are generated across RESOLUTIONS and formats.
+    """
+    corpus = []
+    if frames_dir:
+        for name in sorted(os.listdir(frames_dir)):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in (".png", ".jpg", ".jpeg"):
+                with open(os.path.join(frames_dir, name), "rb") as f:
+                    media_type = "image/png" if ext == ".png" else "image/jpeg"
+                    corpus.append((name, f.read(), media_type))
+        if not corpus:
+            raise ValueError(f"No PNG/JPEG frames found in {frames_dir}")
+        return corpus
+
+    for i in range(count):
+        width, height = RESOLUTIONS[i % len(RESOLUTIONS)]
+        fmt = "png" if i % 2 == 0 else "jpg"
+        frame = synthetic_frame(width, height, seed=i)
+        media_type = "image/png" if fmt == "png" else "image/jpeg"
+        corpus.append((f"synthetic_{width}x{height}_{i}.{fmt}", encode(frame, fmt), media_type))
+    return corpus
@@ -0,0 +1,116 @@
+"""
+Production launcher for the API: several uvicorn workers under gunicorn,
+with the SAM2 weights loaded once rather than once per worker.
+
+Two ways of sharing the model, picked by INFERENCE_PROCESSES:
+- 0 (default): the launcher loads the model and freezes the heap before
+  gunicorn forks the workers, so every worker shares the weights'
+  pages copy-on-write. Not with SEGMENTATION_RUNTIME=onnx, whose sessions
+  must be created after the fork: each worker loads its own.
+- N > 0: a supervised pool of N inference processes loads the model and
+  serves all the workers, with frames passed through shared memory (see
+  src/inference.py); the workers themselves never load torch.
+
+Run from sam/:
+    WEB_CONCURRENCY=4 python serve.py
+"""
+import gc
+import os
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+from src import inference
+
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "2"))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+
+# Load SAM2 in the launcher before forking (only when there are no inference processes)
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "1") != "0"
+
+# ONNX Runtime starts a session's intra-op thread pool when the session is
+# created, and a forked worker would inherit that pool without its threads
+# (its first run can hang). So with the onnx runtime nothing is preloaded:
+# each worker creates its own sessions on first use.
+SEGMENTATION_RUNTIME = os.getenv("SEGMENTATION_RUNTIME", "torch")
+
+# torch threads per API worker when the model is preloaded (default: the cores split between workers)
+WORKER_TORCH_THREADS = int(os.getenv("WORKER_TORCH_THREADS", "0")) or max(1, (os.cpu_count() or 1) // max(1, WEB_CONCURRENCY))
+
+
+class Server(BaseApplication):
+    """gunicorn running an already imported ASGI app."""
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def main():
+    pool = None
+    if inference.INFERENCE_PROCESSES > 0:
+        pool = inference.InferencePool().start()
+        # Tells the app not to start a pool of its own in each worker
+        os.environ["INFERENCE_POOL_EXTERNAL"] = "1"
+    elif PRELOAD_MODEL and SEGMENTATION_RUNTIME != "onnx":
+        import torch
+        # Load on the calling thread only: an OpenMP / intra-op pool started
+        # before the fork would be inherited half-alive and can deadlock the
+        # workers' first parallel op. Each worker sizes its own in post_fork.
+        torch.set_num_threads(1)
+        from src import model
+        model.load_mask_generator()
+
+    # The provider's rate limit is paced per process, so split it between the workers
+    total_rpm = int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "50"))
+    if total_rpm > 0:
+        os.environ["ANTHROPIC_REQUESTS_PER_MINUTE"] = str(max(1, total_rpm // WEB_CONCURRENCY))
+
+    import app
+
+    # Objects allocated so far (the app, the model's Python side) are moved
+    # out of the collector's reach, so GC passes in the workers don't write
+    # to them and un-share their pages
+    gc.collect()
+    gc.freeze()
+
+    def when_ready(server):
+        # With an inference pool the workers must stay torch-free; anything
+        # that imported it here would be forked into every worker
+        if pool is not None:
+            assert "torch" not in sys.modules, "torch was imported in the launcher despite INFERENCE_PROCESSES > 0"
+
+    def post_fork(server, worker):
+        # Tracing is set up by the app's startup hook in each worker, so no
+        # exporter threads are started here to be lost in the fork
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(WORKER_TORCH_THREADS)
+
+    def on_exit(server):
+        if pool is not None:
+            pool.stop()
+
+    Server(app.app, {
+        "bind": f"{HOST}:{PORT}",
+        "workers": WEB_CONCURRENCY,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "timeout": 120,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "on_exit": on_exit,
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+
+# Lower number = served first. /identify is short and on the interactive path,
+# the transcript endpoints are long generations.
+PRIORITY = {
+    "identify": 0,
+    "navigate": 1,
+    "describe": 1,
+}
+
+
+class TokenBucket:
+    """
+    Async token bucket for pacing outbound model calls to the provider's
+    requests-per-minute limit. Bursts of up to `burst` calls go straight
+    through, after that callers wait for tokens to refill.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        if rate_per_minute <= 0:
+            raise ValueError(f"rate_per_minute must be positive, got {rate_per_minute}")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, rate_per_minute // 10))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # The lock keeps waiters in arrival order while one of them sleeps
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdmissionController:
+    """
+    Bounded, prioritised admission in front of the model calls.
+
+    At most `max_concurrency` calls run at once and at most `max_queue`
+    requests wait for a slot; anything beyond that is rejected straight away
+    with 429 and a Retry-After estimate, rather than piling up until the
+    provider starts failing every request. Waiters are served in priority
+    order, and `reserved_interactive` slots can only be taken by priority-0
+    (interactive) work, so long generations can never occupy every slot.
+    """
+
+    def __init__(self, max_concurrency, max_queue, reserved_interactive=1, rate_limiter=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.reserved_interactive = min(reserved_interactive, max_concurrency - 1)
+        self.rate_limiter = rate_limiter
+        self.running = 0
+        self.running_background = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        # Moving average of how long a slot is held, for Retry-After
+        self._avg_service_time = 5.0
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def _can_start(self, priority):
+        if self.running >= self.max_concurrency:
+            return False
+        if priority > 0:
+            return self.running_background < self.max_concurrency - self.reserved_interactive
+        return True
+
+    def _start(self, priority):
+        self.running += 1
+        if priority > 0:
+            self.running_background += 1
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up for a new request."""
+        backlog = (self.queued + 1) / self.max_concurrency
+        return max(1, math.ceil(backlog * self._avg_service_time))
+
+    def _discard(self, entry):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+
+    def _wake_next(self):
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_start(priority):
+                # The head is the highest-priority waiter; if it can't start, nothing behind it can
+                return
+            heapq.heappop(self._waiters)
+            self._start(priority)
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, endpoint):
+        priority = PRIORITY.get(endpoint, 1)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), future)
+        heapq.heappush(self._waiters, entry)
+        self._wake_next()
+
+        if not future.done():
+            if self.queued > self.max_queue:
+                self._discard(entry)
+                raise HTTPException(
+                    status_code=429,
+                    detail="Server is at capacity, please retry shortly",
+                    headers={"Retry-After": str(self.retry_after())}
+                )
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Slot was handed to us just as we were cancelled, pass it on
+                    self._release(priority)
+                else:
+                    self._discard(entry)
+                raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+            self._release(priority)
+
+    def _release(self, priority):
+        self.running -= 1
+        if priority > 0:
+            self.running_background -= 1
+        self._wake_next()
+
+    async def run(self, endpoint, fn, *args):
+        """
+        Run the blocking `fn(*args)` in a worker thread once admitted and paced.
+        """
+        async with self.slot(endpoint):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            return await asyncio.to_thread(fn, *args)
+
+    async def stream(self, endpoint, fn, *args):
+        """
+        Like run(), for a blocking generator `fn(*args)`: items are yielded
+        as the worker thread produces them and the slot is held until the
+        generator is exhausted. If the consumer stops early, the generator
+        is closed at its next item.
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        stop = threading.Event()
+        finished = object()
+
+        def pump():
+            generator = fn(*args)
+            try:
+                for item in generator:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, (item, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(items.put_nowait, (finished, e))
+                return
+            finally:
+                generator.close()
+            loop.call_soon_threadsafe(items.put_nowait, (finished, None))
+
+        async with self.slot(endpoint):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            worker = asyncio.ensure_future(asyncio.to_thread(pump))
+            try:
+                while True:
+                    item, error = await items.get()
+                    if item is finished:
+                        if error is not None:
+                            raise error
+                        break
+                    yield item
+            finally:
+                stop.set()
+                await worker
@@ -0,0 +1,220 @@
+"""
+How a client reaches the API: over HTTP to a remote deployment, or by
+running the API's endpoint logic inside the client's own process.
+
+Both return the same JSON payloads as the endpoints. The in-process backend
+hands the uploaded bytes straight to sam/app.py, so a co-located deployment
+(client and API on the same machine) skips multipart encoding, the network
+and JSON serialization entirely.
+
+    backend = create_backend(os.getenv("BACKEND_MODE", "http"), base_url)
+    result = backend.identify(image_bytes, "liver", session="scan-1")
+"""
+import abc
+import asyncio
+import email.utils
+import threading
+import time
+from datetime import timezone
+
+from src import tracing
+
+
+class BackendError(Exception):
+    """The API refused or failed a request (status code and detail as the HTTP API would report them)."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+# Helper function to read a Retry-After header: delay-seconds or an HTTP-date
+def retry_after(value, default=1.0):
+    """Seconds to wait as advised by a Retry-After value, or default if it can't be read."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, when.timestamp() - time.time())
+
+
+class Backend(abc.ABC):
+    """The API's operations. Every call belongs to a scan session and returns the endpoint's JSON payload."""
+
+    @abc.abstractmethod
+    def identify(self, image_bytes, organ, session="", presence=False):
+        ...
+
+    @abc.abstractmethod
+    def identify_clip(self, clip_bytes, filename, organ, session=""):
+        ...
+
+    @abc.abstractmethod
+    def navigate(self, image_bytes, organ, session=""):
+        ...
+
+    @abc.abstractmethod
+    def describe(self, image_bytes, organ, session=""):
+        ...
+
+    @abc.abstractmethod
+    def guide(self, image_bytes, organ, session=""):
+        ...
+
+    @abc.abstractmethod
+    def submit_describe(self, image_bytes, organ, session="", callback_url=None):
+        """Starts a diagnosis as a background job and returns the job ({id, status, ...}) at once."""
+
+    @abc.abstractmethod
+    def job(self, job_id, wait=0.0):
+        """The job, after waiting up to `wait` seconds for it to finish."""
+
+
+class HttpBackend(Backend):
+    """
+    Requests to a deployed API; POSTs wait out one 429 (server at capacity)
+    before giving up. A request with no response within timeout seconds
+    raises rather than hanging the caller.
+    """
+
+    def __init__(self, base_url, preset="", max_wait=10, timeout=60):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.preset = preset
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    def post(self, path, files, data, session):
+        url = f"{self.base_url}/{path}"
+        with tracing.start_span("POST " + path, url=url) as span:
+            headers = tracing.inject({"X-Scan-Session": session, "X-Ultrasound-Preset": self.preset})
+            response = self.http.post(url, files=files, data=data, headers=headers, timeout=self.timeout)
+            if response.status_code == 429:
+                delay = min(retry_after(response.headers.get("Retry-After")), self.max_wait)
+                span.set_attribute("retry_after", delay)
+                time.sleep(delay)
+                response = self.http.post(url, files=files, data=data, headers=headers, timeout=self.timeout)
+            span.set_attribute("http.status_code", response.status_code)
+        return self.payload(response)
+
+    def payload(self, response):
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise BackendError(response.status_code, detail)
+        return response.json()
+
+    def identify(self, image_bytes, organ, session="", presence=False):
+        data = {"entity_name": organ}
+        if presence:
+            data["presence"] = "true"
+        return self.post("identify", {"image": ("image.jpg", image_bytes, "image/jpeg")}, data, session)
+
+    def identify_clip(self, clip_bytes, filename, organ, session=""):
+        return self.post("identify_clip", {"clip": (filename, clip_bytes, "application/octet-stream")}, {"entity_name": organ}, session)
+
+    def navigate(self, image_bytes, organ, session=""):
+        return self.post("navigate", {"image": ("image.jpg", image_bytes, "image/jpeg")}, {"entity_name": organ}, session)
+
+    def describe(self, image_bytes, organ, session=""):
+        return self.post("describe", {"image": ("image.jpg", image_bytes, "image/jpeg")}, {"target_organ": organ}, session)
+
+    def guide(self, image_bytes, organ, session=""):
+        return self.post("guide", {"image": ("image.jpg", image_bytes, "image/jpeg")}, {"entity_name": organ}, session)
+
+    def submit_describe(self, image_bytes, organ, session="", callback_url=None):
+        data = {"target_organ": organ}
+        if callback_url:
+            data["callback_url"] = callback_url
+        return self.post("jobs/describe", {"image": ("image.jpg", image_bytes, "image/jpeg")}, data, session)
+
+    def job(self, job_id, wait=0.0):
+        url = f"{self.base_url}/jobs/{job_id}"
+        with tracing.start_span("GET jobs", url=url, wait=wait) as span:
+            response = self.http.get(url, params={"wait": wait}, headers=tracing.inject(), timeout=wait + self.timeout)
+            span.set_attribute("http.status_code", response.status_code)
+        return self.payload(response)
+
+
+class InProcessBackend(Backend):
+    """
+    Runs sam/app.py's endpoint logic in this process. The API's async parts
+    (admission, single-flight, its inference pool) live on one event loop in
+    a background thread, which callers from any thread submit to and wait on.
+    """
+
+    def __init__(self, preset="", max_wait=10):
+        # Imported here so an HTTP-only client never loads the API, its
+        # model clients or SAM2
+        import app
+        self.app = app
+        self.preset = preset
+        self.max_wait = max_wait
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="api-loop", daemon=True).start()
+        app.start_inference_pool()
+        asyncio.run_coroutine_threadsafe(app.start_job_workers(), self.loop).result()
+
+    async def _run(self, endpoint, session, parent, fn, *args):
+        # The same per-request context the HTTP middleware sets up
+        self.app.metrics.current_endpoint.set(endpoint)
+        self.app.roi.current_preset.set(self.preset)
+        self.app.roi.current_session.set(session)
+        with tracing.start_span(f"inprocess /{endpoint}", parent=parent):
+            return await fn(*args)
+
+    def call(self, endpoint, session, fn, *args):
+        for attempt in range(2):
+            future = asyncio.run_coroutine_threadsafe(self._run(endpoint, session, tracing.current_span(), fn, *args), self.loop)
+            try:
+                return future.result()
+            except self.app.HTTPException as e:
+                if e.status_code == 429 and attempt == 0:
+                    time.sleep(min(retry_after((e.headers or {}).get("Retry-After")), self.max_wait))
+                    continue
+                raise BackendError(e.status_code, e.detail) from e
+
+    def identify(self, image_bytes, organ, session="", presence=False):
+        return self.call("identify", session, self.app.analyse_identify, image_bytes, organ, session, presence)
+
+    def identify_clip(self, clip_bytes, filename, organ, session=""):
+        async def analyse():
+            selector = self.app.keyframes.KeyframeSelector()
+            with self.app.pipeline_stage("decode"):
+                await asyncio.to_thread(self.app.keyframes.add_clip, selector, clip_bytes)
+            return await self.app.analyse_clip(selector, organ)
+        return self.call("identify_clip", session, analyse)
+
+    def navigate(self, image_bytes, organ, session=""):
+        return self.call("navigate", session, self.app.analyse_navigate, image_bytes, organ, session)
+
+    def describe(self, image_bytes, organ, session=""):
+        return self.call("describe", session, self.app.analyse_describe, image_bytes, organ, session)
+
+    def guide(self, image_bytes, organ, session=""):
+        return self.call("guide", session, self.app.analyse_guide, image_bytes, organ, session)
+
+    def submit_describe(self, image_bytes, organ, session="", callback_url=None):
+        return self.call("jobs/describe", session, self.app.submit_describe, image_bytes, organ, session, callback_url)
+
+    def job(self, job_id, wait=0.0):
+        return self.call("jobs", "", self.app.job_status, job_id, wait)
+
+
+def create_backend(mode, base_url, preset="", timeout=60):
+    """mode: "http" (the API at base_url, timeout seconds per request) or "inprocess" (sam/app.py loaded into this process)."""
+    if mode == "inprocess":
+        return InProcessBackend(preset)
+    if mode == "http":
+        return HttpBackend(base_url, preset, timeout=timeout)
+    raise ValueError(f"Unknown backend mode: {mode}")
@@ -0,0 +1,33 @@
+import io
+
+from PIL import Image, ImageChops
+
+
+# Used by the Streamlit client (and the image path benchmark, which times
+# it), so this module only needs Pillow.
+
+
+def is_grayscale_image(img, tolerance=8):
+    """True if the image carries no real colour (B-mode ultrasound frames are grey)"""
+    if img.mode in ("1", "L", "LA", "I", "I;16", "F"):
+        return True
+    if img.mode not in ("RGB", "RGBA"):
+        return False
+    # Compare channels on a downsampled copy; frame grabs leave a little chroma noise
+    r, g, b = img.convert("RGB").reduce(8).split()
+    return (
+        ImageChops.difference(r, g).getextrema()[1] <= tolerance
+        and ImageChops.difference(g, b).getextrema()[1] <= tolerance
+    )
+
+
+def upload_to_jpeg(uploaded_image):
+    """Returns (JPEG bytes, PIL mode) for an uploaded file, single-channel for grey frames"""
+    img = Image.open(uploaded_image)
+    if is_grayscale_image(img):
+        img = img.convert("L")
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG")
+    return buf.getvalue(), img.mode
@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Used by both the API and the Streamlit client, so this module only needs
+# numpy: callers hand in a grayscale array however they decoded it.
+
+FRAME_GATE = os.getenv("FRAME_GATE", "1") != "0"
+
+# A frame counts as changed when its difference hash differs from the last
+# analysed frame in more than this many of 64 bits...
+FRAME_CHANGE_BITS = int(os.getenv("FRAME_CHANGE_BITS", "6"))
+# ...or its 16x16 thumbnail differs by more than this many grey levels on average
+FRAME_CHANGE_DIFF = float(os.getenv("FRAME_CHANGE_DIFF", "6.0"))
+
+
+def downsample(gray, width, height):
+    """
+    Block-mean downsample of a 2-D array to width x height (no resampling
+    library needed). Block edges are spread evenly, so every pixel counts
+    even when the size isn't a multiple of the grid.
+    """
+    h, w = gray.shape[:2]
+    if h < height or w < width:
+        # Tiny input: repeat pixels up to the target grid first
+        gray = np.repeat(np.repeat(gray, -(-height // h), axis=0), -(-width // w), axis=1)
+        h, w = gray.shape[:2]
+    rows = np.linspace(0, h, height + 1).astype(np.intp)
+    cols = np.linspace(0, w, width + 1).astype(np.intp)
+    sums = np.add.reduceat(np.add.reduceat(gray, rows[:-1], axis=0, dtype=np.float64), cols[:-1], axis=1)
+    return (sums / np.outer(np.diff(rows), np.diff(cols))).astype(np.float32)
+
+
+class FrameSignature:
+    """A 64-bit difference hash plus a 16x16 thumbnail of a grayscale frame."""
+
+    __slots__ = ("dhash", "thumbnail")
+
+    def __init__(self, gray):
+        small = downsample(gray, 9, 8)
+        bits = (small[:, 1:] > small[:, :-1]).ravel()
+        self.dhash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+        self.thumbnail = downsample(gray, 16, 16)
+
+    def distance(self, other):
+        """Returns (differing hash bits, mean absolute thumbnail difference)."""
+        bits = bin(self.dhash ^ other.dhash).count("1")
+        diff = float(np.mean(np.abs(self.thumbnail - other.thumbnail)))
+        return bits, diff
+
+    def changed_from(self, other, bits_threshold=FRAME_CHANGE_BITS, diff_threshold=FRAME_CHANGE_DIFF):
+        if other is None:
+            return True
+        bits, diff = self.distance(other)
+        return bits > bits_threshold or diff > diff_threshold
+
+
+class FrameChangeGate:
+    """
+    Remembers the last analysed frame and its result per key (e.g. session,
+    endpoint and organ). lookup() returns the stored result while new frames
+    stay within the thresholds of that reference frame. The reference only
+    moves when a frame is actually re-analysed, so slow drift still adds
+    up to a change eventually.
+    """
+
+    def __init__(self, bits_threshold=FRAME_CHANGE_BITS, diff_threshold=FRAME_CHANGE_DIFF, max_entries=256):
+        self.bits_threshold = bits_threshold
+        self.diff_threshold = diff_threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            reference, result = entry
+            if signature.changed_from(reference, self.bits_threshold, self.diff_threshold):
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def store(self, key, signature, result):
+        with self._lock:
+            self._entries[key] = (signature, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
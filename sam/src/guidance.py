@@ -0,0 +1,110 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Rules for turning where the target mask sits in the frame into short probe
+# cues. Offsets are fractions of the frame size, measured from its centre.
+
+# Centroid offsets within this band count as centred
+GUIDANCE_DEAD_ZONE = float(os.getenv("GUIDANCE_DEAD_ZONE", "0.1"))
+
+# Mask area (fraction of the frame) outside this range asks for a depth change
+GUIDANCE_MIN_AREA = float(os.getenv("GUIDANCE_MIN_AREA", "0.04"))
+GUIDANCE_MAX_AREA = float(os.getenv("GUIDANCE_MAX_AREA", "0.5"))
+
+# Weight of the newest frame in the smoothed position, so cues don't flicker
+GUIDANCE_SMOOTHING = float(os.getenv("GUIDANCE_SMOOTHING", "0.5"))
+
+
+def mask_geometry(mask):
+    """
+    Returns the mask's centroid offset from the frame centre (dx, dy in
+    [-0.5, 0.5], positive right/down) and its area as a fraction of the
+    frame, or None for an empty mask. Uses row/column sums rather than
+    pixel coordinates, so no index arrays are built.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    height, width = mask.shape
+    cols = mask.sum(axis=0, dtype=np.int64)
+    area = int(cols.sum())
+    if area == 0:
+        return None
+    rows = mask.sum(axis=1, dtype=np.int64)
+    cx = float(cols @ np.arange(width)) / area
+    cy = float(rows @ np.arange(height)) / area
+    return {
+        "dx": (cx + 0.5) / width - 0.5,
+        "dy": (cy + 0.5) / height - 0.5,
+        "area": area / float(height * width),
+    }
+
+
+def cues_for(geometry, dead_zone=GUIDANCE_DEAD_ZONE, min_area=GUIDANCE_MIN_AREA, max_area=GUIDANCE_MAX_AREA):
+    """
+    Maps mask geometry to cues, most urgent first, each {"cue", "magnitude"}.
+    Horizontal offsets mean sliding the probe; vertical offsets (depth in
+    the image) mean tilting the beam up or down. Returns [{"cue": "hold"}]
+    once the organ is centred and sized well.
+    """
+    cues = []
+    if abs(geometry["dx"]) > dead_zone:
+        cues.append({"cue": "slide right" if geometry["dx"] > 0 else "slide left", "magnitude": abs(geometry["dx"])})
+    if abs(geometry["dy"]) > dead_zone:
+        cues.append({"cue": "tilt down" if geometry["dy"] > 0 else "tilt up", "magnitude": abs(geometry["dy"])})
+    if geometry["area"] < min_area:
+        cues.append({"cue": "reduce depth", "magnitude": 1 - geometry["area"] / min_area})
+    elif geometry["area"] > max_area:
+        cues.append({"cue": "increase depth", "magnitude": (geometry["area"] - max_area) / (1 - max_area)})
+
+    if not cues:
+        return [{"cue": "hold", "magnitude": 0.0}]
+    cues.sort(key=lambda cue: cue["magnitude"], reverse=True)
+    for cue in cues:
+        cue["magnitude"] = round(cue["magnitude"], 3)
+    return cues
+
+
+class ProbeGuide:
+    """
+    Per-scan guidance state: smooths mask geometry across frames with an
+    exponential moving average before applying the rules, and starts over
+    whenever the organ is lost.
+    """
+
+    def __init__(self, smoothing=GUIDANCE_SMOOTHING):
+        self.smoothing = smoothing
+        self._geometry = None
+
+    def update(self, mask):
+        """Returns (smoothed geometry, cues) for a frame's mask, or (None, []) if it's empty or None."""
+        geometry = mask_geometry(mask) if mask is not None else None
+        if geometry is None:
+            self._geometry = None
+            return None, []
+        if self._geometry is not None:
+            geometry = {
+                key: self.smoothing * value + (1 - self.smoothing) * self._geometry[key]
+                for key, value in geometry.items()
+            }
+        self._geometry = geometry
+        return {key: round(value, 4) for key, value in geometry.items()}, cues_for(geometry)
+
+
+class GuideSessions:
+    """Bounded map of (scan session, organ) -> ProbeGuide, dropping the least recently used."""
+
+    def __init__(self, max_sessions=256):
+        self.max_sessions = max_sessions
+        self._guides = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            guide = self._guides.pop(key, None) or ProbeGuide()
+            self._guides[key] = guide
+            while len(self._guides) > self.max_sessions:
+                self._guides.popitem(last=False)
+            return guide
@@ -0,0 +1,114 @@
+import os
+
+import cv2
+import numpy as np
+
+
+# Ultrasound B-mode frames are single-channel. With GRAYSCALE_FRAMES on (the
+# default) frames stay 1-channel uint8 from decode to JPEG encode, which is a
+# third of the pixel bytes of the old BGR -> RGB -> 3-channel JPEG path.
+# Colour frames (e.g. Doppler overlays) are detected and kept in colour.
+GRAYSCALE_FRAMES = os.getenv("GRAYSCALE_FRAMES", "1") != "0"
+
+# Max per-channel difference for a 3-channel frame to count as grey; frame
+# grabbers and JPEG chroma subsampling leave a few levels of noise
+GRAYSCALE_TOLERANCE = int(os.getenv("GRAYSCALE_TOLERANCE", "8"))
+
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "90"))
+
+# Encoded formats the vision model accepts directly, by leading magic bytes
+MODEL_MEDIA_TYPES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+def sniff_media_type(data):
+    """Returns the media type of encoded image bytes from their header, or None."""
+    head = bytes(data[:12])
+    for magic, media_type in MODEL_MEDIA_TYPES:
+        if head.startswith(magic):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def is_grayscale(image, tolerance=GRAYSCALE_TOLERANCE):
+    """
+    True if a BGR image carries no real colour. Checks a strided sample of
+    pixels so the cost stays well under that of a full colour conversion.
+    """
+    if image.ndim == 2:
+        return True
+    sample = image[::8, ::8, :3].astype(np.int16)
+    return (
+        int(np.abs(sample[..., 0] - sample[..., 1]).max()) <= tolerance
+        and int(np.abs(sample[..., 1] - sample[..., 2]).max()) <= tolerance
+    )
+
+
+def decode_frame(data, grayscale=GRAYSCALE_FRAMES):
+    """
+    Decode encoded image bytes (PNG/JPEG) into a uint8 array.
+
+    Returns a 2-D grayscale array for grey frames when `grayscale` is on,
+    otherwise a 3-channel BGR array. Returns None if the data can't be decoded.
+    """
+    nparr = np.frombuffer(data, np.uint8)
+    if not grayscale:
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    # UNCHANGED keeps grey PNG/JPEG single-channel straight out of the decoder
+    img = cv2.imdecode(nparr, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        return None
+    if img.dtype != np.uint8:
+        img = cv2.convertScaleAbs(img, alpha=255.0 / max(int(img.max()), 1))
+    if img.ndim == 3 and img.shape[2] == 4:
+        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    if img.ndim == 3 and is_grayscale(img):
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return img
+
+
+# Reduced-size grayscale decode flags, by downscale factor
+THUMBNAIL_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def decode_thumbnail(data, scale=8):
+    """
+    Decode a 1/scale grayscale copy (scale 2, 4 or 8) of encoded image bytes,
+    or None. JPEG decoders produce this straight from the DCT coefficients,
+    so it costs a fraction of a full decode; enough for change detection.
+    """
+    return cv2.imdecode(np.frombuffer(data, np.uint8), THUMBNAIL_FLAGS[scale])
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    """
+    Encode a grayscale or BGR array as JPEG bytes. Grayscale arrays become
+    single-component JPEGs, with no colour conversion on the way.
+    """
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode image as JPEG")
+    return buffer.tobytes()
+
+
+def to_model_rgb(image):
+    """
+    Returns the frame as an H x W x 3 RGB array for models that need three
+    channels. A grayscale frame is expanded as a read-only broadcast view,
+    so no pixel data is copied here; the model's own preprocessing makes
+    the one copy it needs when converting to a float tensor.
+    """
+    if image.ndim == 2:
+        return np.broadcast_to(image[..., None], image.shape + (3,))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
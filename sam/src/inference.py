@@ -0,0 +1,399 @@
+import itertools
+import multiprocessing
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+
+# With INFERENCE_PROCESSES > 0, SAM2 runs in a pool of that many dedicated
+# processes that every API worker talks to over Unix sockets, so the weights
+# are loaded once per inference process instead of once per API worker and
+# segmentation never holds the API process's GIL. With 0, segmentation runs
+# inside the API process itself.
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", "0"))
+
+# Requests an inference process will hold (running + waiting) before it
+# answers "busy" and the request moves on to the next process
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "4"))
+
+# torch intra-op threads per inference process; by default the cores are
+# split evenly so processes don't oversubscribe each other
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0")) or max(1, (os.cpu_count() or 1) // max(1, INFERENCE_PROCESSES))
+
+# Also pin each process to its own slice of cores
+INFERENCE_PIN_CPUS = os.getenv("INFERENCE_PIN_CPUS", "0") == "1"
+
+# Supervision: how often processes are pinged, and how long one request may
+# run before the process is considered hung and replaced
+INFERENCE_HEALTH_INTERVAL = float(os.getenv("INFERENCE_HEALTH_INTERVAL", "5"))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "60"))
+
+# A process that hasn't opened its socket this long after being (re)started
+# is taken to be stuck loading the model and is replaced
+INFERENCE_LOAD_TIMEOUT = float(os.getenv("INFERENCE_LOAD_TIMEOUT", "300"))
+
+# Each pool puts its sockets in a private directory (mode 0700) and makes up
+# a random authkey; both reach the API workers through these variables,
+# which the pool sets before they're forked
+SOCKET_DIR_VARIABLE = "INFERENCE_SOCKET_DIR"
+AUTHKEY_VARIABLE = "INFERENCE_AUTHKEY"
+
+# Segmentation operations callable through call(), all taking one frame
+# (and target_mask optionally the organ to prompt for)
+OPERATIONS = ("target_mask", "mask_coverage", "track_mask")
+
+# Operations that keep per-session state in the process that runs them; their
+# first argument (the session) always routes to the same process
+STICKY_OPERATIONS = ("track_mask",)
+
+
+class InferenceBusy(Exception):
+    """Every inference process's queue is full."""
+
+
+def socket_path(index, directory=None):
+    directory = directory or os.environ.get(SOCKET_DIR_VARIABLE)
+    if not directory:
+        raise RuntimeError("No inference pool is running in this process or its parent")
+    return os.path.join(directory, f"inference.{index}")
+
+
+def _authkey():
+    return bytes.fromhex(os.environ[AUTHKEY_VARIABLE])
+
+
+def _run(op, image, *args):
+    # Imported here so processes that never segment don't load torch and SAM2
+    from src import model
+    if op not in OPERATIONS:
+        raise ValueError(f"Unknown inference operation: {op}")
+    return getattr(model, op)(image, *args)
+
+
+def _attach(name):
+    """Opens a shared memory block created by another process without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching also registers the block for cleanup
+        # when this process exits, which would unlink the owner's buffer
+        block = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(block._name, "shared_memory")
+        return block
+
+
+def _limit_threads(index, threads):
+    # Must happen before torch (or ONNX Runtime) is imported to take effect
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "ONNX_THREADS"):
+        os.environ[variable] = str(threads)
+    if INFERENCE_PIN_CPUS and hasattr(os, "sched_setaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+        start = (index * threads) % len(cores)
+        os.sched_setaffinity(0, cores[start:start + threads] or cores)
+
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def serve(index, directory, authkey, threads=INFERENCE_THREADS, queue_depth=INFERENCE_QUEUE_DEPTH):
+    """
+    Inference process main loop: limits its threads, loads the model, then
+    serves requests on its socket. Each connection gets a thread; the model
+    runs one request at a time, and at most queue_depth are admitted.
+
+    Frames arrive in a shared memory block owned by the caller, described
+    by (name, shape, dtype) alongside the operation's other arguments, and
+    array results are written back into it, so
+    no pixel data is pickled either way.
+    """
+    _limit_threads(index, threads)
+    from src import model
+    model.load_mask_generator()
+
+    path = socket_path(index, directory)
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = Listener(path, family="AF_UNIX", authkey=authkey)
+    admitted = threading.BoundedSemaphore(queue_depth)
+    compute = threading.Lock()
+    state = {"busy_since": None}
+
+    def handle(conn):
+        blocks = {}
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    break
+                if request[0] == "ping":
+                    conn.send(("ok", {"busy_since": state["busy_since"], "pid": os.getpid()}))
+                    continue
+
+                op, name, shape, dtype, args = request
+                if not admitted.acquire(blocking=False):
+                    conn.send(("busy", None))
+                    continue
+                try:
+                    if name not in blocks:
+                        # The caller outgrew its old buffer and replaced it
+                        for block in blocks.values():
+                            block.close()
+                        blocks = {name: _attach(name)}
+                    buffer = blocks[name].buf
+                    image = np.ndarray(shape, dtype=dtype, buffer=buffer)
+                    with compute:
+                        state["busy_since"] = time.monotonic()
+                        try:
+                            result = _run(op, image, *args)
+                        finally:
+                            state["busy_since"] = None
+                    del image
+                    if isinstance(result, np.ndarray) and result.nbytes <= len(buffer):
+                        np.ndarray(result.shape, dtype=result.dtype, buffer=buffer)[...] = result
+                        conn.send(("shm", (result.shape, result.dtype.str)))
+                    else:
+                        conn.send(("ok", result))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+                finally:
+                    admitted.release()
+        for block in blocks.values():
+            block.close()
+
+    print(f"Inference process {index} ready on {path} with {threads} threads")
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def _ping(index, timeout=2.0):
+    """Returns the process's status dict, or None if it doesn't answer in time."""
+    try:
+        with Client(socket_path(index), family="AF_UNIX", authkey=_authkey()) as conn:
+            conn.send(("ping",))
+            if not conn.poll(timeout):
+                return None
+            return conn.recv()[1]
+    except (OSError, EOFError):
+        return None
+
+
+class InferencePool:
+    """
+    Starts the inference processes and keeps them healthy: a supervisor
+    thread pings each one every INFERENCE_HEALTH_INTERVAL seconds and
+    replaces any that has died, stopped answering, or been stuck on one
+    request for longer than INFERENCE_TIMEOUT.
+
+    Processes are spawned rather than forked, so they don't inherit the
+    launcher's threads or OpenMP state. Only processes of the same user
+    that know the pool's random authkey (the API workers, through the
+    environment) can connect.
+    """
+
+    def __init__(self, processes=INFERENCE_PROCESSES):
+        self.processes = processes
+        self._context = multiprocessing.get_context("spawn")
+        self._servers = [None] * processes
+        self._spawned_at = [0.0] * processes
+        self._stopped = threading.Event()
+        self.directory = tempfile.mkdtemp(prefix="space-triage-inference-")
+        self.authkey = secrets.token_bytes(32)
+        os.environ[SOCKET_DIR_VARIABLE] = self.directory
+        os.environ[AUTHKEY_VARIABLE] = self.authkey.hex()
+
+    def _spawn(self, index):
+        if os.path.exists(socket_path(index, self.directory)):
+            os.unlink(socket_path(index, self.directory))
+        process = self._context.Process(
+            target=serve, args=(index, self.directory, self.authkey), name=f"inference-{index}", daemon=True
+        )
+        process.start()
+        self._servers[index] = process
+        self._spawned_at[index] = time.monotonic()
+        return process
+
+    def _wait_ready(self, index):
+        process = self._servers[index]
+        while not os.path.exists(socket_path(index, self.directory)):
+            if not process.is_alive():
+                raise RuntimeError(f"Inference process {index} exited during startup")
+            time.sleep(0.1)
+
+    def start(self):
+        for index in range(self.processes):
+            self._spawn(index)
+        for index in range(self.processes):
+            self._wait_ready(index)
+        threading.Thread(target=self._supervise, name="inference-supervisor", daemon=True).start()
+        return self
+
+    def _healthy(self, index):
+        process = self._servers[index]
+        if not process.is_alive():
+            return False
+        if not os.path.exists(socket_path(index, self.directory)):
+            # Still loading the model after a respawn, unless that's taking too long
+            return time.monotonic() - self._spawned_at[index] < INFERENCE_LOAD_TIMEOUT
+        status = _ping(index)
+        if status is None:
+            return False
+        busy_since = status["busy_since"]
+        return busy_since is None or time.monotonic() - busy_since < INFERENCE_TIMEOUT
+
+    def _supervise(self):
+        while not self._stopped.wait(INFERENCE_HEALTH_INTERVAL):
+            for index in range(self.processes):
+                if self._stopped.is_set() or self._healthy(index):
+                    continue
+                print(f"Inference process {index} is unhealthy, restarting it")
+                self._servers[index].kill()
+                self._servers[index].join(5)
+                self._spawn(index)
+
+    def stop(self):
+        self._stopped.set()
+        for process in self._servers:
+            if process is not None:
+                process.terminate()
+        close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _release(block):
+    try:
+        block.close()
+    except BufferError:
+        # An array still views it; the mapping goes when the process exits
+        pass
+    try:
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class _Connection:
+    """
+    A socket to one inference process plus this caller's shared frame
+    buffer. The buffer is unlinked from /dev/shm when it's replaced, when
+    the connection is closed or garbage collected (its thread exited), and
+    at interpreter exit.
+    """
+
+    def __init__(self, index):
+        self.conn = Client(socket_path(index), family="AF_UNIX", authkey=_authkey())
+        self.block = None
+        self._finalizer = None
+
+    def buffer_for(self, nbytes):
+        if self.block is None or self.block.size < nbytes:
+            self.release_buffer()
+            # Headroom so small changes in frame size don't reallocate
+            self.block = shared_memory.SharedMemory(create=True, size=max(nbytes + nbytes // 4, 1))
+            self._finalizer = weakref.finalize(self, _release, self.block)
+        return self.block
+
+    def release_buffer(self):
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self.block = None
+
+    def close(self):
+        self.conn.close()
+        self.release_buffer()
+
+
+class InferenceClient:
+    """
+    Sends requests to the inference processes round-robin (sticky operations
+    to their session's process), moving on to the next process when one is
+    busy or unreachable (e.g. being restarted); a tracker that lands on
+    another process just starts over there.
+    Connections and their frame buffers are per thread, since a connection
+    carries one request at a time.
+    """
+
+    def __init__(self, processes=INFERENCE_PROCESSES):
+        self.processes = processes
+        self._next = itertools.count()
+        self._local = threading.local()
+        # Every thread's connections, so close() can reach them
+        self._all = weakref.WeakSet()
+
+    def _connection(self, index):
+        connections = self._local.__dict__.setdefault("connections", {})
+        if index not in connections:
+            connections[index] = _Connection(index)
+            self._all.add(connections[index])
+        return connections[index]
+
+    def close(self):
+        """Closes every thread's connections and unlinks their frame buffers."""
+        for connection in list(self._all):
+            connection.close()
+
+    def _call_one(self, index, op, image, args):
+        connection = self._connection(index)
+        block = connection.buffer_for(image.nbytes)
+        np.ndarray(image.shape, dtype=image.dtype, buffer=block.buf)[...] = image
+        connection.conn.send((op, block.name, image.shape, image.dtype.str, args))
+        status, result = connection.conn.recv()
+        if status == "shm":
+            shape, dtype = result
+            return "ok", np.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+        if status == "error":
+            raise RuntimeError(result)
+        return status, result
+
+    def call(self, op, image, *args):
+        image = np.ascontiguousarray(image)
+        if op in STICKY_OPERATIONS:
+            start = zlib.crc32(str(args[0]).encode())
+        else:
+            start = next(self._next)
+        for attempt in range(self.processes):
+            index = (start + attempt) % self.processes
+            try:
+                status, result = self._call_one(index, op, image, args)
+            except (EOFError, OSError):
+                # Drop the broken connection; the process is being replaced
+                connection = self._local.connections.pop(index, None)
+                if connection is not None:
+                    connection.close()
+                continue
+            if status == "ok":
+                return result
+        raise InferenceBusy("All inference processes are busy or unavailable")
+
+
+_client = None
+
+
+def close():
+    """Releases this process's connections to the pool (and their shared memory)."""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def call(op, image, *args):
+    """Runs a segmentation operation on a frame, in the inference pool if configured."""
+    global _client
+    if INFERENCE_PROCESSES <= 0:
+        return _run(op, image, *args)
+    if _client is None:
+        _client = InferenceClient()
+    return _client.call(op, image, *args)
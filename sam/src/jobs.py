@@ -0,0 +1,305 @@
+"""
+Background jobs for long-running analyses (a full diagnosis transcript).
+
+Submitting answers at once with a job id; the analysis runs on a worker
+task and its result is written to a SQLite file, where any API worker
+process can read it back by id. Job ids are content keys (endpoint, organ
+and image bytes), so a client retrying after a rerun or a dropped
+connection gets the same job, finished or still running, instead of
+paying for the model call again.
+
+    job = await runner.submit(job_id, "describe", organ, lambda: analyse(...))
+    job = await runner.wait(job_id, timeout=25)  # {"id", "status", "result", ...}
+"""
+import asyncio
+import contextvars
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+# Shared by every API worker on the host
+JOBS_DB = os.getenv("JOBS_DB", "jobs.sqlite3")
+
+# Jobs run at once per API worker (model calls still go through admission)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# Finished jobs are kept this long (seconds)
+JOB_TTL = float(os.getenv("JOB_TTL", str(24 * 3600)))
+
+# A queued or running job not updated for this long is taken to be lost
+# (its worker restarted): it's reported failed, and run again when
+# resubmitted. Workers refresh their live jobs well within this window.
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "600"))
+JOB_HEARTBEAT = JOB_STALE_AFTER / 4
+
+# Attempts per job when the model is at capacity (HTTP 429/503)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+
+# Hosts finished jobs may be POSTed to (comma-separated). Unset, a callback
+# is accepted only if its host resolves to public addresses alone
+JOB_CALLBACK_HOSTS = {host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()}
+
+RETRY_STATUSES = (429, 503)
+
+# Statuses a job doesn't leave
+FINISHED = ("done", "failed")
+
+
+class JobStore:
+    """Job status and results in a SQLite file, safe to share between threads and processes."""
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @property
+    def _db(self):
+        # Opened on first use in each process: a connection must not cross a fork
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT, target TEXT, status TEXT, result TEXT, error TEXT, "
+                "callback_url TEXT, created REAL, updated REAL, session TEXT)"
+            )
+            # Files written before jobs recorded their scan session
+            if "session" not in {column[1] for column in self._conn.execute("PRAGMA table_info(jobs)")}:
+                try:
+                    self._conn.execute("ALTER TABLE jobs ADD COLUMN session TEXT")
+                except sqlite3.OperationalError:
+                    pass  # another worker added it first
+            self._pid = os.getpid()
+        return self._conn
+
+    def _row(self, job_id):
+        row = self._db.execute(
+            "SELECT id, kind, target, status, result, error, callback_url, created, updated, session FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("id", "kind", "target", "status", "result", "error", "callback_url", "created", "updated", "session")
+        job = dict(zip(keys, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get(self, job_id):
+        """The job, marked failed first if it's unfinished and stale (its worker is gone)."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ? "
+                "WHERE id = ? AND status IN ('queued', 'running') AND updated < ?",
+                (f"Job lost: not updated for {JOB_STALE_AFTER:.0f}s; submit it again", now, job_id, now - JOB_STALE_AFTER),
+            )
+            return self._row(job_id)
+
+    def touch(self, job_ids):
+        """Marks these unfinished jobs as still being worked on."""
+        with self._lock:
+            self._db.executemany(
+                "UPDATE jobs SET updated = ? WHERE id = ? AND status IN ('queued', 'running')",
+                [(time.time(), job_id) for job_id in job_ids],
+            )
+
+    def claim(self, job_id, kind, target, callback_url=None, session=""):
+        """
+        Returns (job, created). The job is (re)created as queued unless it
+        already exists and is done or still being worked on; only a created
+        job should be run. A callback_url is attached to an existing job only
+        if it has none and was created by the same scan session.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._row(job_id)
+                stale = job is not None and job["status"] not in FINISHED and job["updated"] < now - JOB_STALE_AFTER
+                created = job is None or job["status"] == "failed" or stale
+                if created:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO jobs (id, kind, target, status, callback_url, created, updated, session) "
+                        "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                        (job_id, kind, target, callback_url, now, now, session),
+                    )
+                elif callback_url and not job["callback_url"] and session and job["session"] == session:
+                    self._db.execute("UPDATE jobs SET callback_url = ? WHERE id = ?", (callback_url, job_id))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return self._row(job_id), created
+
+    def update(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def purge(self, ttl=JOB_TTL):
+        """Drops jobs finished more than ttl seconds ago."""
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (time.time() - ttl,))
+
+
+def public(job):
+    """A job as returned to clients."""
+    return {key: job[key] for key in ("id", "kind", "target", "status", "result", "error", "created", "updated")}
+
+
+def callback_allowed(url):
+    """
+    True if finished jobs may be POSTed to url: an http(s) URL whose host is
+    in JOB_CALLBACK_HOSTS or, with no allowlist, resolves only to public
+    addresses (never loopback, private, link-local, reserved or multicast).
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return False
+    if JOB_CALLBACK_HOSTS:
+        return parts.hostname.lower() in JOB_CALLBACK_HOSTS
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or 0, proto=socket.IPPROTO_TCP)
+    except (OSError, UnicodeError, ValueError):
+        return False
+    addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    return bool(addresses) and all(address.is_global and not address.is_multicast for address in addresses)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect could lead the callback to a host that was never checked
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def notify(url, job):
+    """POSTs the finished job as JSON to the client's callback URL, if it's still an allowed one."""
+    if not callback_allowed(url):
+        print(f"Job {job['id']}: callback to {url} refused")
+        return
+    request = urllib.request.Request(
+        url, data=json.dumps(public(job)).encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        urllib.request.build_opener(_NoRedirect).open(request, timeout=10).close()
+    except Exception as e:
+        print(f"Job {job['id']}: callback to {url} failed: {e}")
+
+
+class JobRunner:
+    """
+    Runs submitted jobs on a fixed number of worker tasks. Each job runs in
+    the context it was submitted from, so its stage metrics, preset and
+    trace span carry over from the submitting request. While this runner
+    holds a job (queued or running) it keeps the job's update time fresh,
+    so only a job whose runner is gone goes stale.
+    """
+
+    def __init__(self, store, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS, heartbeat=JOB_HEARTBEAT):
+        self.store = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.heartbeat = heartbeat
+        self._queue = None
+        self._tasks = []
+        self._held = set()
+
+    def start(self):
+        """Starts the worker tasks on the running event loop (once; later calls do nothing)."""
+        if self._tasks:
+            return self
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._beat()))
+        self.store.purge()
+        return self
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job_id, kind, target, fn, callback_url=None, session=""):
+        """
+        Queues fn (a coroutine function taking no arguments) as the job, unless
+        a job with this id is already finished or in progress. Returns the job.
+        Starts the workers first if nothing has (an app run without its
+        startup hooks, e.g. under a test client or ASGI transport).
+        """
+        if not self._tasks:
+            self.start()
+        job, created = await asyncio.to_thread(self.store.claim, job_id, kind, target, callback_url, session)
+        if created:
+            self._held.add(job_id)
+            self._queue.put_nowait((job_id, fn, contextvars.copy_context()))
+        elif callback_url and job["status"] in FINISHED:
+            asyncio.create_task(asyncio.to_thread(notify, callback_url, job))
+        return public(job)
+
+    async def get(self, job_id):
+        """The job, or None if unknown; a lost job is reported failed."""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        return public(job) if job is not None else None
+
+    async def wait(self, job_id, timeout=0.0, interval=0.5):
+        """The job once it's finished (or lost), or as it stands after timeout seconds; None if unknown."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+
+    async def _run(self, job_id, fn, context):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await asyncio.create_task(fn(), context=context)
+            except Exception as e:
+                status = getattr(e, "status_code", None)
+                if status not in RETRY_STATUSES or attempt == self.max_attempts:
+                    raise
+                # The model is at capacity: wait as advised, then try again
+                headers = getattr(e, "headers", None) or {}
+                await asyncio.sleep(float(headers.get("Retry-After", attempt)))
+                await asyncio.to_thread(self.store.update, job_id, "running")
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            try:
+                if self._held:
+                    await asyncio.to_thread(self.store.touch, list(self._held))
+            except Exception as e:
+                print(f"Job heartbeat failed: {e}")
+
+    async def _work(self):
+        while True:
+            job_id, fn, context = await self._queue.get()
+            try:
+                await asyncio.to_thread(self.store.update, job_id, "running")
+                try:
+                    result = await self._run(job_id, fn, context)
+                    await asyncio.to_thread(self.store.update, job_id, "done", result)
+                except Exception as e:
+                    detail = getattr(e, "detail", None) or str(e)
+                    print(f"Job {job_id} failed: {detail}")
+                    await asyncio.to_thread(self.store.update, job_id, "failed", None, str(detail))
+
+                job = await asyncio.to_thread(self.store.get, job_id)
+                if job is not None and job["callback_url"]:
+                    await asyncio.to_thread(notify, job["callback_url"], job)
+            except Exception as e:
+                print(f"Job {job_id}: {e}")
+            finally:
+                self._held.discard(job_id)
+                self._queue.task_done()
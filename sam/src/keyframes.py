@@ -0,0 +1,213 @@
+import heapq
+import math
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+from src import imaging
+
+
+# Frames are scored on a small grayscale copy; a few ms per frame at most
+SCORE_WIDTH = 160
+
+# How many of the best-scoring frames are kept for the final pick
+KEYFRAME_CANDIDATES = int(os.getenv("KEYFRAME_CANDIDATES", "3"))
+
+# Upper bound on frames read from one clip, and the stride for video files
+MAX_CLIP_FRAMES = int(os.getenv("MAX_CLIP_FRAMES", "600"))
+VIDEO_FRAME_STRIDE = int(os.getenv("VIDEO_FRAME_STRIDE", "2"))
+
+MOTION_WEIGHT = float(os.getenv("KEYFRAME_MOTION_WEIGHT", "1.0"))
+MASK_WEIGHT = float(os.getenv("KEYFRAME_MASK_WEIGHT", "2.0"))
+
+JPEG_SOI = b"\xff\xd8"
+
+# Markers that stand alone, without a length field: TEM and RST0-7
+STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+START_OF_SCAN = 0xDA
+
+
+def _score_image(gray):
+    height, width = gray.shape
+    size = (SCORE_WIDTH, max(1, round(height * SCORE_WIDTH / width)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def sharpness(small):
+    """Variance of the Laplacian: high for crisp speckle, low for blurred frames."""
+    return float(cv2.Laplacian(small, cv2.CV_32F).var())
+
+
+def motion(small, previous):
+    """Mean absolute difference from the previous frame: low when the probe is held still."""
+    if previous is None or previous.shape != small.shape:
+        return 0.0
+    return float(np.mean(np.abs(small - previous)))
+
+
+class KeyframeSelector:
+    """
+    Scores frames as they arrive and keeps only the best few candidates, so a
+    clip or stream of any length is processed in bounded memory.
+
+    The cheap score favours sharp frames taken while the probe was steady.
+    best() can re-rank the surviving candidates with an expensive scorer
+    (SAM2 mask coverage) that would be too slow to run on every frame.
+    """
+
+    def __init__(self, candidates=KEYFRAME_CANDIDATES):
+        self.candidates = candidates
+        self.count = 0
+        self._heap = []
+        self._previous = None
+
+    def add(self, frame):
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = _score_image(gray)
+        scores = {"sharpness": sharpness(small), "motion": motion(small, self._previous)}
+        scores["score"] = math.log1p(scores["sharpness"]) - MOTION_WEIGHT * math.log1p(scores["motion"])
+        self._previous = small
+
+        # Min-heap on score: the weakest candidate is the one dropped
+        entry = (scores["score"], self.count, frame, scores)
+        if len(self._heap) < self.candidates:
+            heapq.heappush(self._heap, entry)
+        elif entry[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+        self.count += 1
+
+    def add_encoded(self, data):
+        frame = imaging.decode_frame(data)
+        if frame is not None:
+            self.add(frame)
+
+    def best(self, k=1, mask_scorer=None):
+        """
+        Returns up to k keyframes, best first, as dicts with index, frame and scores.
+        mask_scorer(frame) -> coverage in [0, 1] is applied to the candidates only.
+        """
+        keyframes = []
+        for score, index, frame, scores in self._heap:
+            scores = dict(scores)
+            if mask_scorer is not None:
+                scores["mask_coverage"] = float(mask_scorer(frame))
+                scores["score"] = score + MASK_WEIGHT * scores["mask_coverage"]
+            keyframes.append({"index": index, "frame": frame, "scores": scores})
+        keyframes.sort(key=lambda keyframe: keyframe["scores"]["score"], reverse=True)
+        return keyframes[:k]
+
+
+# Helper function to find where the JPEG starting at `start` ends
+def jpeg_end(buffer, start):
+    """
+    Walks the JPEG's segments from its SOI at `start` and returns the offset
+    just past its EOI, None if the buffer ends first, or -1 if the bytes
+    aren't a well-formed JPEG. Marker segments are skipped by their length
+    fields, so an EXIF thumbnail (a whole JPEG inside APP1) doesn't end the
+    frame early; only entropy-coded scan data is searched for markers.
+    """
+    pos, size = start + 2, len(buffer)
+    while True:
+        if pos >= size:
+            return None
+        if buffer[pos] != 0xFF:
+            return -1
+        while pos < size and buffer[pos] == 0xFF:  # fill bytes
+            pos += 1
+        if pos >= size:
+            return None
+        marker = buffer[pos]
+        pos += 1
+        if marker == 0xD9:
+            return pos
+        if marker in STANDALONE_MARKERS:
+            continue
+        if pos + 2 > size:
+            return None
+        length = (buffer[pos] << 8) | buffer[pos + 1]
+        if length < 2:
+            return -1
+        pos += length
+        if marker != START_OF_SCAN:
+            continue
+        # Scan data runs to the next marker that isn't a stuffed 0xFF00 or a restart
+        while True:
+            pos = buffer.find(b"\xff", pos)
+            if pos < 0 or pos + 1 >= size:
+                return None
+            following = buffer[pos + 1]
+            if following == 0x00 or 0xD0 <= following <= 0xD7 or following == 0xFF:
+                pos += 1 if following == 0xFF else 2
+                continue
+            break
+
+
+class MJPEGSplitter:
+    """
+    Splits an MJPEG byte stream (concatenated JPEGs, with or without
+    multipart boundaries between them) into individual JPEG frames as
+    chunks arrive. Each frame is cut at its own EOI, found by walking its
+    segments rather than at the first EOI bytes after its SOI.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        frames = []
+        while True:
+            start = self._buffer.find(JPEG_SOI)
+            if start < 0:
+                # Keep a trailing 0xff in case it's the first half of a marker
+                del self._buffer[:max(0, len(self._buffer) - 1)]
+                break
+            end = jpeg_end(self._buffer, start)
+            if end is None:
+                del self._buffer[:start]
+                break
+            if end < 0:
+                # Not a frame after all (stray SOI bytes): look past them
+                del self._buffer[:start + 2]
+                continue
+            frames.append(bytes(self._buffer[start:end]))
+            del self._buffer[:end]
+        return frames
+
+
+def iter_video_frames(data, stride=VIDEO_FRAME_STRIDE, max_frames=MAX_CLIP_FRAMES):
+    """Yields decoded frames from a video file's bytes (anything OpenCV/FFmpeg can read)."""
+    # VideoCapture needs a path, so the clip is spooled to a temporary file
+    with tempfile.NamedTemporaryFile(suffix=".clip") as f:
+        f.write(data)
+        f.flush()
+        capture = cv2.VideoCapture(f.name)
+        try:
+            index, yielded = 0, 0
+            while yielded < max_frames:
+                ok = capture.grab()
+                if not ok:
+                    break
+                if index % stride == 0:
+                    ok, frame = capture.retrieve()
+                    if not ok:
+                        break
+                    if imaging.GRAYSCALE_FRAMES and imaging.is_grayscale(frame):
+                        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    yield frame
+                    yielded += 1
+                index += 1
+        finally:
+            capture.release()
+
+
+def add_clip(selector, data, max_frames=MAX_CLIP_FRAMES):
+    """Feeds every frame of an MJPEG or video clip into the selector."""
+    if data[:2] == JPEG_SOI:
+        for jpeg in MJPEGSplitter().feed(data)[:max_frames]:
+            selector.add_encoded(jpeg)
+    else:
+        for frame in iter_video_frames(data, max_frames=max_frames):
+            selector.add(frame)
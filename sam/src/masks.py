@@ -0,0 +1,119 @@
+import os
+
+import numpy as np
+
+
+# Automatic mask generation can return dozens of full-resolution boolean
+# masks per frame (about 0.3 MB each at 640x480). Only the best few are
+# kept, each bit-packed within its bounding box, and decoded back to a
+# dense array only when a caller actually asks for the pixels.
+
+# How many masks to keep per frame, best predicted IoU first
+MASK_TOP_K = int(os.getenv("MASK_TOP_K", "8"))
+
+
+class PackedMask:
+    """
+    A binary mask stored as the packed bits of its bounding-box crop, with
+    SAM2's metadata. Supports mask["key"] lookups like the dicts SAM2
+    returns; mask["segmentation"] decodes a fresh dense array each time.
+    """
+
+    __slots__ = ("shape", "box", "bits", "area", "predicted_iou", "stability_score")
+
+    def __init__(self, shape, box, bits, area, predicted_iou=0.0, stability_score=0.0):
+        self.shape = shape
+        self.box = box  # (x0, y0, x1, y1), exclusive end
+        self.bits = bits
+        self.area = area
+        self.predicted_iou = predicted_iou
+        self.stability_score = stability_score
+
+    @classmethod
+    def from_dense(cls, mask, predicted_iou=0.0, stability_score=0.0):
+        mask = np.asarray(mask, dtype=bool)
+        ys = np.flatnonzero(mask.any(axis=1))
+        xs = np.flatnonzero(mask.any(axis=0))
+        if not len(xs):
+            return cls(mask.shape, (0, 0, 0, 0), np.empty(0, dtype=np.uint8), 0, predicted_iou, stability_score)
+        box = (int(xs[0]), int(ys[0]), int(xs[-1]) + 1, int(ys[-1]) + 1)
+        crop = mask[box[1]:box[3], box[0]:box[2]]
+        return cls(mask.shape, box, np.packbits(crop), int(crop.sum()), predicted_iou, stability_score)
+
+    @property
+    def bbox(self):
+        """SAM2's [x, y, width, height] form of the bounding box."""
+        x0, y0, x1, y1 = self.box
+        return [x0, y0, x1 - x0, y1 - y0]
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def crop(self):
+        """The dense mask within its bounding box only."""
+        x0, y0, x1, y1 = self.box
+        count = (y1 - y0) * (x1 - x0)
+        return np.unpackbits(self.bits, count=count).view(bool).reshape(y1 - y0, x1 - x0)
+
+    def dense(self):
+        """The full-frame boolean mask."""
+        mask = np.zeros(self.shape, dtype=bool)
+        x0, y0, x1, y1 = self.box
+        mask[y0:y1, x0:x1] = self.crop()
+        return mask
+
+    def __getitem__(self, key):
+        if key == "segmentation":
+            return self.dense()
+        if key in ("area", "bbox", "predicted_iou", "stability_score"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+
+def compact(masks, top_k=MASK_TOP_K):
+    """
+    The top_k of SAM2's mask dicts by predicted IoU (then stability), as
+    PackedMasks. The dense arrays can be freed as soon as this returns.
+    """
+    ranked = sorted(masks, key=lambda m: (m["predicted_iou"], m["stability_score"]), reverse=True)
+    return [
+        PackedMask.from_dense(m["segmentation"], float(m["predicted_iou"]), float(m["stability_score"]))
+        for m in ranked[:top_k]
+    ]
+
+
+def black_out(image, mask):
+    """
+    Zeroes everything outside the mask, in place, and returns image. Only
+    the mask's bounding box is decoded; the rest is zeroed through slices.
+    """
+    if not isinstance(mask, PackedMask):
+        image[~np.asarray(mask, dtype=bool)] = 0
+        return image
+    x0, y0, x1, y1 = mask.box
+    image[:y0] = 0
+    image[y1:] = 0
+    image[y0:y1, :x0] = 0
+    image[y0:y1, x1:] = 0
+    image[y0:y1, x0:x1][~mask.crop()] = 0
+    return image
+
+
+def overlay(image, mask, color=(0, 255, 0), alpha=0.4):
+    """
+    Tints the mask's pixels towards color, in place, and returns image. A
+    grayscale frame is tinted in intensity only. Pixels outside the mask's
+    bounding box are never touched.
+    """
+    if not isinstance(mask, PackedMask):
+        mask = PackedMask.from_dense(mask)
+    x0, y0, x1, y1 = mask.box
+    region = image[y0:y1, x0:x1]  # a view, so writes land in image
+    inside = mask.crop()
+    tint = np.asarray(color, dtype=np.float32)
+    if image.ndim == 2:
+        tint = tint.mean()
+    pixels = region[inside].astype(np.float32)
+    region[inside] = (pixels * (1 - alpha) + tint * alpha).astype(image.dtype)
+    return image
@@ -0,0 +1,143 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Endpoint being served, set once per request so helpers deep in the
+# pipeline (and the worker threads they run in) can label their stage timings.
+current_endpoint = ContextVar("current_endpoint", default="other")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+def render():
+    """Returns every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+BYTE_BUCKETS = (16e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6)
+
+REQUESTS = Counter("space_triage_requests_total", "Requests served, by endpoint and HTTP status.", ["endpoint", "status"])
+ERRORS = Counter("space_triage_request_errors_total", "Requests that ended in a 5xx or an unhandled exception.", ["endpoint"])
+REQUEST_LATENCY = Histogram("space_triage_request_duration_seconds", "End-to-end request latency.", ["endpoint"], LATENCY_BUCKETS)
+STAGE_LATENCY = Histogram("space_triage_stage_duration_seconds", "Latency of each pipeline stage (decode, encode, model_call, serialize).", ["endpoint", "stage"], LATENCY_BUCKETS)
+IN_FLIGHT = Gauge("space_triage_requests_in_flight", "Requests currently being served.", ["endpoint"])
+IMAGE_BYTES = Histogram("space_triage_image_bytes", "Image payload sizes, as uploaded and as sent to the model.", ["endpoint", "direction"], BYTE_BUCKETS)
+MODEL_TOKENS = Counter("space_triage_model_tokens_total", "Model token usage.", ["endpoint", "model", "type"])
+ADMISSION_RUNNING = Gauge("space_triage_admission_running", "Model calls currently holding an admission slot.")
+ADMISSION_QUEUED = Gauge("space_triage_admission_queued", "Requests waiting for an admission slot.")
+FRAME_GATE = Counter("space_triage_frame_gate_total", "Frames analysed vs. answered from the previous result because they hadn't changed.", ["endpoint", "outcome"])
+QUALITY_REJECTED = Counter("space_triage_quality_rejected_total", "Frames answered with an adjustment instead of being analysed, by the most important adjustment.", ["endpoint", "adjustment"])
+
+
+@contextmanager
+def stage(name):
+    """Times a pipeline stage for the endpoint currently being served."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - started, endpoint=current_endpoint.get(), stage=name)
+
+
+def observe_image_bytes(direction, size):
+    IMAGE_BYTES.observe(size, endpoint=current_endpoint.get(), direction=direction)
+
+
+def observe_usage(model, usage):
+    """Records input/output tokens from an Anthropic response's usage block."""
+    if usage is None:
+        return
+    endpoint = current_endpoint.get()
+    MODEL_TOKENS.inc(getattr(usage, "input_tokens", 0) or 0, endpoint=endpoint, model=model, type="input")
+    MODEL_TOKENS.inc(getattr(usage, "output_tokens", 0) or 0, endpoint=endpoint, model=model, type="output")
@@ -1,3 +1,9 @@
+import os
+import threading
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Optional
+
 import torch
 import numpy as np
 from PIL import Image
@@ -6,29 +12,182 @@ from sam2.build_sam import build_sam2
 from sam2.sam2_image_predictor import SAM2ImagePredictor
 from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
 
-# Load the model and predictor
-checkpoint = "finetuned_models/sam2_hiera_small.pt"
-model_cfg = "../sam2/configs/sam2/sam2_hiera_s.yaml"
-predictor = SAM2AutomaticMaskGenerator(build_sam2(model_cfg, checkpoint))
+from src import masks as packed_masks, organ_profiles
+from src.imaging import to_model_rgb
+from src.weights import load_weights
+
+# Model checkpoint and config (paths relative to the working directory)
+checkpoint = os.getenv("SAM2_CHECKPOINT", "finetuned_models/sam2_hiera_small.pt")
+model_cfg = os.getenv("SAM2_CONFIG", "../sam2/configs/sam2/sam2_hiera_s.yaml")
+
+# The same weights converted by src/weights.py; memory-mapped when present
+weights = os.getenv("SAM2_WEIGHTS", os.path.splitext(checkpoint)[0] + ".safetensors")
+
+# "torch" runs the checkpoint above; "onnx" runs the graphs exported from it
+# by src/onnx_export.py, at fp32 or int8 precision
+runtime = os.getenv("SEGMENTATION_RUNTIME", "torch")
+onnx_dir = os.getenv("SAM2_ONNX_DIR", "finetuned_models/onnx")
+onnx_precision = os.getenv("SAM2_ONNX_PRECISION", "int8")
+
+
+@lru_cache(maxsize=1)
+def load_sam():
+    """
+    Build SAM2 once per process. On CPU the weights are memory-mapped from
+    the safetensors file if it exists, so loading is near-instant and
+    processes share the pages; otherwise the .pt checkpoint is unpickled.
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cpu" and os.path.exists(weights):
+        return load_weights(build_sam2(model_cfg, None, device=device), weights).eval()
+    return build_sam2(model_cfg, checkpoint, device=device)
+
+
+@lru_cache(maxsize=1)
+def load_mask_generator():
+    """Load the model and predictor once per process, on first use."""
+    if runtime == "onnx":
+        # Imported here so onnxruntime is only needed when it's selected
+        from src.onnx_engine import OnnxSegmenter
+        return OnnxSegmenter(onnx_dir, onnx_precision)
+    return SAM2AutomaticMaskGenerator(load_sam())
+
+
+# SAM2ImagePredictor keeps the last encoded frame, so one frame at a time
+_predictor_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def load_predictor():
+    """Prompted predictor over the same model, for organ-specific masks."""
+    if runtime == "onnx":
+        # The ONNX segmenter takes prompts directly
+        return load_mask_generator()
+    return SAM2ImagePredictor(load_sam())
+
+
+@lru_cache(maxsize=None)
+def load_grid_generator(points_per_side):
+    """Automatic mask generation on a coarser grid, one generator per grid size."""
+    return SAM2AutomaticMaskGenerator(load_sam(), points_per_side=points_per_side)
+
+
+def autocast():
+    """bfloat16 autocast on GPU; on CPU-only nodes it would do nothing useful, so it's skipped."""
+    if torch.cuda.is_available():
+        return torch.autocast("cuda", dtype=torch.bfloat16)
+    return nullcontext()
+
 
-# Load your image (as a NumPy array or PIL Image, convert to RGB if needed)
-your_image = Image.open("../heart_ultrasound__96373.png").convert("RGB")
-image_np = np.array(your_image)
+def segment(image: np.ndarray) -> list[packed_masks.PackedMask]:
+    """
+    Run automatic mask generation on a frame.
+    image: a 2D grayscale or HxWx3 BGR uint8 array. Grayscale frames are only
+    expanded to 3 channels (as a broadcast view) at the model boundary.
+    Returns the best MASK_TOP_K masks, bit-packed, best predicted IoU first.
+    """
+    predictor = load_mask_generator()
+    if runtime == "onnx":
+        return predictor.generate(image)
+    with torch.inference_mode(), autocast():
+        return packed_masks.compact(predictor.generate(to_model_rgb(image)))
 
-# Run prediction
-with torch.inference_mode(), torch.autocast("cuda", dtype=torch.bfloat16):
-    masks = predictor.generate(image_np)
-    
 
-# Convert mask to uint8 and apply
-mask = masks[0] # Use the first mask
-mask = mask["segmentation"]
-masked_image = image_np.copy()
-masked_image[mask == 0] = 0  # Black out background
+def prompted_masks(image: np.ndarray, profiles: dict) -> dict[str, tuple[np.ndarray, float]]:
+    """
+    For each {name: profile}, the best of SAM2's candidate masks for the
+    profile's point and box prompts, and its score. The frame is encoded
+    once; only the prompt decoder runs per profile.
+    """
+    height, width = image.shape[:2]
+    predictor = load_predictor()
+    results = {}
+    if runtime == "onnx":
+        features = predictor.encode(image)
+        for name, profile in profiles.items():
+            points, labels, box = organ_profiles.prompts(profile, width, height)
+            # Box corners are prompted as points labelled 2 and 3
+            points = np.concatenate([points, box.reshape(2, 2)])
+            labels = np.concatenate([labels, [2, 3]])
+            results[name] = predictor.predict(image, points, labels, features=features)
+        return results
+
+    with _predictor_lock, torch.inference_mode(), autocast():
+        predictor.set_image(to_model_rgb(image))
+        for name, profile in profiles.items():
+            points, labels, box = organ_profiles.prompts(profile, width, height)
+            masks, scores, _ = predictor.predict(
+                point_coords=points,
+                point_labels=labels,
+                box=box,
+                multimask_output=True,
+            )
+            best = int(np.argmax(scores))
+            results[name] = (masks[best] > 0, float(scores[best]))
+    return results
+
+
+def segment_organ(image: np.ndarray, organ: str) -> Optional[np.ndarray]:
+    """
+    Boolean mask of the organ, prompted with its profile's priors (see
+    src/organ_profiles.py) so SAM2 decodes one prompt instead of a dense
+    grid. If the prompted mask scores low or has an implausible size, masks
+    are generated on the profile's reduced grid and the one matching the
+    priors is taken. None if nothing fits, or the organ has no profile.
+    """
+    profile = organ_profiles.get_profile(organ)
+    if profile is None:
+        return None
+    height, width = image.shape[:2]
+
+    mask, score = prompted_masks(image, {organ: profile})[organ]
+    if score >= organ_profiles.PROMPT_MIN_SCORE and organ_profiles.plausible(profile, mask.mean()):
+        return mask
+
+    if runtime == "onnx":
+        masks = load_mask_generator().generate(image, points_per_side=profile["points_per_side"])
+    else:
+        with torch.inference_mode(), autocast():
+            masks = packed_masks.compact(load_grid_generator(profile["points_per_side"]).generate(to_model_rgb(image)))
+    best = organ_profiles.pick_from_grid(profile, masks, width, height)
+    return best["segmentation"] if best is not None else None
+
+
+def track_mask(image: np.ndarray, session: str, organ: str) -> Optional[np.ndarray]:
+    """The organ's mask, tracked across the scan session's frames (see src/tracking.py)."""
+    # Imported here since src.tracking builds on this module
+    from src import tracking
+    return tracking.track_mask(image, session, organ)
+
+
+def mask_coverage(image: np.ndarray) -> float:
+    """Fraction of the frame covered by the highest-confidence mask (0 if none)."""
+    masks = segment(image)
+    if not masks:
+        return 0.0
+    return masks[0].area / float(image.shape[0] * image.shape[1])
+
+
+def target_mask(image: np.ndarray, organ: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Boolean segmentation of the organ if it has a profile, otherwise of the
+    highest-confidence mask in the frame; None if there is none.
+    """
+    if organ_profiles.get_profile(organ) is not None:
+        return segment_organ(image, organ)
+    masks = segment(image)
+    if not masks:
+        return None
+    return masks[0].dense()
+
+
+def apply_mask(image: np.ndarray, mask, copy: bool = True) -> np.ndarray:
+    """
+    Returns image with everything outside the mask (dense or PackedMask)
+    blacked out; a copy unless copy=False, which writes into image.
+    """
+    return packed_masks.black_out(image.copy() if copy else image, mask)
 
-# Save the masked image
-result = Image.fromarray(masked_image)
-result.save("masked_output.png")
 
 def mask_centroid(mask: np.ndarray) -> tuple[int,int]:
     """mask: a binary 2D array where heart pixels=1. 
@@ -38,4 +197,20 @@ def mask_centroid(mask: np.ndarray) -> tuple[int,int]:
         # fallback to image center
         h, w = mask.shape
         return w//2, h//2
-    return int(np.mean(xs)), int(np.mean(ys))
\ No newline at end of file
+    return int(np.mean(xs)), int(np.mean(ys))
+
+
+if __name__ == "__main__":
+    # Run from sam/: python -m src.model
+    # Load your image as single-channel; it's expanded for the model only
+    your_image = Image.open("../heart_ultrasound__96373.png").convert("L")
+    image_np = np.array(your_image)
+
+    # Run prediction, prompted with the heart's priors
+    mask = segment_organ(image_np, "heart")
+    if mask is None:
+        raise SystemExit("No heart mask found")
+
+    # Apply the mask
+    result = Image.fromarray(apply_mask(image_np, mask, copy=False))
+    result.save("masked_output.png")
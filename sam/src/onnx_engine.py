@@ -0,0 +1,156 @@
+import os
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from src.masks import MASK_TOP_K, PackedMask
+
+
+# SAM2 works on a 1024x1024 input; the decoder's low-res masks are 256x256
+INPUT_SIZE = 1024
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32) * 255
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32) * 255
+
+# Automatic mode: a points_per_side x points_per_side grid of single-point
+# prompts, filtered like SAM2AutomaticMaskGenerator's defaults
+POINTS_PER_SIDE = int(os.getenv("ONNX_POINTS_PER_SIDE", "16"))
+POINTS_PER_BATCH = int(os.getenv("ONNX_POINTS_PER_BATCH", "64"))
+PRED_IOU_THRESH = float(os.getenv("ONNX_PRED_IOU_THRESH", "0.8"))
+STABILITY_SCORE_THRESH = float(os.getenv("ONNX_STABILITY_SCORE_THRESH", "0.95"))
+STABILITY_SCORE_OFFSET = 1.0
+BOX_NMS_THRESH = 0.7
+
+# 0 lets ONNX Runtime pick (all cores); set per process in the inference pool
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+
+def model_paths(onnx_dir, precision):
+    """Encoder and decoder file paths for a precision ("fp32" or "int8")."""
+    suffix = "" if precision == "fp32" else f".{precision}"
+    return (
+        os.path.join(onnx_dir, f"sam2_encoder{suffix}.onnx"),
+        os.path.join(onnx_dir, f"sam2_decoder{suffix}.onnx"),
+    )
+
+
+def _box_iou(box, boxes):
+    x0 = np.maximum(box[0], boxes[:, 0])
+    y0 = np.maximum(box[1], boxes[:, 1])
+    x1 = np.minimum(box[2], boxes[:, 2])
+    y1 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-6)
+
+
+def _box_nms(boxes, scores, threshold):
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        order = order[1:][_box_iou(boxes[best], boxes[order[1:]]) <= threshold]
+    return keep
+
+
+def _mask_box(mask):
+    ys = np.flatnonzero(mask.any(axis=1))
+    xs = np.flatnonzero(mask.any(axis=0))
+    if not len(xs):
+        return np.zeros(4, dtype=np.float32)
+    return np.array([xs[0], ys[0], xs[-1] + 1, ys[-1] + 1], dtype=np.float32)
+
+
+class OnnxSegmenter:
+    """
+    SAM2 on ONNX Runtime: the image encoder and the prompt/mask decoder are
+    two separate graphs (see src/onnx_export.py), so one encoder pass serves
+    any number of decoder prompts.
+
+    generate() returns what model.segment does for SAM2AutomaticMaskGenerator
+    (the best MASK_TOP_K masks as PackedMasks, best first), on a coarser
+    point grid, so the rest of model.py works unchanged.
+    """
+
+    def __init__(self, onnx_dir, precision="fp32", threads=ONNX_THREADS):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        encoder_path, decoder_path = model_paths(onnx_dir, precision)
+        providers = ["CPUExecutionProvider"]
+        self.encoder = ort.InferenceSession(encoder_path, options, providers=providers)
+        self.decoder = ort.InferenceSession(decoder_path, options, providers=providers)
+
+    def encode(self, image):
+        """Image features for a grayscale or BGR uint8 frame."""
+        rgb = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB if image.ndim == 2 else cv2.COLOR_BGR2RGB)
+        resized = cv2.resize(rgb, (INPUT_SIZE, INPUT_SIZE), interpolation=cv2.INTER_LINEAR)
+        tensor = ((resized.astype(np.float32) - MEAN) / STD).transpose(2, 0, 1)[None]
+        image_embed, high_res_0, high_res_1 = self.encoder.run(None, {"image": np.ascontiguousarray(tensor)})
+        return {"image_embed": image_embed, "high_res_feats_0": high_res_0, "high_res_feats_1": high_res_1}
+
+    def decode(self, features, point_coords, point_labels):
+        """
+        Low-res mask logits (B, 3, 256, 256) and predicted IoUs (B, 3) for B
+        prompts. point_coords are (B, N, 2) in the 1024x1024 input frame.
+        """
+        return self.decoder.run(None, {
+            **features,
+            "point_coords": point_coords.astype(np.float32),
+            "point_labels": point_labels.astype(np.float32),
+        })
+
+    def predict(self, image, points, labels, features=None):
+        """
+        Best mask for one prompt of points in frame pixel coordinates
+        (labels: 1 foreground, 0 background, 2/3 top-left/bottom-right box
+        corners). Returns (mask, predicted_iou).
+        """
+        height, width = image.shape[:2]
+        features = features or self.encode(image)
+        coords = np.asarray(points, dtype=np.float32) * [INPUT_SIZE / width, INPUT_SIZE / height]
+        logits, iou = self.decode(features, coords[None], np.asarray(labels, dtype=np.float32)[None])
+        best = int(np.argmax(iou[0]))
+        mask = cv2.resize(logits[0, best], (width, height), interpolation=cv2.INTER_LINEAR) > 0
+        return mask, float(iou[0, best])
+
+    def generate(self, image, points_per_side=POINTS_PER_SIDE, top_k=MASK_TOP_K):
+        height, width = image.shape[:2]
+        features = self.encode(image)
+
+        offsets = (np.arange(points_per_side) + 0.5) / points_per_side * INPUT_SIZE
+        grid = np.stack(np.meshgrid(offsets, offsets), axis=-1).reshape(-1, 1, 2)
+
+        candidates = []
+        for start in range(0, len(grid), POINTS_PER_BATCH):
+            coords = grid[start:start + POINTS_PER_BATCH]
+            logits, iou = self.decode(features, coords, np.ones(coords.shape[:2]))
+            best = np.argmax(iou, axis=1)
+            logits = logits[np.arange(len(best)), best]
+            iou = iou[np.arange(len(best)), best]
+
+            # Stability: IoU of the mask thresholded just above and below 0
+            high = (logits > STABILITY_SCORE_OFFSET).sum(axis=(1, 2))
+            low = (logits > -STABILITY_SCORE_OFFSET).sum(axis=(1, 2))
+            stability = high / np.maximum(low, 1)
+
+            for i in np.flatnonzero((iou >= PRED_IOU_THRESH) & (stability >= STABILITY_SCORE_THRESH)):
+                candidates.append((logits[i], float(iou[i]), float(stability[i]), coords[i, 0]))
+
+        if not candidates:
+            return []
+
+        low_res = np.stack([c[0] for c in candidates]) > 0
+        boxes = np.stack([_mask_box(mask) for mask in low_res])
+        keep = _box_nms(boxes, np.array([c[1] for c in candidates]), BOX_NMS_THRESH)
+
+        # NMS keeps the best first, so only the masks kept get upscaled
+        masks = []
+        for i in keep[:top_k]:
+            logits, iou, stability, _ = candidates[i]
+            segmentation = cv2.resize(logits, (width, height), interpolation=cv2.INTER_LINEAR) > 0
+            masks.append(PackedMask.from_dense(segmentation, iou, stability))
+        return masks
@@ -0,0 +1,120 @@
+"""
+Export the fine-tuned SAM2 checkpoint to ONNX for src/onnx_engine.py: the
+image encoder and the prompt/mask decoder as separate graphs, plus int8
+dynamically quantized copies of both.
+
+Run from sam/:
+    python -m src.onnx_export --output-dir finetuned_models/onnx
+"""
+import argparse
+import os
+
+import torch
+from torch import nn
+
+from sam2.build_sam import build_sam2
+
+from src.onnx_engine import INPUT_SIZE, model_paths
+
+# Backbone feature map sizes for a 1024x1024 input, finest first
+FEATURE_SIZES = [(256, 256), (128, 128), (64, 64)]
+
+
+class EncoderWrapper(nn.Module):
+    """Image -> (image_embed, high_res_feats_0, high_res_feats_1), as SAM2ImagePredictor.set_image computes them."""
+
+    def __init__(self, sam):
+        super().__init__()
+        self.sam = sam
+
+    def forward(self, image):
+        backbone_out = self.sam.forward_image(image)
+        _, vision_feats, _, _ = self.sam._prepare_backbone_features(backbone_out)
+        if self.sam.directly_add_no_mem_embed:
+            vision_feats[-1] = vision_feats[-1] + self.sam.no_mem_embed
+        feats = [
+            feat.permute(1, 2, 0).reshape(1, -1, *size)
+            for feat, size in zip(vision_feats[::-1], FEATURE_SIZES[::-1])
+        ][::-1]
+        return feats[-1], feats[0], feats[1]
+
+
+class DecoderWrapper(nn.Module):
+    """Image features + a batch of point prompts -> (low-res mask logits, predicted IoUs), three masks per prompt."""
+
+    def __init__(self, sam):
+        super().__init__()
+        self.sam = sam
+
+    def forward(self, image_embed, high_res_feats_0, high_res_feats_1, point_coords, point_labels):
+        sparse, dense = self.sam.sam_prompt_encoder(points=(point_coords, point_labels.to(torch.int32)), boxes=None, masks=None)
+        low_res_masks, iou_predictions, _, _ = self.sam.sam_mask_decoder(
+            image_embeddings=image_embed,
+            image_pe=self.sam.sam_prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse,
+            dense_prompt_embeddings=dense,
+            multimask_output=True,
+            # One image, many prompts: the decoder repeats the image features per prompt
+            repeat_image=True,
+            high_res_features=[high_res_feats_0, high_res_feats_1],
+        )
+        return low_res_masks, iou_predictions
+
+
+def export(checkpoint, config, output_dir, opset=17):
+    sam = build_sam2(config, checkpoint, device="cpu").eval()
+    encoder_path, decoder_path = model_paths(output_dir, "fp32")
+    os.makedirs(output_dir, exist_ok=True)
+
+    image = torch.randn(1, 3, INPUT_SIZE, INPUT_SIZE)
+    with torch.inference_mode():
+        features = EncoderWrapper(sam)(image)
+    torch.onnx.export(
+        EncoderWrapper(sam), (image,), encoder_path,
+        input_names=["image"],
+        output_names=["image_embed", "high_res_feats_0", "high_res_feats_1"],
+        opset_version=opset,
+    )
+    print(f"Wrote {encoder_path}")
+
+    point_coords = torch.randint(0, INPUT_SIZE, (4, 2, 2), dtype=torch.float32)
+    point_labels = torch.ones(4, 2, dtype=torch.float32)
+    torch.onnx.export(
+        DecoderWrapper(sam), (*features, point_coords, point_labels), decoder_path,
+        input_names=["image_embed", "high_res_feats_0", "high_res_feats_1", "point_coords", "point_labels"],
+        output_names=["masks", "iou_predictions"],
+        dynamic_axes={
+            "point_coords": {0: "prompts", 1: "points"},
+            "point_labels": {0: "prompts", 1: "points"},
+            "masks": {0: "prompts"},
+            "iou_predictions": {0: "prompts"},
+        },
+        opset_version=opset,
+    )
+    print(f"Wrote {decoder_path}")
+    return encoder_path, decoder_path
+
+
+def quantize(output_dir):
+    """Writes int8 copies of both graphs (dynamic quantization: int8 weights, activations quantized at run time)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for fp32_path, int8_path in zip(model_paths(output_dir, "fp32"), model_paths(output_dir, "int8")):
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Wrote {int8_path} ({os.path.getsize(int8_path) / 1e6:.1f} MB, fp32 {os.path.getsize(fp32_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    from src import model
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checkpoint", default=model.checkpoint)
+    parser.add_argument("--config", default=model.model_cfg)
+    parser.add_argument("--output-dir", default=model.onnx_dir)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--no-quantize", action="store_true", help="Only export the fp32 graphs")
+    args = parser.parse_args()
+
+    export(args.checkpoint, args.config, args.output_dir, args.opset)
+    if not args.no_quantize:
+        quantize(args.output_dir)
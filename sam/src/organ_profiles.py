@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+
+
+# Where each organ the UI offers usually sits in its standard view, as
+# prompts for SAM2. Coordinates are fractions of the frame: points are
+# (x, y, label) with label 1 = organ, 0 = not organ; box is
+# (x_min, y_min, x_max, y_max). area is the plausible range of the organ's
+# mask as a fraction of the frame. points_per_side is the grid used when
+# the prompted mask is rejected and masks are generated inside the box.
+ORGAN_PROFILES = {
+    "liver": {
+        # Right upper quadrant: large, fills most of the mid and far field
+        "points": [(0.4, 0.5, 1), (0.55, 0.65, 1)],
+        "box": (0.05, 0.15, 0.85, 0.95),
+        "area": (0.1, 0.7),
+        "points_per_side": 8,
+    },
+    "kidneys": {
+        # Longitudinal flank view: ellipse at mid depth
+        "points": [(0.5, 0.55, 1)],
+        "box": (0.2, 0.3, 0.8, 0.85),
+        "area": (0.04, 0.4),
+        "points_per_side": 8,
+    },
+    "pancreas": {
+        # Transverse epigastric view: thin band across the middle
+        "points": [(0.5, 0.5, 1), (0.35, 0.5, 1)],
+        "box": (0.15, 0.35, 0.85, 0.65),
+        "area": (0.02, 0.25),
+        "points_per_side": 8,
+    },
+    "bladder": {
+        # Suprapubic view: anechoic, near the top centre
+        "points": [(0.5, 0.4, 1)],
+        "box": (0.2, 0.15, 0.8, 0.75),
+        "area": (0.04, 0.5),
+        "points_per_side": 6,
+    },
+    "thyroid": {
+        # Transverse neck view: two shallow lobes either side of the trachea
+        "points": [(0.3, 0.3, 1), (0.7, 0.3, 1), (0.5, 0.2, 0)],
+        "box": (0.05, 0.05, 0.95, 0.55),
+        "area": (0.03, 0.4),
+        "points_per_side": 8,
+    },
+    "heart": {
+        # Subcostal / parasternal view: chambers in the middle of the fan
+        "points": [(0.5, 0.5, 1)],
+        "box": (0.15, 0.15, 0.85, 0.9),
+        "area": (0.08, 0.6),
+        "points_per_side": 8,
+    },
+    "lungs": {
+        # Intercostal view: pleural line and lung below it in the near field
+        "points": [(0.5, 0.35, 1)],
+        "box": (0.05, 0.15, 0.95, 0.7),
+        "area": (0.05, 0.6),
+        "points_per_side": 6,
+    },
+}
+
+# Also accept the singular names the model or a user might use
+ALIASES = {"kidney": "kidneys", "lung": "lungs"}
+
+# Prompted masks scoring below this fall back to the grid inside the box
+PROMPT_MIN_SCORE = float(os.getenv("ORGAN_PROMPT_MIN_SCORE", "0.5"))
+
+
+def canonical_name(organ):
+    """The ORGAN_PROFILES key for an organ name (case-insensitive, singular or plural), or None."""
+    if not organ:
+        return None
+    name = organ.strip().lower()
+    name = ALIASES.get(name, name)
+    return name if name in ORGAN_PROFILES else None
+
+
+def get_profile(organ):
+    """Returns the profile for an organ name (case-insensitive), or None."""
+    return ORGAN_PROFILES.get(canonical_name(organ))
+
+
+def prompts(profile, width, height):
+    """The profile's (points, labels, box) in pixel coordinates for a width x height frame."""
+    scale = np.array([width, height], dtype=np.float32)
+    points = np.array([p[:2] for p in profile["points"]], dtype=np.float32) * scale
+    labels = np.array([p[2] for p in profile["points"]], dtype=np.int32)
+    box = np.array(profile["box"], dtype=np.float32) * np.tile(scale, 2)
+    return points, labels, box
+
+
+def plausible(profile, area_fraction):
+    low, high = profile["area"]
+    return low <= area_fraction <= high
+
+
+def pick_from_grid(profile, masks, width, height):
+    """
+    Of grid-generated masks, the one most consistent with the profile:
+    plausible size and centre inside the box, ranked by predicted IoU.
+    Returns the mask dict or None.
+    """
+    x0, y0, x1, y1 = np.array(profile["box"]) * [width, height, width, height]
+    best = None
+    for mask in masks:
+        if not plausible(profile, mask["area"] / float(width * height)):
+            continue
+        bx, by, bw, bh = mask["bbox"]
+        cx, cy = bx + bw / 2, by + bh / 2
+        if not (x0 <= cx <= x1 and y0 <= cy <= y1):
+            continue
+        if best is None or mask["predicted_iou"] > best["predicted_iou"]:
+            best = mask
+    return best
+
@@ -0,0 +1,35 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+# The vision model's identification of every profiled organ in a frame
+# (found, confidence and bounding_hint per organ, from one structured call)
+# keyed by the frame's content hash, so identifying another organ on a frame
+# that was already analysed is a lookup instead of a model call.
+
+PRESENCE_CACHE_SIZE = int(os.getenv("PRESENCE_CACHE_SIZE", "128"))
+
+
+class PresenceCache:
+    """Least-recently-used {frame hash: {organ: identification}}, safe to share between threads."""
+
+    def __init__(self, max_entries=PRESENCE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            presence = self._entries.get(key)
+            if presence is not None:
+                self._entries.move_to_end(key)
+            return presence
+
+    def store(self, key, presence):
+        with self._lock:
+            self._entries[key] = presence
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
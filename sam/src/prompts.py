@@ -86,3 +86,36 @@ def get_ultrasound_diagnostic_prompt(target_organ):
     return prompt.format(target_organ=target_organ)
 
 
+
+
+def get_identification_prompt(target_organ):
+    """
+    Returns the prompt used by /identify.
+    The answer itself comes back through the report_identification tool, so the
+    prompt only needs to say what to look for and how to judge confidence.
+    """
+    prompt = (
+        "You are reviewing an ultrasound image captured by an astronaut. "
+        "Decide whether the {target_organ} is clearly visible in this image.\n\n"
+        "Report your answer with the report_identification tool. Set confidence close to 1 only when "
+        "identifying landmarks of the {target_organ} are unambiguous, and include an approximate "
+        "bounding box when it is found."
+    )
+    return prompt.format(target_organ=target_organ)
+
+
+def get_multi_identification_prompt(organs):
+    """
+    Returns the prompt used to identify every profiled organ in one call.
+    The answers come back through the report_identifications tool, one entry
+    per organ, so switching the target organ on the same frame needs no
+    further call.
+    """
+    prompt = (
+        "You are reviewing an ultrasound image captured by an astronaut. "
+        "For each of these organs, decide whether it is clearly visible in this image: {organs}.\n\n"
+        "Report every organ with the report_identifications tool. Set an organ's confidence close to 1 "
+        "only when its identifying landmarks are unambiguous, and include an approximate bounding box "
+        "for each organ that is found."
+    )
+    return prompt.format(organs=", ".join(organs))
@@ -0,0 +1,151 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from src import imaging
+from src.organ_profiles import ALIASES
+
+
+# A few-millisecond check of whether a frame is worth analysing at all:
+# blurred (probe moving), saturated (gain too high), too dark (gain too
+# low) or mostly black (lost skin contact) frames get the adjustment back
+# straight away instead of costing a model call.
+
+QUALITY_CHECK = os.getenv("QUALITY_CHECK", "1") != "0"
+
+# Frames are scored on a grayscale copy this wide, so thresholds don't depend on resolution
+QUALITY_WIDTH = 160
+
+# Pixels darker than this are treated as outside the imaging fan (no echo)
+FAN_FLOOR = 12
+
+# Pixels at least this bright count as saturated
+SATURATION_LEVEL = 245
+
+DEFAULT_THRESHOLDS = {
+    # Laplacian variance of the speckle; blurred frames fall well below
+    "min_sharpness": 15.0,
+    # Fraction of the fan that may be saturated
+    "max_saturation": 0.15,
+    # Mean brightness inside the fan; averaging on the small copy smooths
+    # out clipped speckle, so overall brightness catches high gain too
+    "min_brightness": 25.0,
+    "max_brightness": 150.0,
+    # Fraction of the frame the fan must cover (skin contact)
+    "min_coverage": 0.25,
+    # Brightness of the deepest third of the fan relative to the rest; below
+    # it the beam is set deeper than there's signal to show
+    "min_depth_ratio": 0.15,
+}
+
+# Organs whose good views look "bad" by the defaults
+ORGAN_THRESHOLDS = {
+    # A full bladder is a large anechoic (black) lumen
+    "bladder": {"min_coverage": 0.15, "min_brightness": 15.0, "min_depth_ratio": 0.05},
+    # Chambers are dark and the walls move, so frames are softer
+    "heart": {"min_sharpness": 8.0, "min_brightness": 18.0},
+    # Below the pleural line there are mostly artefacts
+    "lungs": {"min_coverage": 0.15, "min_depth_ratio": 0.0},
+    # Superficial, fine-textured gland imaged at high frequency
+    "thyroid": {"min_sharpness": 25.0, "min_depth_ratio": 0.05},
+}
+
+# Overrides as JSON, e.g. {"default": {"min_sharpness": 10}, "liver": {"min_coverage": 0.3}}
+for organ, overrides in json.loads(os.getenv("QUALITY_THRESHOLDS", "{}")).items():
+    if organ == "default":
+        DEFAULT_THRESHOLDS.update(overrides)
+    else:
+        ORGAN_THRESHOLDS.setdefault(organ, {}).update(overrides)
+
+
+def thresholds_for(organ):
+    name = (organ or "").strip().lower()
+    return {**DEFAULT_THRESHOLDS, **ORGAN_THRESHOLDS.get(ALIASES.get(name, name), {})}
+
+
+def quality_scores(gray):
+    """Sharpness, saturation, brightness, fan coverage and depth ratio of a grayscale frame."""
+    height, width = gray.shape
+    if width > QUALITY_WIDTH:
+        size = (QUALITY_WIDTH, max(1, round(height * QUALITY_WIDTH / width)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+    # The fan: echo-bearing pixels, closed over so speckle gaps don't count as black
+    fan = cv2.morphologyEx((gray > FAN_FLOOR).astype(np.uint8), cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8)).astype(bool)
+    coverage = float(fan.mean())
+    inside = gray[fan]
+    if not inside.size:
+        return {"sharpness": 0.0, "saturation": 0.0, "brightness": 0.0, "coverage": 0.0, "depth_ratio": 0.0}
+
+    # Depth: brightness from the top of the fan down to the bottom of the
+    # frame, within the fan's width; deepest third vs. the rest
+    rows = np.flatnonzero(fan.any(axis=1))
+    cols = np.flatnonzero(fan.any(axis=0))
+    row_means = gray[rows[0]:, cols[0]:cols[-1] + 1].mean(axis=1)
+    split = len(row_means) - max(1, len(row_means) // 3)
+    upper = row_means[:split].mean() if split else row_means.mean()
+    deep = row_means[split:].mean()
+
+    return {
+        "sharpness": float(cv2.Laplacian(gray.astype(np.float32), cv2.CV_32F).var()),
+        "saturation": float((inside >= SATURATION_LEVEL).mean()),
+        "brightness": float(inside.mean()),
+        "coverage": coverage,
+        "depth_ratio": float(deep / upper) if upper else 1.0,
+    }
+
+
+def adjustments_for(scores, thresholds):
+    """
+    What to change, most important first, as {adjustment, action, message}.
+    All but depth make the frame unusable.
+    """
+    if scores["coverage"] < thresholds["min_coverage"]:
+        # Nothing else means much until there's an image
+        return [{"adjustment": "contact", "action": "improve contact", "message": "Most of the frame is black: add gel and keep the probe flat against the skin."}]
+
+    adjustments = []
+    if scores["saturation"] > thresholds["max_saturation"] or scores["brightness"] > thresholds["max_brightness"]:
+        adjustments.append({"adjustment": "gain", "action": "reduce gain", "message": "The image is washed out: turn the gain down."})
+    elif scores["brightness"] < thresholds["min_brightness"]:
+        adjustments.append({"adjustment": "gain", "action": "increase gain", "message": "The image is too dark: turn the gain up."})
+    if scores["sharpness"] < thresholds["min_sharpness"]:
+        adjustments.append({"adjustment": "steady", "action": "hold still", "message": "The image is blurred: hold the probe still for a moment."})
+    if scores["depth_ratio"] < thresholds["min_depth_ratio"]:
+        adjustments.append({"adjustment": "depth", "action": "reduce depth", "message": "The bottom of the image has no signal: reduce the depth."})
+    return adjustments
+
+
+def assess(gray, organ=None):
+    """
+    Quality report for a grayscale frame: {usable, scores, adjustments},
+    judged against the organ's thresholds.
+    """
+    scores = quality_scores(gray)
+    adjustments = adjustments_for(scores, thresholds_for(organ))
+    return {
+        "usable": all(a["adjustment"] == "depth" for a in adjustments),
+        "scores": {key: round(value, 4) for key, value in scores.items()},
+        "adjustments": adjustments,
+    }
+
+
+def assess_frame(image, organ=None):
+    """assess() on a decoded grayscale or BGR frame."""
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return assess(gray, organ)
+
+
+def assess_encoded(data, organ=None):
+    """assess() on a reduced decode of encoded image bytes, or None if they can't be decoded."""
+    gray = imaging.decode_thumbnail(data, scale=4)
+    if gray is None:
+        return None
+    return assess(gray, organ)
+
+
+def summary(report):
+    """The report's adjustments as one sentence for a user."""
+    return " ".join(a["message"] for a in report["adjustments"])
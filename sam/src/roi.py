@@ -0,0 +1,157 @@
+import os
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+
+import cv2
+import numpy as np
+
+
+# Ultrasound screenshots carry black borders, the machine's UI text and
+# scale bars around the imaging fan. Frames are cropped to the fan's bounding
+# box before being encoded for the model or segmented, so none of those
+# pixels are paid for. Within a scan session that names its machine/preset
+# the box is found once and reused; anything else is detected per frame, so
+# one client's geometry can never crop another's frames.
+
+ROI_CROP = os.getenv("ROI_CROP", "1") != "0"
+
+# Crops that keep more than this fraction of the frame aren't worth a
+# decode and re-encode; such frames are forwarded whole
+ROI_MAX_KEEP = float(os.getenv("ROI_MAX_KEEP", "0.85"))
+
+# Re-detect the fan after this many frames, in case the preset changed
+ROI_REFRESH_FRAMES = int(os.getenv("ROI_REFRESH_FRAMES", "300"))
+
+# Pixels darker than this are background
+FAN_FLOOR = 12
+
+# The fan must cover at least this fraction of the frame to be trusted
+MIN_FAN_AREA = 0.15
+
+# Margin kept around the detected fan, as a fraction of its size
+FAN_MARGIN = 0.02
+
+# Detection runs on a copy this wide
+DETECT_WIDTH = 320
+
+# Which machine/preset and scan session the frame being handled comes from (set per request)
+current_preset = ContextVar("roi_preset", default="")
+current_session = ContextVar("roi_session", default="")
+
+
+def region_key():
+    """The crop cache key for the current frame, or None if it mustn't be cached (no preset or session)."""
+    preset, session = current_preset.get(), current_session.get()
+    return (session, preset) if preset and session else None
+
+
+def detect_fan(gray):
+    """
+    Bounding box (x0, y0, x1, y1) of the imaging fan in a grayscale frame,
+    or None if no region large enough stands out. Text, scale bars and
+    other thin UI elements are removed by a morphological opening before
+    the largest connected bright region is taken.
+    """
+    height, width = gray.shape
+    scale = min(1.0, DETECT_WIDTH / width)
+    small = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+    # Close speckle gaps inside the fan, then open away thin text and markers
+    mask = (small > FAN_FLOOR).astype(np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((7, 7), np.uint8))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((9, 9), np.uint8))
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count < 2:
+        return None
+    largest = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    x, y, w, h, area = stats[largest]
+    if area < MIN_FAN_AREA * mask.size:
+        return None
+
+    margin_x, margin_y = FAN_MARGIN * w, FAN_MARGIN * h
+    return (
+        max(0, int((x - margin_x) / scale)),
+        max(0, int((y - margin_y) / scale)),
+        min(width, int(np.ceil((x + w + margin_x) / scale))),
+        min(height, int(np.ceil((y + h + margin_y) / scale))),
+    )
+
+
+class FanRegions:
+    """
+    Crop geometry per (scan session, preset) key, least recently used
+    dropped. A key whose fan fills most of the frame is remembered as not
+    worth cropping, so its frames can skip decoding altogether. A None key
+    is never cached: the fan is detected on every such frame.
+    """
+
+    def __init__(self, max_entries=64, refresh_frames=ROI_REFRESH_FRAMES, max_keep=ROI_MAX_KEEP):
+        self.max_entries = max_entries
+        self.refresh_frames = refresh_frames
+        self.max_keep = max_keep
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def wants_pixels(self, key):
+        """False if frames under this key are known to be sent whole, so needn't be decoded for cropping."""
+        if key is None:
+            return True
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["box"] is not None or entry["frames"] >= self.refresh_frames:
+                return True
+            entry["frames"] += 1
+            return False
+
+    def detect(self, image):
+        """The crop box for a decoded frame, or None to keep it whole, without caching."""
+        height, width = image.shape[:2]
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        box = detect_fan(gray)
+        if box is not None and (box[2] - box[0]) * (box[3] - box[1]) > self.max_keep * height * width:
+            box = None
+        return box
+
+    def box_for(self, key, image):
+        """The crop box for a decoded frame under this key, or None to keep the frame whole."""
+        if key is None:
+            return self.detect(image)
+        height, width = image.shape[:2]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["shape"] == (height, width) and entry["frames"] < self.refresh_frames:
+                entry["frames"] += 1
+                self._entries.move_to_end(key)
+                return entry["box"]
+
+        box = self.detect(image)
+        with self._lock:
+            self._entries[key] = {"shape": (height, width), "box": box, "frames": 1}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return box
+
+
+def crop(image, box):
+    """The frame cropped to the box, as a view (no pixels are copied)."""
+    if box is None:
+        return image
+    x0, y0, x1, y1 = box
+    return image[y0:y1, x0:x1]
+
+
+def to_frame_hint(hint, box, shape):
+    """Maps a normalised [x_min, y_min, x_max, y_max] within the crop back to the whole frame."""
+    if hint is None or box is None:
+        return hint
+    height, width = shape[:2]
+    x0, y0, x1, y1 = box
+    return [
+        (x0 + hint[0] * (x1 - x0)) / width,
+        (y0 + hint[1] * (y1 - y0)) / height,
+        (x0 + hint[2] * (x1 - x0)) / width,
+        (y0 + hint[3] * (y1 - y0)) / height,
+    ]
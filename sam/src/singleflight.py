@@ -0,0 +1,52 @@
+import asyncio
+import hashlib
+
+
+def content_key(*parts):
+    """
+    Returns a stable key for a request from its parts (str or bytes).
+    Used to recognise identical uploads, e.g. ("identify", organ, image_bytes).
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key so only one of them runs.
+
+    The first caller for a key starts the work (awaiting it if `fn` is a
+    coroutine function, otherwise running it in a worker thread); callers
+    that arrive while it is still running await the same future and get the
+    same result (or exception). Nothing is kept once the call finishes, so
+    this is not a cache: it only covers the window before the first call
+    completes.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key, fn, *args):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._run(key, fn, *args))
+            self._inflight[key] = future
+        # Shield so one waiter disconnecting doesn't cancel the call for the rest
+        return await asyncio.shield(future)
+
+    async def _run(self, key, fn, *args):
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                return await fn(*args)
+            return await asyncio.to_thread(fn, *args)
+        finally:
+            self._inflight.pop(key, None)
@@ -0,0 +1,226 @@
+import atexit
+import json
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+# Minimal W3C trace-context tracing shared by the Streamlit client and the API.
+# Spans are exported as JSON lines to TRACE_EXPORT_FILE and/or as OTLP/JSON to
+# OTEL_EXPORTER_OTLP_ENDPOINT (a collector, or anything that accepts /v1/traces).
+# With neither set, spans are still propagated but not exported.
+
+TRACEPARENT_HEADER = "traceparent"
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": _config["service_name"],
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6 if self.end_ns else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _RemoteParent:
+    """Parent span context received from another process."""
+
+    def __init__(self, trace_id, span_id):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+    def flush(self):
+        pass
+
+
+class OTLPExporter:
+    """
+    Batches spans and posts them as OTLP/JSON from a background thread, so
+    exporting never adds latency to the traced request.
+    """
+
+    def __init__(self, endpoint, interval=2.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.interval = interval
+        self._pending = []
+        self._lock = threading.Lock()
+        thread = threading.Thread(target=self._loop, name="otlp-exporter", daemon=True)
+        thread.start()
+
+    def export(self, spans):
+        with self._lock:
+            self._pending.extend(spans)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            spans, self._pending = self._pending, []
+        if not spans:
+            return
+        body = json.dumps(_otlp_payload(spans)).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            print(f"Error exporting traces: {str(e)}")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_payload(spans):
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": _config["service_name"]}}]},
+            "scopeSpans": [{"scope": {"name": "space-triage"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+_config = {"service_name": "space-triage", "exporters": []}
+
+
+def configure(service_name, export_file=None, otlp_endpoint=None):
+    """
+    Set the service name and exporters. Unset arguments fall back to the
+    TRACE_EXPORT_FILE and OTEL_EXPORTER_OTLP_ENDPOINT environment variables.
+    """
+    export_file = export_file or os.getenv("TRACE_EXPORT_FILE")
+    otlp_endpoint = otlp_endpoint or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+
+    exporters = []
+    if export_file:
+        exporters.append(FileExporter(export_file))
+    if otlp_endpoint:
+        exporters.append(OTLPExporter(otlp_endpoint))
+    _config["service_name"] = service_name
+    _config["exporters"] = exporters
+
+
+def _export(span):
+    for exporter in _config["exporters"]:
+        try:
+            exporter.export([span])
+        except Exception as e:
+            print(f"Error exporting traces: {str(e)}")
+
+
+@atexit.register
+def _flush():
+    for exporter in _config["exporters"]:
+        exporter.flush()
+
+
+def parse_traceparent(value):
+    """Returns the remote parent from a traceparent header, or None if it's malformed."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return _RemoteParent(parts[1], parts[2])
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name, parent=None, **attributes):
+    """
+    Opens a span as a child of `parent` (a remote parent from
+    parse_traceparent) or of the current span, starting a new trace if
+    there is neither. The span is exported when the block exits.
+    """
+    parent = parent or _current_span.get()
+    if parent is None:
+        span = Span(name, secrets.token_hex(16), attributes=attributes)
+    else:
+        span = Span(name, parent.trace_id, parent.span_id, attributes)
+
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_ns = time.time_ns()
+        _export(span)
+
+
+def inject(headers=None):
+    """Adds the current span's traceparent to `headers` for an outbound call."""
+    headers = dict(headers or {})
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.traceparent
+    return headers
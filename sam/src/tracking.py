@@ -0,0 +1,172 @@
+"""
+Organ tracking across consecutive frames of a scan with SAM2's memory bank.
+
+The first frame is segmented with the organ's prompts (model.segment_organ)
+and that mask seeds SAM2's memory; later frames are segmented by attending
+to the remembered frames instead of from the location priors, which keeps
+the mask on the same structure from frame to frame. When tracking confidence
+drops (the organ left the view, or the mask degenerated) the memory is
+dropped and the frame is segmented from prompts again.
+
+This buys consistency, not speed: every frame still runs the full image
+encoder, plus memory attention and the memory encoder on top, so a tracked
+frame costs more than a prompted one. It is opt-in (GUIDE_TRACKING).
+
+This is the streaming equivalent of SAM2VideoPredictor's propagation, which
+needs the whole video up front: frames are fed to SAM2Base.track_step one at
+a time and the memory bank is trimmed to what the model can attend to.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from src import model, organ_profiles
+from src.imaging import to_model_rgb
+
+# Below this the tracked mask is dropped and the organ is found from prompts again
+TRACKING_MIN_CONFIDENCE = float(os.getenv("TRACKING_MIN_CONFIDENCE", "0.6"))
+
+# Trackers kept per process (one per scan session and organ)
+TRACKING_MAX_SESSIONS = int(os.getenv("TRACKING_MAX_SESSIONS", "16"))
+
+# SAM2's image normalisation (ImageNet statistics)
+MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1)
+STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1)
+
+
+class OrganTracker:
+    """
+    Tracks one organ through the frames of one scan. update() returns the
+    frame's mask (or None once the organ can't be found), a confidence, and
+    whether the tracker had to start over from prompts for this frame.
+    """
+
+    def __init__(self, organ, min_confidence=TRACKING_MIN_CONFIDENCE):
+        self.organ = organ
+        self.profile = organ_profiles.get_profile(organ)
+        self.min_confidence = min_confidence
+        self.sam = model.load_sam()
+        # Frames further back than this are never attended to
+        self.history = max(self.sam.num_maskmem, getattr(self.sam, "max_obj_ptrs_in_encoder", 16))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.frame_idx = None
+        self.outputs = {"cond_frame_outputs": {}, "non_cond_frame_outputs": {}}
+
+    def _features(self, image):
+        rgb = torch.from_numpy(np.ascontiguousarray(to_model_rgb(image))).to(self.sam.device)
+        tensor = rgb.permute(2, 0, 1)[None].float().div(255)
+        size = self.sam.image_size
+        tensor = F.interpolate(tensor, size=(size, size), mode="bilinear", align_corners=False)
+        tensor = (tensor - MEAN.to(tensor.device)) / STD.to(tensor.device)
+        _, vision_feats, vision_pos_embeds, feat_sizes = self.sam._prepare_backbone_features(self.sam.forward_image(tensor))
+        return vision_feats, vision_pos_embeds, feat_sizes
+
+    def _step(self, image, mask_inputs=None):
+        vision_feats, vision_pos_embeds, feat_sizes = self._features(image)
+        initial = mask_inputs is not None
+        output = self.sam.track_step(
+            frame_idx=self.frame_idx,
+            is_init_cond_frame=initial,
+            current_vision_feats=vision_feats,
+            current_vision_pos_embeds=vision_pos_embeds,
+            feat_sizes=feat_sizes,
+            point_inputs=None,
+            mask_inputs=mask_inputs,
+            output_dict=self.outputs,
+            num_frames=self.frame_idx + 1,
+            run_mem_encoder=True,
+        )
+        kind = "cond_frame_outputs" if initial else "non_cond_frame_outputs"
+        self.outputs[kind][self.frame_idx] = {
+            key: output[key] for key in ("maskmem_features", "maskmem_pos_enc", "obj_ptr", "pred_masks", "object_score_logits")
+            if key in output
+        }
+        # Keep memory bounded: drop frames too old to be attended to
+        stale = self.frame_idx - self.history
+        for idx in [i for i in self.outputs["non_cond_frame_outputs"] if i <= stale]:
+            del self.outputs["non_cond_frame_outputs"][idx]
+        return output
+
+    def _mask_and_confidence(self, output, height, width):
+        logits = output["pred_masks"]
+        mask = (F.interpolate(logits.float(), size=(height, width), mode="bilinear", align_corners=False)[0, 0] > 0).cpu().numpy()
+
+        # Stability: how much of the mask survives moving the threshold,
+        # scaled by SAM2's own belief that the object is in the frame
+        low_res = logits[0, 0].float()
+        low = int((low_res > -1).sum())
+        confidence = int((low_res > 1).sum()) / low if low else 0.0
+        if "object_score_logits" in output:
+            confidence *= float(torch.sigmoid(output["object_score_logits"].float()).flatten()[0])
+        if not organ_profiles.plausible(self.profile, float(mask.mean())):
+            confidence = 0.0
+        return mask, confidence
+
+    def initialise(self, image):
+        """Segments the frame from the organ's prompts and seeds an empty memory with it."""
+        self.reset()
+        mask = model.segment_organ(image, self.organ)
+        if mask is None:
+            return None, 0.0
+        self.frame_idx = 0
+        size = self.sam.image_size
+        mask_inputs = torch.from_numpy(mask).to(self.sam.device, torch.float32)[None, None]
+        mask_inputs = (F.interpolate(mask_inputs, size=(size, size), mode="bilinear", align_corners=False, antialias=True) >= 0.5).float()
+        output = self._step(image, mask_inputs=mask_inputs)
+        _, confidence = self._mask_and_confidence(output, *image.shape[:2])
+        return mask, confidence
+
+    def update(self, image):
+        """Returns (mask or None, confidence, reinitialised) for the next frame."""
+        with self._lock, torch.inference_mode(), model.autocast():
+            if self.frame_idx is None:
+                return (*self.initialise(image), True)
+            self.frame_idx += 1
+            mask, confidence = self._mask_and_confidence(self._step(image), *image.shape[:2])
+            if confidence < self.min_confidence:
+                # The memory now holds frames of whatever was being tracked
+                # when it was lost; start a fresh bank from the prompted mask
+                self.reset()
+                return (*self.initialise(image), True)
+            return mask, confidence, False
+
+
+class TrackerSessions:
+    """Bounded map of (scan session, organ) -> OrganTracker, dropping the least recently used."""
+
+    def __init__(self, max_sessions=TRACKING_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._trackers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session, organ):
+        key = (session, organ)
+        with self._lock:
+            tracker = self._trackers.pop(key, None) or OrganTracker(organ)
+            self._trackers[key] = tracker
+            while len(self._trackers) > self.max_sessions:
+                self._trackers.popitem(last=False)
+            return tracker
+
+
+trackers = TrackerSessions()
+
+
+def track_mask(image, session, organ):
+    """
+    The organ's mask in this frame of the scan session, tracked from the
+    previous frames. Without a profile for the organ there's nothing to seed
+    tracking with, and the ONNX graphs have no memory bank, so those are
+    segmented frame by frame.
+    """
+    if model.runtime == "onnx" or organ_profiles.get_profile(organ) is None:
+        return model.target_mask(image, organ)
+    mask, _, _ = trackers.get(session, organ).update(image)
+    return mask
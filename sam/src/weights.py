@@ -0,0 +1,86 @@
+"""
+Memory-mapped SAM2 weights.
+
+The .pt checkpoint is a pickle that torch.load deserializes into freshly
+allocated memory in every process. Converted once to safetensors (a JSON
+header followed by raw tensor bytes), the weights can instead be mapped
+straight from the file: startup only parses the header, pages are read on
+first touch, and every process mapping the file shares the same page-cache
+pages instead of holding a private copy.
+
+Convert, from sam/:
+    python -m src.weights finetuned_models/sam2_hiera_small.pt
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+
+import torch
+
+
+DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def convert_checkpoint(checkpoint_path, output_path=None):
+    """Writes the checkpoint's model weights as safetensors next to it (or to output_path)."""
+    from safetensors.torch import save_file
+
+    output_path = output_path or os.path.splitext(checkpoint_path)[0] + ".safetensors"
+    state = torch.load(checkpoint_path, map_location="cpu", weights_only=True)
+    state_dict = state.get("model", state)
+    save_file({name: tensor.contiguous() for name, tensor in state_dict.items()}, output_path)
+    return output_path
+
+
+def load_state_dict_mmap(path):
+    """
+    Returns the state dict of a safetensors file as tensors over a private
+    (copy-on-write) memory map of it. Nothing is read until a tensor is
+    used, and pages stay shared with other processes unless written to.
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    state_dict = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        start, end = info["data_offsets"]
+        dtype = DTYPES[info["dtype"]]
+        if end == start:
+            state_dict[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        # The tensor keeps the map alive for as long as it's referenced
+        tensor = torch.frombuffer(mapped, dtype=dtype, count=(end - start) // dtype.itemsize, offset=data_start + start)
+        state_dict[name] = tensor.reshape(info["shape"])
+    return state_dict
+
+
+def load_weights(model, path):
+    """
+    Points the model's parameters at the mapped weights instead of copying
+    them into the freshly initialised ones (load_state_dict with assign).
+    """
+    model.load_state_dict(load_state_dict_mmap(path), assign=True)
+    return model
+
+
+if __name__ == "__main__":
+    for checkpoint_path in sys.argv[1:]:
+        print(f"Wrote {convert_checkpoint(checkpoint_path)}")
@@ -1,15 +1,22 @@
 from dotenv import load_dotenv
 load_dotenv()
 import streamlit as st
-import requests
 from PIL import Image
 import io
 import time
 import json
 from typing import List, Dict, Any, Optional
 import base64
+import hashlib
 import os
+import sys
+import uuid
+import numpy as np
 from elevenlabs.client import ElevenLabs
+
+# Shared helpers from the API package (tracing, frame change detection, ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "sam"))
+from src import backends, client_frames, frame_gate, tracing
 # from pydub import AudioSegment
 
 
@@ -17,6 +24,9 @@ from elevenlabs.client import ElevenLabs
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 eleven_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
 
+# Each processed frame is one trace, propagated to the API via traceparent
+tracing.configure(service_name="space-triage-client")
+
 # Configure the page - MUST BE FIRST STREAMLIT COMMAND
 st.set_page_config(
     page_title="Space Triage: AI-Guided Ultrasound",
@@ -27,9 +37,40 @@ st.set_page_config(
 
 # Define API endpoints
 BASE_URL = "https://space-triage-199983032721.us-central1.run.app"
-IDENTIFY_API = f"{BASE_URL}/identify"
-NAVIGATE_API = f"{BASE_URL}/navigate"
-DESCRIBE_API = f"{BASE_URL}/describe"
+
+# BACKEND_MODE=inprocess runs the API's endpoint logic inside this process
+# (sam/app.py and its model clients must be importable) instead of posting
+# every frame to BASE_URL: for a co-located deployment, frames skip
+# multipart encoding, the network and JSON serialization
+BACKEND_MODE = os.getenv("BACKEND_MODE", "http")
+
+# Seconds to wait for the API's response to a request before giving up
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "60"))
+
+# Diagnoses run as background jobs on the API: the job id is kept in session
+# state, so a rerun or dropped connection reattaches to the running job
+# instead of losing the result or paying for the model call again
+DESCRIBE_JOBS = os.getenv("DESCRIBE_JOBS", "1") == "1"
+# Kept longer than the API's JOB_STALE_AFTER (600s), so a job whose worker
+# died comes back failed (and is resubmitted) before the client gives up
+DESCRIBE_JOB_TIMEOUT = float(os.getenv("DESCRIBE_JOB_TIMEOUT", "900"))
+
+# With USE_WS_SESSION=1 frames go over one WebSocket per scan session and
+# results (including streamed transcripts) are pushed back, instead of a
+# multipart POST per call
+USE_WS_SESSION = os.getenv("USE_WS_SESSION", "0") == "1"
+WS_SESSION_API = BASE_URL.replace("https://", "wss://", 1).replace("http://", "ws://", 1) + "/ws/session"
+WS_EVENT_TIMEOUT = float(os.getenv("WS_EVENT_TIMEOUT", "120"))
+
+# Cine clips / MJPEG recordings are sent whole; the API picks the keyframe
+CLIP_TYPES = ["mp4", "avi", "mov", "mjpeg", "mjpg"]
+
+# Names this machine/preset to the API, which crops frames to the imaging
+# fan it detected for the preset (frames from different presets must differ)
+ULTRASOUND_PRESET = os.getenv("ULTRASOUND_PRESET", "")
+
+# Minimum /identify confidence before we treat the organ as found
+IDENTIFY_CONFIDENCE_THRESHOLD = float(os.getenv("IDENTIFY_CONFIDENCE_THRESHOLD", "0.6"))
 
 # Add CSS for the days label
 st.markdown("""
@@ -283,6 +324,9 @@ if "uploaded_image" not in st.session_state:
     st.session_state.uploaded_image = None
 if "needs_navigation" not in st.session_state:
     st.session_state.needs_navigation = False
+# Identifies this scan to the API, which reuses results for unchanged frames per session
+if "scan_session_id" not in st.session_state:
+    st.session_state.scan_session_id = uuid.uuid4().hex
 if "navigate_response" not in st.session_state:
     st.session_state.navigate_response = None
 if "description_response" not in st.session_state:
@@ -382,12 +426,15 @@ def text_to_speech_bytes(text: str) -> bytes:
     """
     Convert `text` to speech via ElevenLabs and return a single MP3 blob.
     """
-    chunk_gen = eleven_client.text_to_speech.convert(
-        text=text,
-        voice_id="21m00Tcm4TlvDq8ikWAM",             
-        model_id="eleven_monolingual_v1"
-    )
-    return b"".join(chunk_gen)
+    with tracing.start_span("elevenlabs.text_to_speech", characters=len(text)) as span:
+        chunk_gen = eleven_client.text_to_speech.convert(
+            text=text,
+            voice_id="21m00Tcm4TlvDq8ikWAM",             
+            model_id="eleven_monolingual_v1"
+        )
+        audio = b"".join(chunk_gen)
+        span.set_attribute("audio.bytes", len(audio))
+        return audio
 
 def speak(text: str):
     st.session_state.voice_bytes = text_to_speech_bytes(text)
@@ -409,46 +456,187 @@ if st.session_state.voice_bytes:
 
 # Custom functions
 def image_to_bytes(uploaded_image):
-    """Convert uploaded image to bytes"""
+    """Convert uploaded image to JPEG bytes, single-channel for grey frames"""
     if uploaded_image is None:
         return None
     
-    img = Image.open(uploaded_image)
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG")
-    return buf.getvalue()
+    with tracing.start_span("image_to_bytes") as span:
+        jpeg, mode = client_frames.upload_to_jpeg(uploaded_image)
+        span.set_attribute("image.mode", mode)
+        return jpeg
+
+def frame_signature(image_bytes):
+    """Change-detection signature of a frame, from a reduced-size grayscale decode"""
+    img = Image.open(io.BytesIO(image_bytes))
+    # For JPEGs, draft() makes the decoder scale down by up to 8x as it decodes
+    img.draft("L", (max(1, img.width // 8), max(1, img.height // 8)))
+    return frame_gate.FrameSignature(np.asarray(img.convert("L")))
+
+@st.cache_resource
+def api_backend():
+    """The API client for BACKEND_MODE, shared by every session of this process"""
+    return backends.create_backend(BACKEND_MODE, BASE_URL, ULTRASOUND_PRESET, API_TIMEOUT)
+
+def scan_session_id():
+    return st.session_state.get("scan_session_id", "")
 
 def call_identify_api(image_bytes, target_organ):
     """Call the identify API endpoint with an image and organ name"""
     try:
-        files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
-        data = {"entity_name": target_organ}
-        response = requests.post(IDENTIFY_API, files=files, data=data)
-        return response.json()
+        return api_backend().identify(image_bytes, target_organ, scan_session_id())
     except Exception as e:
         st.error(f"Error calling identify API: {e}")
-        return {"found": False, "entity": target_organ, "error": str(e)}
+        return {"found": False, "confidence": 0.0, "entity": target_organ, "error": str(e)}
+
+def is_clip(uploaded_file):
+    """True if the upload is a cine clip rather than a single frame"""
+    return uploaded_file is not None and uploaded_file.name.rsplit(".", 1)[-1].lower() in CLIP_TYPES
+
+def call_identify_clip_api(clip_bytes, filename, target_organ):
+    """Call the identify_clip API endpoint; it picks the best keyframe and identifies the organ in it"""
+    try:
+        return api_backend().identify_clip(clip_bytes, filename, target_organ, scan_session_id())
+    except Exception as e:
+        st.error(f"Error calling identify clip API: {e}")
+        return {"found": False, "confidence": 0.0, "entity": target_organ, "error": str(e)}
 
 def call_navigate_api(image_bytes, target_organ):
     """Call the navigate API endpoint with image and entity name"""
     try:
-        files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
-        data = {"entity_name": target_organ}
-        
-        # Send entity_name as form data and the image file
-        response = requests.post(NAVIGATE_API, files=files, data=data)
-        return response.json()
+        return api_backend().navigate(image_bytes, target_organ, scan_session_id())
     except Exception as e:
         st.error(f"Error calling navigate API: {e}")
         return {"response": "Error occurred during navigation guidance.", "error": str(e)}
 
+def call_guide_api(image_bytes, target_organ):
+    """Call the guide API endpoint; returns short probe cues, or a navigation transcript if the organ isn't segmented"""
+    try:
+        return api_backend().guide(image_bytes, target_organ, scan_session_id())
+    except Exception as e:
+        st.error(f"Error calling guide API: {e}")
+        return {"found": False, "cues": [], "error": str(e)}
+
+def format_cues(cues):
+    """'Slide left, then tilt up' from the guide API's cue list (most urgent first)"""
+    return ", then ".join(cue["cue"] for cue in cues).capitalize()
+
+def ws_session():
+    """The scan session's WebSocket: opened on first use, reconfigured when the organ or guidance mode changes"""
+    # Imported here so the websockets package is only needed with USE_WS_SESSION
+    from websockets.sync.client import connect
+
+    config = {
+        "organ": st.session_state.target_organ,
+        "guidance": bool(st.session_state.get("guidance_mode")),
+        "confidence_threshold": IDENTIFY_CONFIDENCE_THRESHOLD,
+        "preset": ULTRASOUND_PRESET,
+    }
+    conn = st.session_state.get("ws_conn")
+    if conn is None:
+        conn = connect(WS_SESSION_API, additional_headers=tracing.inject(), open_timeout=10)
+        conn.send(json.dumps({"type": "start", **config}))
+        json.loads(conn.recv(timeout=10))  # ready
+        st.session_state.ws_conn = conn
+        st.session_state.ws_frames_sent = 0
+    elif st.session_state.get("ws_config") != config:
+        conn.send(json.dumps({"type": "configure", **config}))
+    st.session_state.ws_config = config
+    return conn
+
+def ws_frame_events(image_bytes):
+    """Push a frame into the scan session and yield the server's events for it until it's done"""
+    conn = ws_session()
+    try:
+        conn.send(image_bytes)
+        # The server numbers frames in arrival order; events left over from a
+        # frame whose run was cut short by a rerun are skipped
+        st.session_state.ws_frames_sent += 1
+        frame = st.session_state.ws_frames_sent
+        while True:
+            event = json.loads(conn.recv(timeout=WS_EVENT_TIMEOUT))
+            if event.get("frame", frame) < frame:
+                continue
+            if event["type"] == "done":
+                return
+            yield event
+    except Exception:
+        # Drop the connection; the next frame opens a fresh session
+        st.session_state.ws_conn = None
+        conn.close()
+        raise
+
+def process_frame_ws(image_bytes):
+    """
+    Identify, then diagnose or guide, for one frame over the scan session.
+    Transcripts are shown as they stream in. Returns the identify result and
+    what was streamed: {"kind", "transcript", "cues"}.
+    """
+    response, streamed = {}, {"kind": None, "transcript": "", "cues": None}
+    placeholder = None
+    try:
+        with st.spinner("Analyzing image..."):
+            for event in ws_frame_events(image_bytes):
+                if event["type"] == "identify":
+                    response = event
+                elif event["type"] == "quality":
+                    response = {"found": False, "confidence": 0.0, "usable": False, "quality": event}
+                elif event["type"] == "guidance":
+                    streamed["cues"] = event["cues"]
+                elif event["type"] == "transcript":
+                    if placeholder is None:
+                        placeholder = st.empty()
+                    streamed["kind"] = event["kind"]
+                    streamed["transcript"] += event["delta"]
+                    placeholder.markdown(streamed["transcript"])
+                elif event["type"] == "error":
+                    response.setdefault("error", event["detail"])
+    except Exception as e:
+        st.error(f"Scan session error: {e}")
+        response = {"found": False, "confidence": 0.0, "entity": st.session_state.target_organ, "error": str(e)}
+    if placeholder is not None:
+        placeholder.empty()
+    return response, streamed
+
+def describe_job_result(image_bytes, target_organ):
+    """
+    The diagnosis from a background job for this frame and organ: the one
+    started on an earlier run if there is one, otherwise a new one.
+    """
+    backend = api_backend()
+    frame = hashlib.sha256(image_bytes).hexdigest()
+    deadline = time.monotonic() + DESCRIBE_JOB_TIMEOUT
+    while True:
+        job = st.session_state.get("describe_job")
+        if not job or job["frame"] != frame or job["organ"] != target_organ:
+            submitted = backend.submit_describe(image_bytes, target_organ, scan_session_id())
+            job = {"id": submitted["id"], "frame": frame, "organ": target_organ}
+            st.session_state.describe_job = job
+
+        try:
+            # Long-poll: the API answers as soon as the job finishes
+            status = backend.job(job["id"], wait=min(25.0, max(0.0, deadline - time.monotonic())))
+        except backends.BackendError as e:
+            if e.status_code != 404:
+                raise
+            # Expired or unknown to this API: submit it again
+            st.session_state.describe_job = None
+            continue
+
+        if status["status"] == "done":
+            return status["result"]
+        if status["status"] == "failed":
+            # Forget it, so the next attempt resubmits and runs it again
+            st.session_state.describe_job = None
+            raise RuntimeError(status["error"])
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Diagnosis still {status['status']} after {DESCRIBE_JOB_TIMEOUT:.0f}s")
+
 def call_description_api(image_bytes, target_organ):
     """Call the describe API endpoint with an image"""
     try:
-        files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
-        data = {"target_organ": target_organ}
-        response = requests.post(DESCRIBE_API, files=files, data=data)
-        return response.json()
+        if DESCRIBE_JOBS:
+            return describe_job_result(image_bytes, target_organ)
+        return api_backend().describe(image_bytes, target_organ, scan_session_id())
     except Exception as e:
         st.error(f"Error calling describe API: {e}")
         return {"description": "Error occurred during diagnosis.", "error": str(e)}
@@ -457,68 +645,153 @@ def process_image_flow():
     """Process the uploaded image through the flow based on current stage"""
     if st.session_state.uploaded_image is None:
         return
-    
-    image_bytes = image_to_bytes(st.session_state.uploaded_image)
-    
-    if st.session_state.current_stage == "identify":
-        # Call identify API
-        with st.spinner("Analyzing image..."):
-            response = call_identify_api(
-                image_bytes,
-                st.session_state.target_organ
-            )
-            
-        if response.get("found", False):
-            st.session_state.messages.append({"role": "assistant", "content": f"✅ The {response.get('entity', 'target organ')} has been successfully identified in the image."})
-            st.session_state.current_stage = "describe"
+
+    # One trace per processed frame; call_*_api propagate it to the API
+    with tracing.start_span("process_image_flow", stage=st.session_state.current_stage, organ=st.session_state.target_organ) as span:
+        st.session_state.last_trace_id = span.trace_id
+        clip = is_clip(st.session_state.uploaded_image)
+        if clip:
+            # Later stages reuse the keyframe the API picked from the clip
+            image_bytes = st.session_state.get("keyframe_bytes")
+        else:
+            image_bytes = image_to_bytes(st.session_state.uploaded_image)
+    
+        # Skip the whole identify -> describe/navigate chain if the probe hasn't moved
+        signature, streamed = None, None
+        if st.session_state.current_stage == "identify" and not clip and frame_gate.FRAME_GATE:
+            signature = frame_signature(image_bytes)
+            last = st.session_state.get("last_analysis")
+            if last and last["organ"] == st.session_state.target_organ and not signature.changed_from(last["signature"]):
+                span.set_attribute("frame_gate.reused", True)
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": "🔁 This frame looks the same as the one I just analysed, so the result above still applies. Move the probe to get a new reading."
+                })
+                st.session_state.current_stage = last["stage"]
+                return
+
+        if st.session_state.current_stage == "identify" and clip:
+            # Send the clip; only its best keyframe goes to the model
+            with st.spinner("Selecting the best frame from the clip..."):
+                response = call_identify_clip_api(
+                    st.session_state.uploaded_image.getvalue(),
+                    st.session_state.uploaded_image.name,
+                    st.session_state.target_organ
+                )
+            if response.get("keyframe_image"):
+                image_bytes = base64.b64decode(response["keyframe_image"])
+                st.session_state.keyframe_bytes = image_bytes
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": f"🎞️ Selected frame {response['keyframe']['index'] + 1} of {response['frames_scored']} from the clip.",
+                    "image": image_bytes
+                })
+            else:
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": "❌ I couldn't read any frames from this clip. Please try another recording."
+                })
+                st.session_state.current_stage = "wait_for_new_image"
+                return
+
+        elif st.session_state.current_stage == "identify" and USE_WS_SESSION:
+            # One round trip on the open session; the server carries on to the
+            # diagnosis or guidance itself and streams it back
+            response, streamed = process_frame_ws(image_bytes)
+
+        elif st.session_state.current_stage == "identify":
+            # Call identify API
+            with st.spinner("Analyzing image..."):
+                response = call_identify_api(
+                    image_bytes,
+                    st.session_state.target_organ
+                )
+
+        if st.session_state.current_stage == "identify":
+            if response.get("error"):
+                st.warning(f"Identification failed: {response['error']}")
+
+            if response.get("usable") is False:
+                # Too blurred / dark / washed out to analyse: say what to adjust, no model call was made
+                adjust_text = " ".join(a["message"] for a in response["quality"]["adjustments"])
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": f"⚠️ **Adjust before the next frame**:\n\n{adjust_text}"
+                })
+                speak(adjust_text)
+                st.session_state.current_stage = "wait_for_new_image"
+
+            elif response.get("found", False) and response.get("confidence", 0.0) >= IDENTIFY_CONFIDENCE_THRESHOLD:
+                st.session_state.messages.append({"role": "assistant", "content": f"✅ The {response.get('entity', 'target organ')} has been successfully identified in the image."})
+                st.session_state.current_stage = "describe"
             
-            # Move directly to description
-            with st.spinner("Generating diagnosis..."):
-                description_response = call_description_api(image_bytes, st.session_state.target_organ)
+                # Move directly to description
+                if streamed and streamed["kind"] == "describe":
+                    description_response = {"description": streamed["transcript"]}
+                else:
+                    with st.spinner("Generating diagnosis..."):
+                        description_response = call_description_api(image_bytes, st.session_state.target_organ)
                 st.session_state.description_response = description_response
                 
-            diagnosis_text = description_response.get("description", "No diagnosis available")
-            st.session_state.messages.append({"role": "assistant", "content": f"🔬 **Diagnosis Results**:\n\n{diagnosis_text}"})
+                diagnosis_text = description_response.get("description", "No diagnosis available")
+                st.session_state.messages.append({"role": "assistant", "content": f"🔬 **Diagnosis Results**:\n\n{diagnosis_text}"})
             
-        else:
-            # 🚩 not found → go *directly* to navigation guidance
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": f"❌ I couldn't clearly identify the {st.session_state.target_organ} in this image. Here's how to reposition for a better {st.session_state.target_organ} view:"
-            })
+            else:
+                # 🚩 not found → go *directly* to navigation guidance
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": f"❌ I couldn't clearly identify the {st.session_state.target_organ} in this image. Here's how to reposition for a better {st.session_state.target_organ} view:"
+                })
 
-            # call your navigation API immediately
-            with st.spinner("Generating navigation guidance…"):
-                nav = call_navigate_api(image_bytes, st.session_state.target_organ)
+                # call your navigation API immediately
+                if streamed and (streamed["cues"] or streamed["kind"] == "navigate"):
+                    nav_text = format_cues(streamed["cues"]) if streamed["cues"] else streamed["transcript"]
+                elif st.session_state.get("guidance_mode"):
+                    # Short cues from the organ's position in the frame; the
+                    # API only falls back to a full transcript if it can't see it
+                    with st.spinner("Working out probe guidance…"):
+                        guide = call_guide_api(image_bytes, st.session_state.target_organ)
+                    nav_text = format_cues(guide["cues"]) if guide.get("cues") else guide.get("transcript", "No navigation guidance available.")
+                else:
+                    with st.spinner("Generating navigation guidance…"):
+                        nav = call_navigate_api(image_bytes, st.session_state.target_organ)
 
-            nav_text = nav.get("response", "No navigation guidance available.")
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": f"🧭 **Navigation Guidance**:\n\n{nav_text}\n\nPlease adjust your probe accordingly and re‑upload your image when ready."
-            })
-            speak(nav_text)
-            # set stage so on next upload we go back to identify
+                    nav_text = nav.get("response", "No navigation guidance available.")
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": f"🧭 **Navigation Guidance**:\n\n{nav_text}\n\nPlease adjust your probe accordingly and re‑upload your image when ready."
+                })
+                speak(nav_text)
+                # set stage so on next upload we go back to identify
+                st.session_state.current_stage = "wait_for_new_image"
+
+            # Remember this frame so an unchanged next frame can reuse the outcome
+            if signature is not None and not response.get("error"):
+                st.session_state.last_analysis = {
+                    "organ": st.session_state.target_organ,
+                    "signature": signature,
+                    "stage": st.session_state.current_stage,
+                }
+    
+        elif st.session_state.current_stage == "navigate":
+            # Call navigate API with image and entity name
+            with st.spinner("Generating navigation guidance..."):
+                response = call_navigate_api(image_bytes, st.session_state.target_organ)
+                st.session_state.navigate_response = response
+            
+            navigation_text = response.get("response", "No navigation guidance available")
+            st.session_state.messages.append({"role": "assistant", "content": f"🧭 **Navigation Guidance**:\n\n{navigation_text}\n\nPlease adjust your probe following these instructions and upload a new image when ready."})
             st.session_state.current_stage = "wait_for_new_image"
     
-    elif st.session_state.current_stage == "navigate":
-        # Call navigate API with image and entity name
-        with st.spinner("Generating navigation guidance..."):
-            response = call_navigate_api(image_bytes, st.session_state.target_organ)
-            st.session_state.navigate_response = response
-            
-        navigation_text = response.get("response", "No navigation guidance available")
-        st.session_state.messages.append({"role": "assistant", "content": f"🧭 **Navigation Guidance**:\n\n{navigation_text}\n\nPlease adjust your probe following these instructions and upload a new image when ready."})
-        st.session_state.current_stage = "wait_for_new_image"
-    
-    elif st.session_state.current_stage == "describe":
-        # Call describe API
-        with st.spinner("Generating diagnosis..."):
-            response = call_description_api(image_bytes, st.session_state.target_organ)
-            st.session_state.description_response = response
+        elif st.session_state.current_stage == "describe":
+            # Call describe API
+            with st.spinner("Generating diagnosis..."):
+                response = call_description_api(image_bytes, st.session_state.target_organ)
+                st.session_state.description_response = response
             
-        diagnosis_text = response.get("description", "No diagnosis available")
-        st.session_state.messages.append({"role": "assistant", "content": f"🔬 **Diagnosis Results**:\n\n{diagnosis_text}"})
-        st.session_state.current_stage = "chat"  # Move to open chat for follow-up questions
+            diagnosis_text = response.get("description", "No diagnosis available")
+            st.session_state.messages.append({"role": "assistant", "content": f"🔬 **Diagnosis Results**:\n\n{diagnosis_text}"})
+            st.session_state.current_stage = "chat"  # Move to open chat for follow-up questions
 
 def handle_user_input(user_input):
     """Process text input from the user"""
@@ -1291,6 +1564,13 @@ elif st.session_state.current_stage not in ["welcome", "login"]:
                 st.session_state.current_stage = "select_organ"
                 st.rerun()
         
+        # Quick directional cues instead of a full navigation transcript
+        st.session_state.guidance_mode = st.toggle(
+            "Live probe guidance",
+            value=st.session_state.get("guidance_mode", False),
+            help="Short cues such as 'slide left' or 'hold' from the organ's position in the frame"
+        )
+
         # Additional information or settings could go here
         st.markdown("---")
         st.markdown("### How to use:")
@@ -1307,9 +1587,11 @@ elif st.session_state.current_stage not in ["welcome", "login"]:
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
-            # If the message has an image, display it
+            # If the message has an image or clip, display it
             if "image" in message:
                 st.image(message["image"])
+            if "video" in message:
+                st.video(message["video"])
 
     # Welcome message on first load
     if st.session_state.current_stage == "initial" and not st.session_state.messages:
@@ -1319,8 +1601,8 @@ elif st.session_state.current_stage not in ["welcome", "login"]:
 
     # Image uploader in chat input
     uploaded_file = st.file_uploader(
-        "Upload an ultrasound image", 
-        type=["png", "jpg", "jpeg"],
+        "Upload an ultrasound image or cine clip", 
+        type=["png", "jpg", "jpeg"] + CLIP_TYPES,
         key="chat_file_uploader",
         label_visibility="collapsed"
     )
@@ -1330,17 +1612,22 @@ elif st.session_state.current_stage not in ["welcome", "login"]:
         # Store the uploaded image
         st.session_state.uploaded_image = uploaded_file
         
-        # Add user message with image
+        # Add user message with image (or clip)
+        media_key = "video" if is_clip(uploaded_file) else "image"
+        upload_kind = "cine clip" if is_clip(uploaded_file) else "image"
         st.session_state.messages.append({
             "role": "user", 
-            "content": f"I've uploaded an ultrasound image for {st.session_state.target_organ} analysis.",
-            "image": uploaded_file  # Store image in message for reference
+            "content": f"I've uploaded an ultrasound {upload_kind} for {st.session_state.target_organ} analysis.",
+            media_key: uploaded_file  # Store image in message for reference
         })
         
         # Display the image
         with st.chat_message("user"):
-            st.markdown(f"I've uploaded an ultrasound image for {st.session_state.target_organ} analysis.")
-            st.image(uploaded_file, caption="Uploaded Ultrasound Image")
+            st.markdown(f"I've uploaded an ultrasound {upload_kind} for {st.session_state.target_organ} analysis.")
+            if is_clip(uploaded_file):
+                st.video(uploaded_file)
+            else:
+                st.image(uploaded_file, caption="Uploaded Ultrasound Image")
         
         # Set stage to identify if we have an organ target
         if st.session_state.target_organ: